@@ -2,9 +2,10 @@
 from __future__ import annotations
 import json
 from pathlib import Path
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.deps import get_current_user
-from app.services.peer_assignments_csv import get_targets_for_rater
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from app.deps import get_current_user, make_etag, not_modified_or_none, set_etag, student_cohort
+from app.services.peer_assignments_csv import get_assignments_version, get_targets_for_rater
+from app.services.users_csv import get_roster_version
 
 router = APIRouter(prefix="/api/assignments", tags=["assignments"])
 
@@ -15,14 +16,23 @@ router = APIRouter(prefix="/api/assignments", tags=["assignments"])
 #     data = json.loads(ROSTER_PATH.read_text(encoding="utf-8"))
 #     return list(data.get("students", []))
 
-from app.services.peer_assignments_csv import get_targets_for_rater
-
 @router.get("/peers")
-def peers(user=Depends(get_current_user)):
+def peers(
+    response: Response,
+    if_none_match: str | None = Header(default=None),
+    user=Depends(get_current_user),
+):
     if user["role"] != "student":
         raise HTTPException(status_code=403, detail={"ok": False, "error": "FORBIDDEN"})
 
-    targets = get_targets_for_rater(user["user_id"])
+    # 分派只來自 peer_assignments.csv（cohort 來自 users.csv）：兩個檔案都沒變就 304
+    etag = make_etag("assigned_peers", user["user_id"], get_roster_version(), get_assignments_version())
+    not_modified = not_modified_or_none(if_none_match, etag)
+    if not_modified is not None:
+        return not_modified
+    set_etag(response, etag)
+
+    targets = get_targets_for_rater(user["user_id"], student_cohort(user["user_id"]))
     return targets
 
 
@@ -1,9 +1,9 @@
-import csv
-from pathlib import Path
+from fastapi import APIRouter, Depends, HTTPException, status
 
-from fastapi import APIRouter, HTTPException, status
-
-from app.schemas.auth import LoginRequest, LoginResponse, Role
+from app.deps import get_current_user
+from app.schemas.auth import LoginRequest, LoginResponse, RevokeRequest, Role
+from app.services import tokens
+from app.services.users_csv import get_user
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
@@ -16,46 +16,7 @@ router = APIRouter(prefix="/api/auth", tags=["auth"])
 #    ("master",  "admin"): {"password": "1234", "display_name": "Pokemon Master"},
 #}
 
-# users.csv 路徑：backend/app/data/users.csv
-USERS_CSV_PATH = Path(__file__).resolve().parents[2] / "data" / "users.csv"
-
-def load_users_from_csv() -> dict[tuple[str, str], dict]:
-    """
-    回傳格式：
-    {
-      ("teacher","T01"): {"password":"1234","display_name":"Teacher-01"},
-      ...
-    }
-    """
-    if not USERS_CSV_PATH.exists():
-        raise FileNotFoundError(f"users.csv not found: {USERS_CSV_PATH}")
-
-    users: dict[tuple[str, str], dict] = {}
-    with USERS_CSV_PATH.open("r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
-        required = {"role", "user_id", "password", "display_name"}
-        if not reader.fieldnames or not required.issubset(set(reader.fieldnames)):
-            raise ValueError(f"users.csv missing columns: need {required}, got {reader.fieldnames}")
-
-        for row in reader:
-            role = (row.get("role") or "").strip()
-            user_id = (row.get("user_id") or "").strip()
-            password = (row.get("password") or "").strip()
-            display_name = (row.get("display_name") or "").strip()
-
-            if not role or not user_id:
-                continue
-
-            users[(role, user_id)] = {
-                "password": password,
-                "display_name": display_name or user_id,
-            }
-
-    return users
-
-# 取代原本 _DEMO_USERS：啟動時載入一次（開發期最簡單）
-_USERS = load_users_from_csv()
-
+# 使用者資料改由 app.services.users_csv 共用快取（檔案變動才重新解析）
 
 
 _ROLE_TO_NEXT = {
@@ -71,9 +32,8 @@ _ROLE_TO_NEXT = {
     summary="登入（回傳角色、導頁路徑、token）",
 )
 def login(payload: LoginRequest) -> LoginResponse:
-    key = (payload.role.value, payload.user_id)
     #user = _DEMO_USERS.get(key)
-    user = _USERS.get(key)
+    user = get_user(payload.role.value, payload.user_id)
 
     if not user or user["password"] != payload.password:
         raise HTTPException(
@@ -81,8 +41,8 @@ def login(payload: LoginRequest) -> LoginResponse:
             detail={"ok": False, "error": "INVALID_CREDENTIALS"},
         )
 
-    # 先用簡單 token：之後可改 JWT + 過期時間
-    token = f"demo.{payload.role.value}.{payload.user_id}"
+    # HMAC 簽章 token（含角色、顯示名稱、到期時間），之後每個請求只驗簽章
+    token, claims = tokens.issue(payload.role.value, payload.user_id, user.get("display_name"))
 
     return LoginResponse(
         role=payload.role,
@@ -90,46 +50,39 @@ def login(payload: LoginRequest) -> LoginResponse:
         display_name=user.get("display_name"),
         next_path=_ROLE_TO_NEXT[payload.role],
         access_token=token,
+        expires_at=claims["exp"],
     )
 
 #=============================Step4-2=============================
 
-from fastapi import Header
-
 @router.get("/me", summary="檢查目前登入者（驗證 token）")
-def me(authorization: str | None = Header(default=None)):
+def me(user=Depends(get_current_user)):
     """
     前端會帶 Authorization: bearer <token>
     這支 API 用來驗證 token 是否有效，並回傳使用者基本資訊。
+    使用者資訊都在 token 的簽章內容裡，不用再查 users.csv
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail={"ok": False, "error": "MISSING_TOKEN"})
-
-    try:
-        token_type, token = authorization.split(" ", 1)
-    except ValueError:
-        raise HTTPException(status_code=401, detail={"ok": False, "error": "BAD_AUTH_HEADER"})
-
-    # Step 2 產生的 demo token：demo.<role>.<user_id>
-    if not token.startswith("demo."):
-        raise HTTPException(status_code=401, detail={"ok": False, "error": "INVALID_TOKEN"})
-
-    parts = token.split(".")
-    if len(parts) != 3:
-        raise HTTPException(status_code=401, detail={"ok": False, "error": "INVALID_TOKEN"})
-
-    _, role, user_id = parts
-
-    # 驗證是否在 demo 使用者清單中（避免亂造 token），修改 login 驗證：改用 _USERS 
-    #user = _DEMO_USERS.get((role, user_id))
-    user = _USERS.get((role, user_id))
-    if not user:
-        raise HTTPException(status_code=401, detail={"ok": False, "error": "INVALID_TOKEN"})
-
     return {
         "ok": True,
-        "role": role,
-        "user_id": user_id,
-        "display_name": user.get("display_name")
+        "role": user["role"],
+        "user_id": user["user_id"],
+        "display_name": user["display_name"],
+        "expires_at": user["claims"]["exp"],
     }
 
+
+@router.post("/logout", summary="登出（撤銷目前的 token）")
+def logout(user=Depends(get_current_user)):
+    tokens.revoke(user["claims"])
+    return {"ok": True}
+
+
+@router.post("/revoke", summary="Master：撤銷某位使用者目前所有的 token")
+def revoke(payload: RevokeRequest, user=Depends(get_current_user)):
+    if user["role"] != "master":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"ok": False, "error": "FORBIDDEN"},
+        )
+    tokens.revoke_user(payload.role.value, payload.user_id)
+    return {"ok": True}
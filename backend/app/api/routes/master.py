@@ -1,231 +1,278 @@
 # backend/app/api/routes/master.py
 from __future__ import annotations
 
-from app.services.users_csv import get_students
+from app.services.users_csv import DEFAULT_COHORT, get_cohorts, get_roster_version, get_students
 
 import csv
-import math
-import re
-from pathlib import Path
+import io
+import json
+from contextlib import contextmanager
+
+import numpy as np
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+
+from app.deps import (
+    cohort_or_404,
+    get_current_user,
+    json_bytes,
+    json_response,
+    make_etag,
+    not_modified_or_none,
+    set_etag,
+)
+from app.db import db_read_session, get_conn
+from app.services import data_version
+from app.services.aggregates import empty_item, iter_aggregates, load_aggregates
+from app.schemas.master import MatchBatchRequest, WeightSimRequest
+from app.services.matching import (
+    DEFAULT_CATALOG,
+    get_match_engine,
+    list_catalogs,
+    loaded_engines,
+    parse_metric,
+)
+from app.services.scoring import METRICS, W_PEER, W_SELF, W_TEACHER
+from app.services.single_flight import aggregations
+from app.services import cohort_stats, rater_stats, weight_sim
 
-from fastapi import APIRouter, Depends, HTTPException, status
-
-from app.deps import get_current_user
-from app.db import db_session
-
-POKE_PATH = Path(__file__).resolve().parents[2] / "data" / "poke.csv"
 DEFAULT_TOP_K = 3
-DEFAULT_METHOD = "euclidean"  # or "manhattan"
-
-# 檔案常數區加一個門檻
-MIN_PEER_RECEIVED_FOR_CALC = 1
+DEFAULT_METHOD = "euclidean"  # or manhattan / chebyshev / cosine / minkowski
 
 router = APIRouter(prefix="/api/master", tags=["master"])
 
-W_TEACHER = 0.40
-W_SELF = 0.20
-W_PEER = 0.40
 
-METRICS = ["hp", "atk", "def", "spa", "spd", "spe"]
+def peer_source_or_400(peer_source: str | None) -> str:
+    """raw = 同儕原始平均；normalized = 依評分者寬嚴校正後的平均（app.services.rater_stats）"""
+    value = (peer_source or "raw").lower().strip()
+    if value not in rater_stats.PEER_SOURCES:
+        raise HTTPException(status_code=400, detail={"ok": False, "error": "BAD_PEER_SOURCE"})
+    return value
 
 
-def row_to_scores(row) -> dict:
-    return {m: float(row[m]) for m in METRICS}
-
-
-def weighted_scores(teacher: dict, self_: dict, peer: dict) -> dict:
-    return {
-        m: round(W_TEACHER * teacher[m] + W_SELF * self_[m] + W_PEER * peer[m], 2)
-        for m in METRICS
-    }
+def _peer_map(cohort_id: str, peer_source: str) -> dict[str, dict] | None:
+    return rater_stats.normalized_peer_map(cohort_id) if peer_source == "normalized" else None
 
 
 @router.get("/summary", summary="Master 加權總分（老師40/自評20/同儕40）")
-def summary(user=Depends(get_current_user)):
+def summary(
+    cohort_id: str | None = None,
+    peer_source: str = "raw",
+    if_none_match: str | None = Header(default=None),
+    user=Depends(get_current_user),
+):
     if user["role"] != "master":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail={"ok": False, "error": "FORBIDDEN"},
         )
 
-    students = get_students()
-
-    with db_session() as conn:
-        # 1) 自評：取每位學生最新一筆（max id）
-        self_rows = conn.execute("""
-            SELECT s.user_id, s.hp, s.atk, s.def, s.spa, s.spd, s.spe
-            FROM scores_self s
-            JOIN (
-                SELECT user_id, MAX(id) AS max_id
-                FROM scores_self
-                GROUP BY user_id
-            ) last ON last.user_id = s.user_id AND last.max_id = s.id
-        """).fetchall()
-        self_map = {r["user_id"]: row_to_scores(r) for r in self_rows}
-
-        # 2) 老師評分：同一學生可能多位老師 → 取平均
-        teacher_rows = conn.execute("""
-            SELECT target_user_id AS user_id,
-                   AVG(hp) AS hp, AVG(atk) AS atk, AVG(def) AS def,
-                   AVG(spa) AS spa, AVG(spd) AS spd, AVG(spe) AS spe
-            FROM scores_teacher
-            GROUP BY target_user_id
-        """).fetchall()
-        teacher_map = {r["user_id"]: row_to_scores(r) for r in teacher_rows}
-
-        # 3) 同儕收到：取平均
-        peer_rows = conn.execute("""
-            SELECT target_user_id AS user_id,
-                   AVG(hp) AS hp, AVG(atk) AS atk, AVG(def) AS def,
-                   AVG(spa) AS spa, AVG(spd) AS spd, AVG(spe) AS spe
-            FROM scores_peer
-            GROUP BY target_user_id
-        """).fetchall()
-        peer_map = {r["user_id"]: row_to_scores(r) for r in peer_rows}
-
-        # 在 summary() 裡新增「同儕收到份數」查詢
-        peer_cnt_rows = conn.execute("""
-            SELECT target_user_id AS user_id, COUNT(*) AS cnt
-            FROM scores_peer
-            GROUP BY target_user_id
-        """).fetchall()
-        peer_cnt_map = {r["user_id"]: int(r["cnt"]) for r in peer_cnt_rows}
-
-    detail = []
-    for sid in students:
-        has_teacher = sid in teacher_map
-        has_self = sid in self_map
-        peer_received_count = peer_cnt_map.get(sid, 0)
-
-        has_peer = peer_received_count >= MIN_PEER_RECEIVED_FOR_CALC
-        complete = has_teacher and has_self and has_peer
-
-        item = {
-            "user_id": sid,
-            "has_teacher": has_teacher,
-            "has_self": has_self,
-            "has_peer": has_peer,
-            "peer_received_count": peer_received_count,
-            "complete": complete,
-            "teacher_avg": teacher_map.get(sid),
-            "self_latest": self_map.get(sid),
-            "peer_avg": peer_map.get(sid),
-            "weighted": None,
-            "weighted_mean": None,
-        }
+    cohort_id = cohort_or_404(cohort_id)
+    peer_source = peer_source_or_400(peer_source)
+    roster_version = get_roster_version()
+
+    # 資料版本（主鍵查詢一次）與名單都沒變：直接 304，不做計算
+    etag = make_etag("master_summary", cohort_id, data_version.current(), roster_version, peer_source)
+    not_modified = not_modified_or_none(if_none_match, etag)
+    if not_modified is not None:
+        return not_modified
 
-        if complete:
-            w = weighted_scores(teacher_map[sid], self_map[sid], peer_map[sid])
-            item["weighted"] = w
-            item["weighted_mean"] = round(sum(w[m] for m in METRICS) / len(METRICS), 2)
+    # 同時開 dashboard 的請求共用同一次計算與序列化（寫入分數後失效）
+    body = aggregations.do(
+        ("master_summary", cohort_id, roster_version, peer_source),
+        lambda: json_bytes(compute_summary(cohort_id, peer_source)),
+    )
+    return json_response(body, etag)
 
-        detail.append(item)
+
+def compute_summary(cohort_id: str = DEFAULT_COHORT, peer_source: str = "raw") -> dict:
+    students = get_students(cohort_id)
+
+    # 直接讀 student_aggregates（寫入時已維護好平均、份數與加權結果）
+    # 校正後的同儕平均在同一個讀取快照內算（O(學生數)），兩者一定對得上
+    with db_read_session() as conn:
+        agg = load_aggregates(conn, cohort_id)
+        peer_map = rater_stats.compute_normalized(conn, cohort_id) if peer_source == "normalized" else None
+
+    detail = [agg.get(sid) or empty_item(sid) for sid in students]
+    if peer_map is not None:
+        # 同儕平均換成校正後的值，加權結果跟著重算
+        detail = [rater_stats.with_peer_avg(x, peer_map.get(x["user_id"])) for x in detail]
 
     done = sum(1 for x in detail if x["complete"])
     return {
         "ok": True,
+        "cohort_id": cohort_id,
         "weights": {"teacher": W_TEACHER, "self": W_SELF, "peer": W_PEER},
+        "peer_source": peer_source,
         "class_size": len(students),
         "complete_count": done,
         "detail": detail,
     }
 
 
-def load_pokemon() -> list[dict]:
-    if not POKE_PATH.exists():
+EXPORT_FORMATS = ("csv", "ndjson")
+# 串流輸出時每累積幾列送出一次
+EXPORT_CHUNK_ROWS = 500
+
+EXPORT_CSV_COLUMNS = [
+    "user_id", "has_teacher", "has_self", "has_peer", "peer_received_count", "complete",
+    *[f"{src}_{m}" for src in ("teacher_avg", "self_latest", "peer_avg", "weighted") for m in METRICS],
+    "weighted_mean",
+]
+
+
+def iter_summary_items(students: list[str], cohort_id: str = DEFAULT_COHORT):
+    """
+    依學生 ID 順序逐位產生 summary item：
+    名單（已排序）與 student_aggregates（ORDER BY user_id）做合併，cursor 一列一列讀
+    用獨立連線，因為 StreamingResponse 的每一段可能在不同 thread 執行
+    """
+    conn = get_conn(readonly=True)
+    try:
+        conn.execute("BEGIN")
+        rows = iter_aggregates(conn, cohort_id)
+        current = next(rows, None)
+        for sid in students:
+            while current is not None and current[0] < sid:
+                current = next(rows, None)
+            if current is not None and current[0] == sid:
+                yield current[1]
+            else:
+                yield empty_item(sid)
+    finally:
+        conn.close()
+
+
+def _csv_row(item: dict) -> list:
+    row = [item["user_id"], item["has_teacher"], item["has_self"], item["has_peer"],
+           item["peer_received_count"], item["complete"]]
+    for src in ("teacher_avg", "self_latest", "peer_avg", "weighted"):
+        vec = item[src]
+        row.extend(vec[m] if vec else "" for m in METRICS)
+    row.append("" if item["weighted_mean"] is None else item["weighted_mean"])
+    return row
+
+
+def stream_summary(students: list[str], fmt: str, cohort_id: str = DEFAULT_COHORT,
+                   peer_map: dict[str, dict] | None = None):
+    """peer_map（校正後的同儕平均）有給時，CSV 多一欄 peer_normalized"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if fmt == "csv":
+        writer.writerow(EXPORT_CSV_COLUMNS if peer_map is None else [*EXPORT_CSV_COLUMNS, "peer_normalized"])
+
+    n = 0
+    for item in iter_summary_items(students, cohort_id):
+        if peer_map is not None:
+            item = rater_stats.with_peer_avg(item, peer_map.get(item["user_id"]))
+        if fmt == "csv":
+            row = _csv_row(item)
+            if peer_map is not None:
+                row.append(item["peer_normalized"])
+            writer.writerow(row)
+        else:
+            buf.write(json.dumps(item, ensure_ascii=False))
+            buf.write("\n")
+        n += 1
+        if n % EXPORT_CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    if buf.tell():
+        yield buf.getvalue()
+
+
+@router.get("/summary/export", summary="Master 加權總分匯出（CSV / NDJSON 串流）")
+def summary_export(format: str = "csv", cohort_id: str | None = None, peer_source: str = "raw",
+                   user=Depends(get_current_user)):
+    if user["role"] != "master":
         raise HTTPException(
-            status_code=500,
-            detail={"ok": False, "error": "POKE_CSV_NOT_FOUND", "path": str(POKE_PATH)},
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"ok": False, "error": "FORBIDDEN"},
         )
 
-    pokes: list[dict] = []
-    with POKE_PATH.open("r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
-        required = {"poke_num", "poke_name", *METRICS}
-        if not reader.fieldnames or not required.issubset(set(reader.fieldnames)):
-            raise HTTPException(
-                status_code=500,
-                detail={"ok": False, "error": "POKE_CSV_BAD_COLUMNS", "columns": reader.fieldnames},
-            )
-
-        for row in reader:
-            try:
-                poke_num = int(row["poke_num"])
-                poke_name = str(row["poke_name"])
-                stats = {m: float(row[m]) for m in METRICS}
-            except Exception:
-                continue
+    fmt = (format or "csv").lower().strip()
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail={"ok": False, "error": "BAD_FORMAT"})
+    cohort_id = cohort_or_404(cohort_id)
+    peer_source = peer_source_or_400(peer_source)
 
-            pokes.append({
-                "poke_num": poke_num,
-                "poke_name": poke_name,
-                "stats": stats,
-            })
-
-    return pokes
-
-
-def dist(a: dict, b: dict, method: str) -> float:
-    if method == "manhattan":
-        return sum(abs(a[m] - b[m]) for m in METRICS)
-    # default euclidean
-    return math.sqrt(sum((a[m] - b[m]) ** 2 for m in METRICS))
-
-
-def get_weighted_map() -> dict[str, dict]:
-    """回傳：{student_id: weighted_scores_dict}，只包含 complete 的學生"""
-    students = get_students()
-
-    with db_session() as conn:
-        self_rows = conn.execute("""
-            SELECT s.user_id, s.hp, s.atk, s.def, s.spa, s.spd, s.spe
-            FROM scores_self s
-            JOIN (
-                SELECT user_id, MAX(id) AS max_id
-                FROM scores_self
-                GROUP BY user_id
-            ) last ON last.user_id = s.user_id AND last.max_id = s.id
-        """).fetchall()
-        self_map = {r["user_id"]: row_to_scores(r) for r in self_rows}
-
-        teacher_rows = conn.execute("""
-            SELECT target_user_id AS user_id,
-                   AVG(hp) AS hp, AVG(atk) AS atk, AVG(def) AS def,
-                   AVG(spa) AS spa, AVG(spd) AS spd, AVG(spe) AS spe
-            FROM scores_teacher
-            GROUP BY target_user_id
-        """).fetchall()
-        teacher_map = {r["user_id"]: row_to_scores(r) for r in teacher_rows}
-
-        peer_rows = conn.execute("""
-            SELECT target_user_id AS user_id,
-                   AVG(hp) AS hp, AVG(atk) AS atk, AVG(def) AS def,
-                   AVG(spa) AS spa, AVG(spd) AS spd, AVG(spe) AS spe
-            FROM scores_peer
-            GROUP BY target_user_id
-        """).fetchall()
-        peer_map = {r["user_id"]: row_to_scores(r) for r in peer_rows}
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_summary(get_students(cohort_id), fmt, cohort_id, _peer_map(cohort_id, peer_source)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="summary.{fmt}"'},
+    )
+
+
+def get_weighted_map(cohort_id: str = DEFAULT_COHORT,
+                     peer_source: str = "raw") -> tuple[dict[str, dict], frozenset[str]]:
+    """
+    回傳：({student_id: weighted_scores_dict}, 沒有校正值的學生)，只包含該 cohort 中 complete 的學生
+    peer_source=normalized 時加權用校正後的同儕平均；拿不到校正值的學生不放進 map（不混用原始平均），
+    另外列在第二個值裡（raw 時為空）
+    同時間的比對請求共用同一次計算（結果唯讀，勿修改）
+    """
+    return aggregations.do(
+        ("weighted_map", cohort_id, get_roster_version(), peer_source),
+        lambda: _compute_weighted_map(cohort_id, peer_source),
+    )
+
+
+def _compute_weighted_map(cohort_id: str,
+                          peer_source: str = "raw") -> tuple[dict[str, dict], frozenset[str]]:
+    students = get_students(cohort_id)
+
+    with db_read_session() as conn:
+        agg = load_aggregates(conn, cohort_id)
+        peer_map = rater_stats.compute_normalized(conn, cohort_id) if peer_source == "normalized" else None
 
     weighted_map: dict[str, dict] = {}
+    not_normalized: set[str] = set()
     for sid in students:
-        if sid in teacher_map and sid in self_map and sid in peer_map:
-            weighted_map[sid] = weighted_scores(teacher_map[sid], self_map[sid], peer_map[sid])
-    return weighted_map
+        item = agg.get(sid)
+        if not item or item["weighted"] is None:
+            continue
+        if peer_map is not None:
+            item = rater_stats.with_peer_avg(item, peer_map.get(sid))
+            if not item["peer_normalized"]:
+                not_normalized.add(sid)
+                continue
+        weighted_map[sid] = item["weighted"]
+    return weighted_map, frozenset(not_normalized)
 
 
-def to_pokemon_com_slug(name: str) -> str:
-    """
-    把 poke_name 轉成 pokemon.com 的 pokedex slug（多數英文名可用）
-    例: "Pikachu" -> "pikachu"
-        "Mr. Mime" -> "mr-mime"（點號會被移除、空白變連字號）
-        "Farfetch'd" -> "farfetchd"（撇號移除）
-    """
-    s = (name or "").strip().lower()
-    s = s.replace("♀", "-f").replace("♂", "-m")  # 少見但安全處理
-    s = re.sub(r"\s+", "-", s)                   # 空白 -> -
-    s = re.sub(r"[^a-z0-9-]", "", s)             # 移除其他符號（' . 等）
-    s = re.sub(r"-{2,}", "-", s).strip("-")      # 多個 - 合併、去頭尾
-    return s
+def metric_or_400(method: str, p, weights):
+    try:
+        return parse_metric(method, p, weights)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"ok": False, "error": str(e)})
+
+
+def engine_or_400(catalog: str):
+    try:
+        return get_match_engine((catalog or DEFAULT_CATALOG).strip())
+    except KeyError:
+        raise HTTPException(status_code=400, detail={"ok": False, "error": "UNKNOWN_CATALOG"})
+
+
+@contextmanager
+def catalog_errors(engine):
+    """參考資料 CSV 讀取錯誤 → 500（錯誤碼沿用 POKE_CSV_*）"""
+    try:
+        yield
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=500,
+            detail={"ok": False, "error": "POKE_CSV_NOT_FOUND", "path": str(engine.path)},
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=500,
+            detail={"ok": False, "error": "POKE_CSV_BAD_COLUMNS"},
+        )
 
 
 @router.get("/match", summary="Master：趣味分析（用加權六指標）")
@@ -233,8 +280,18 @@ def match(
     student_id: str,
     top_k: int = DEFAULT_TOP_K,
     method: str = DEFAULT_METHOD,
+    catalog: str = DEFAULT_CATALOG,
+    p: float | None = None,
+    weights: str | None = None,
+    cohort_id: str | None = None,
+    peer_source: str = "raw",
     user=Depends(get_current_user),
 ):
+    """
+    method=minkowski 時可帶 p（>= 1）與 weights（六指標權重，逗號分隔，例如 1,1,2,1,1,1）
+    catalog 指定參考資料（預設 poke；其他放在 app/data/catalogs/<name>.csv）
+    peer_source=normalized：加權六指標改用評分者寬嚴校正後的同儕平均
+    """
     if user["role"] != "master":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -242,53 +299,248 @@ def match(
         )
 
     method = (method or "euclidean").lower().strip()
-    if method not in ("euclidean", "manhattan"):
-        raise HTTPException(status_code=400, detail={"ok": False, "error": "BAD_METHOD"})
+    metric = metric_or_400(method, p, weights.split(",") if weights else None)
+    engine = engine_or_400(catalog)
+    cohort_id = cohort_or_404(cohort_id)
+    peer_source = peer_source_or_400(peer_source)
 
     top_k = max(1, min(int(top_k), 20))  # 防呆：最多 20
 
-    weighted_map = get_weighted_map()
+    weighted_map, not_normalized = get_weighted_map(cohort_id, peer_source)
     sid = student_id.strip()
 
     if sid not in weighted_map:
-        # 代表資料不齊（老師/自評/同儕缺一）
+        # 代表資料不齊（老師/自評/同儕缺一），或 normalized 時拿不到校正後的同儕平均
         return {
             "ok": True,
             "student_id": sid,
             "complete": False,
-            "reason": "NEED_TEACHER_SELF_PEER",
+            "reason": "PEER_NOT_NORMALIZED" if sid in not_normalized else "NEED_TEACHER_SELF_PEER",
             "method": method,
+            "peer_source": peer_source,
             "top_k": top_k,
             "weighted": None,
             "results": [],
         }
 
     base = weighted_map[sid]
-    pokes = load_pokemon()
-
-    scored = []
-    for p in pokes:
-        d = dist(base, p["stats"], method)
-        slug = to_pokemon_com_slug(p["poke_name"])
 
-        scored.append({
-            "poke_num": p["poke_num"],
-            "poke_name": p["poke_name"],
-            "distance": round(float(d), 4),
-            "stats": p["stats"],
-            # 台灣官方圖鑑：poke_num 補 4 碼
-            "official_url": f"https://tw.portal-pokemon.com/play/pokedex/{p['poke_num']:04d}",
-        })
-
-    # 距離小的優先；平手取 poke_num 小的（符合規格書）
-    scored.sort(key=lambda x: (x["distance"], x["poke_num"]))
+    with catalog_errors(engine):
+        results = engine.top_k(base, top_k, metric)
 
     return {
         "ok": True,
         "student_id": sid,
         "complete": True,
         "method": method,
+        "peer_source": peer_source,
         "top_k": top_k,
         "weighted": base,
-        "results": scored[:top_k],
+        "results": results,
+    }
+
+
+@router.post("/match/batch", summary="Master：全班一次比對（用加權六指標）")
+def match_batch(payload: MatchBatchRequest, user=Depends(get_current_user)):
+    if user["role"] != "master":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"ok": False, "error": "FORBIDDEN"}
+        )
+
+    method = (payload.method or "euclidean").lower().strip()
+    metric = metric_or_400(method, payload.p, payload.weights)
+    engine = engine_or_400(payload.catalog)
+    cohort_id = cohort_or_404(payload.cohort_id)
+    peer_source = peer_source_or_400(payload.peer_source)
+
+    top_k = max(1, min(int(payload.top_k), 20))  # 防呆：最多 20
+
+    # 加權結果只算一次
+    weighted_map, not_normalized = get_weighted_map(cohort_id, peer_source)
+    if payload.student_ids is None:
+        wanted = [*weighted_map, *sorted(not_normalized)]
+    else:
+        wanted = list(dict.fromkeys(sid.strip() for sid in payload.student_ids))
+
+    bases = {sid: weighted_map[sid] for sid in wanted if sid in weighted_map}
+    incomplete = [sid for sid in wanted if sid not in weighted_map and sid not in not_normalized]
+
+    with catalog_errors(engine):
+        matched = engine.top_k_batch(bases, top_k, metric)
+
+    return {
+        "ok": True,
+        "cohort_id": cohort_id,
+        "method": method,
+        "peer_source": peer_source,
+        "top_k": top_k,
+        "count": len(matched),
+        "results": [
+            {"student_id": sid, "weighted": bases[sid], "results": matched[sid]}
+            for sid in bases
+        ],
+        # 有指定但資料不齊（老師/自評/同儕缺一）或不在名單的學生
+        "incomplete": incomplete,
+        # peer_source=normalized 時資料齊全、但拿不到校正後同儕平均的學生（不混用原始平均，未比對）
+        "not_normalized": [sid for sid in wanted if sid in not_normalized],
     }
+
+
+def get_weight_sources(cohort_id: str = DEFAULT_COHORT) -> weight_sim.SourceMatrix:
+    """資料齊全學生的 (老師, 自評, 同儕) × 六指標矩陣；寫入分數後重建（結果唯讀，勿修改）"""
+    return aggregations.do(
+        ("weight_sources", cohort_id, get_roster_version()),
+        lambda: _compute_weight_sources(cohort_id),
+    )
+
+
+def _compute_weight_sources(cohort_id: str) -> weight_sim.SourceMatrix:
+    with db_read_session() as conn:
+        agg = load_aggregates(conn, cohort_id)
+    return weight_sim.build_sources(get_students(cohort_id), agg)
+
+
+@router.post("/weights/simulate", summary="Master：權重方案模擬（多組權重一次算總分、排名與名次變動）")
+def simulate_weights(payload: WeightSimRequest, user=Depends(get_current_user)):
+    """
+    每個方案給老師/自評/同儕權重（數字或六指標各自的權重）與選用的六指標比重，
+    回傳全班（資料齊全的學生）在該方案下的總分統計、前幾名、與目前權重相比的名次變動
+    """
+    if user["role"] != "master":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"ok": False, "error": "FORBIDDEN"}
+        )
+
+    if not payload.schemes:
+        raise HTTPException(status_code=400, detail={"ok": False, "error": "NO_SCHEMES"})
+    if len(payload.schemes) > weight_sim.MAX_SCHEMES:
+        raise HTTPException(
+            status_code=413,
+            detail={"ok": False, "error": "TOO_MANY_SCHEMES", "max_schemes": weight_sim.MAX_SCHEMES},
+        )
+    cohort_id = cohort_or_404(payload.cohort_id)
+
+    coeffs = []
+    for i, scheme in enumerate(payload.schemes):
+        try:
+            coeffs.append(weight_sim.scheme_coefficients(
+                scheme.teacher, scheme.self_, scheme.peer, scheme.metric_weights, payload.normalize,
+            ))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail={"ok": False, "error": str(e), "index": i})
+
+    result = weight_sim.simulate(
+        get_weight_sources(cohort_id),
+        np.stack(coeffs),
+        top=max(0, min(int(payload.top), 100)),
+        movers=max(0, min(int(payload.movers), 100)),
+        student_ids=[sid.strip() for sid in payload.student_ids] if payload.student_ids else None,
+    )
+    result["schemes"] = [
+        {"name": scheme.name, **item} for scheme, item in zip(payload.schemes, result["schemes"])
+    ]
+    return {"ok": True, "cohort_id": cohort_id, "normalize": payload.normalize, **result}
+
+
+@router.get("/stats", summary="Master：cohort 統計（各來源六指標的平均、變異數、百分位數、直方圖）")
+def cohort_statistics(
+    response: Response,
+    cohort_id: str | None = None,
+    if_none_match: str | None = Header(default=None),
+    user=Depends(get_current_user),
+):
+    if user["role"] != "master":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"ok": False, "error": "FORBIDDEN"}
+        )
+
+    cohort_id = cohort_or_404(cohort_id)
+
+    etag = make_etag("master_stats", cohort_id, data_version.current())
+    not_modified = not_modified_or_none(if_none_match, etag)
+    if not_modified is not None:
+        return not_modified
+
+    version, stats = cohort_stats.get_stats(cohort_id)
+    set_etag(response, make_etag("master_stats", cohort_id, version))
+    return {"ok": True, "data_version": version, **stats}
+
+
+@router.get("/raters", summary="Master：同儕評分者的寬嚴（每位評分者的平均、標準差與偏差）")
+def rater_leniency(cohort_id: str | None = None, user=Depends(get_current_user)):
+    """bias = 該評分者六指標平均 - 全體同儕分數平均 的平均；正數 = 手鬆、負數 = 手緊"""
+    if user["role"] != "master":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"ok": False, "error": "FORBIDDEN"}
+        )
+
+    cohort_id = cohort_or_404(cohort_id)
+    with db_read_session() as conn:
+        table = rater_stats.load_table(conn, cohort_id)
+
+    raters = [
+        {
+            "rater_user_id": rid,
+            "count": int(table.cnt[i]),
+            "mean": {m: round(float(v), 4) for m, v in zip(METRICS, table.mean[i])},
+            "std": {m: round(float(v), 4) for m, v in zip(METRICS, table.std[i])},
+            "bias": round(float((table.mean[i] - table.cohort_mean).mean()), 4),
+        }
+        for i, rid in enumerate(table.ids)
+    ]
+    raters.sort(key=lambda r: (-r["bias"], r["rater_user_id"]))
+    return {
+        "ok": True,
+        "cohort_id": cohort_id,
+        "count": table.total,
+        "cohort_mean": {m: round(float(v), 4) for m, v in zip(METRICS, table.cohort_mean)},
+        "cohort_std": {m: round(float(v), 4) for m, v in zip(METRICS, table.cohort_std)},
+        "raters": raters,
+    }
+
+
+@router.get("/cohorts", summary="Master：所有 cohort（班級/梯次）與人數")
+def list_cohorts(user=Depends(get_current_user)):
+    if user["role"] != "master":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"ok": False, "error": "FORBIDDEN"}
+        )
+
+    return {
+        "ok": True,
+        "cohorts": [{"cohort_id": c, "class_size": len(get_students(c))} for c in get_cohorts()],
+    }
+
+
+@router.get("/cache", summary="Master：dashboard 彙總的合併/快取統計")
+def aggregation_cache_stats(user=Depends(get_current_user)):
+    if user["role"] != "master":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"ok": False, "error": "FORBIDDEN"}
+        )
+
+    return {"ok": True, **aggregations.stats()}
+
+
+@router.get("/match/index", summary="Master：參考資料與最近鄰索引狀態（建置時間、查詢延遲）")
+def match_index_stats(user=Depends(get_current_user)):
+    if user["role"] != "master":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"ok": False, "error": "FORBIDDEN"}
+        )
+
+    loaded = {}
+    for name, engine in loaded_engines().items():
+        try:
+            loaded[name] = engine.stats()
+        except (FileNotFoundError, ValueError):
+            loaded[name] = None
+
+    return {"ok": True, "catalogs": list_catalogs(), "loaded": loaded}
@@ -2,26 +2,35 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 
-from app.deps import get_current_user
-from app.db import db_session
+from app.deps import get_current_user, student_cohort, teacher_can_access
 from app.schemas.scores import SubmitSelfRequest, SubmitPeerRequest, OkResponse
 
 from app.schemas.scores import SubmitTeacherRequest  # Step 8-3
+from app.schemas.scores import (
+    BatchItemResult,
+    BatchResponse,
+    SubmitPeerBatchRequest,
+    SubmitTeacherBatchRequest,
+)
 
 import json
 import sqlite3
 from pathlib import Path        #Step10-1
 
-from app.services.users_csv import get_students
-from app.services.peer_assignments_csv import get_targets_for_rater
+from app.services import score_store, write_behind
+from app.services.users_csv import DEFAULT_COHORT, get_student_cohort, get_student_set
+from app.services.peer_assignments_csv import is_assigned
 
-def students_set_from_users_csv() -> set[str]:
-    return set(get_students())
+def students_set_from_users_csv(cohort_id: str = DEFAULT_COHORT) -> frozenset[str]:
+    return get_student_set(cohort_id)
 
 router = APIRouter(prefix="/api/scores", tags=["scores"])
 
+# 批次送出一次最多幾筆
+MAX_BATCH_ITEMS = 5000
+
 #ROSTER_PATH = Path(__file__).resolve().parents[2] / "data" / "roster.json"
 
 #def load_students() -> set[str]:
@@ -32,26 +41,49 @@ def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def scores_to_dict(s) -> dict:
+    return {"hp": s.hp, "atk": s.atk, "def": s.def_, "spa": s.spa, "spd": s.spd, "spe": s.spe}
+
+
+def _write_behind(kind: str, row: tuple, response: Response) -> None:
+    """write-behind 模式：放進佇列，依 PA360_WRITE_BEHIND_ACK 等到 commit（200）或直接回 202"""
+    try:
+        pending = write_behind.writer.submit(kind, row)
+    except write_behind.QueueFull:
+        raise HTTPException(status_code=503, detail={"ok": False, "error": "WRITE_QUEUE_FULL"})
+    if write_behind.ACK == "queued":
+        response.status_code = status.HTTP_202_ACCEPTED
+        return
+    try:
+        pending.wait()
+    except sqlite3.Error as e:
+        raise HTTPException(
+            status_code=500,
+            detail={"ok": False, "error": "DB_ERROR", "message": str(e)}
+        )
+
+
 @router.post("/self", response_model=OkResponse)
-def submit_self(payload: SubmitSelfRequest, user=Depends(get_current_user)):
+def submit_self(payload: SubmitSelfRequest, response: Response, user=Depends(get_current_user)):
     if user["role"] != "student":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail={"ok": False, "error": "FORBIDDEN"})
 
     s = payload.scores
-    with db_session() as conn:
-        conn.execute(
-            """
-            INSERT INTO scores_self (user_id, created_at, hp, atk, def, spa, spd, spe)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (user["user_id"], now_iso(), s.hp, s.atk, s.def_, s.spa, s.spd, s.spe),
-        )
+    if write_behind.ENABLED:
+        _write_behind("self", (student_cohort(user["user_id"]), user["user_id"],
+                               scores_to_dict(s), now_iso()), response)
+        return OkResponse()
+
+    with score_store.write_session() as conn:
+        # 同一交易內更新彙總表
+        score_store.insert_self(conn, student_cohort(user["user_id"]), user["user_id"],
+                                scores_to_dict(s), now_iso())
     return OkResponse()
 
 
 @router.post("/peer", response_model=OkResponse)
-def submit_peer(payload: SubmitPeerRequest, user=Depends(get_current_user)):
+def submit_peer(payload: SubmitPeerRequest, response: Response, user=Depends(get_current_user)):
     if user["role"] != "student":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -68,7 +100,9 @@ def submit_peer(payload: SubmitPeerRequest, user=Depends(get_current_user)):
             detail={"ok": False, "error": "CANNOT_RATE_SELF"}
         )
 
-    students_set = students_set_from_users_csv()
+    # rater 與 target 必須在同一個 cohort（以 rater 的 cohort 為準）
+    cohort_id = student_cohort(rater)
+    students_set = students_set_from_users_csv(cohort_id)
 
     if rater not in students_set:
         raise HTTPException(status_code=400, detail={"ok": False, "error": "RATER_NOT_IN_USERS_STUDENTS"})
@@ -79,30 +113,19 @@ def submit_peer(payload: SubmitPeerRequest, user=Depends(get_current_user)):
     if target == rater:
         raise HTTPException(status_code=400, detail={"ok": False, "error": "CANNOT_RATE_SELF"})
     
-    allowed = get_targets_for_rater(rater)  # 改用 peer_assignments.csv
-    if target not in allowed:
+    # 改用 peer_assignments.csv（快取索引，集合查詢）
+    if not is_assigned(rater, target, cohort_id):
         raise HTTPException(status_code=403, detail={"ok": False, "error": "TARGET_NOT_ASSIGNED"})
 
 
     s = payload.scores
 
-    with db_session() as conn:
-        conn.execute(
-            """
-            INSERT INTO scores_peer (rater_user_id, target_user_id, created_at, hp, atk, def, spa, spd, spe)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(rater_user_id, target_user_id) DO UPDATE SET
-                created_at = excluded.created_at,
-                hp = excluded.hp,
-                atk = excluded.atk,
-                def = excluded.def,
-                spa = excluded.spa,
-                spd = excluded.spd,
-                spe = excluded.spe
-            """,
-            (rater, target, now_iso(),
-             s.hp, s.atk, s.def_, s.spa, s.spd, s.spe),
-        )
+    if write_behind.ENABLED:
+        _write_behind("peer", (cohort_id, rater, target, scores_to_dict(s), now_iso()), response)
+        return OkResponse()
+
+    with score_store.write_session() as conn:
+        score_store.upsert(conn, "peer", cohort_id, rater, target, scores_to_dict(s), now_iso())
 
     return OkResponse()
 
@@ -115,42 +138,30 @@ def submit_teacher(payload: SubmitTeacherRequest, user=Depends(get_current_user)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail={"ok": False, "error": "FORBIDDEN"})
 
-    # 限制 target_user_id 必須在 roster 內
+    # 限制 target_user_id 必須在 roster 內；分數寫進學生所屬的 cohort
+    target = payload.target_user_id.strip()
     try:
-        students = students_set_from_users_csv()
+        cohort_id = get_student_cohort(target)
     except FileNotFoundError:
         raise HTTPException(status_code=500, detail={"ok": False, "error": "USERS_CSV_NOT_FOUND"})
     except Exception:
         raise HTTPException(status_code=500, detail={"ok": False, "error": "USERS_CSV_READ_ERROR"})
 
-    target = payload.target_user_id.strip()
-    if target not in students:
+    if cohort_id is None:
         raise HTTPException(
             status_code=400,
             detail={"ok": False, "error": "TARGET_NOT_IN_USERS_STUDENTS"},
         )
+    if not teacher_can_access(user, cohort_id):
+        raise HTTPException(status_code=403, detail={"ok": False, "error": "COHORT_FORBIDDEN"})
 
     s = payload.scores
 
     try:
 
-        with db_session() as conn:
-            conn.execute(
-                """
-                INSERT INTO scores_teacher (teacher_user_id, target_user_id, created_at, hp, atk, def, spa, spd, spe)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(teacher_user_id, target_user_id) DO UPDATE SET
-                    created_at = excluded.created_at,
-                    hp = excluded.hp,
-                    atk = excluded.atk,
-                    def = excluded.def,
-                    spa = excluded.spa,
-                    spd = excluded.spd,
-                    spe = excluded.spe
-                """,
-                (user["user_id"], target, now_iso(),
-                 s.hp, s.atk, s.def_, s.spa, s.spd, s.spe),
-            )
+        with score_store.write_session() as conn:
+            score_store.upsert(conn, "teacher", cohort_id, user["user_id"], target,
+                               scores_to_dict(s), now_iso())
 
 #        with db_session() as conn:
 #            conn.execute(
@@ -169,3 +180,125 @@ def submit_teacher(payload: SubmitTeacherRequest, user=Depends(get_current_user)
 
     return OkResponse()
 
+
+def _check_batch_size(items: list) -> None:
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail={"ok": False, "error": "BATCH_TOO_LARGE", "max_items": MAX_BATCH_ITEMS},
+        )
+
+
+def _write_batch(kind: str, rows: list[score_store.UpsertRow]) -> None:
+    if not rows:
+        return
+    if write_behind.ENABLED:
+        # 排在還沒寫入的單筆送出後面（依送出順序，最後一筆生效）；批次一律等到 commit 才回應
+        try:
+            pending = write_behind.writer.submit_many(kind, rows)
+        except write_behind.QueueFull:
+            raise HTTPException(status_code=503, detail={"ok": False, "error": "WRITE_QUEUE_FULL"})
+        try:
+            pending.wait()
+        except sqlite3.Error as e:
+            raise HTTPException(
+                status_code=500,
+                detail={"ok": False, "error": "DB_ERROR", "message": str(e)}
+            )
+        return
+    try:
+        # 全部合格的資料一個交易寫完（一次 fsync）
+        with score_store.write_session() as conn:
+            score_store.upsert_many(conn, kind, rows)
+    except sqlite3.Error as e:
+        raise HTTPException(
+            status_code=500,
+            detail={"ok": False, "error": "DB_ERROR", "message": str(e)}
+        )
+
+
+def _batch_response(results: list[BatchItemResult]) -> BatchResponse:
+    accepted = sum(1 for r in results if r.ok)
+    return BatchResponse(accepted=accepted, rejected=len(results) - accepted, results=results)
+
+
+@router.post("/teacher/batch", response_model=BatchResponse)
+def submit_teacher_batch(payload: SubmitTeacherBatchRequest, user=Depends(get_current_user)):
+    """老師一次送出多位學生的評分；逐筆驗證，合格的一起寫入，回傳每筆結果"""
+    if user["role"] != "teacher":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail={"ok": False, "error": "FORBIDDEN"})
+    _check_batch_size(payload.items)
+
+    created_at = now_iso()
+    rows: list[score_store.UpsertRow] = []
+    results: list[BatchItemResult] = []
+
+    for i, item in enumerate(payload.items):
+        target = item.target_user_id.strip()
+        cohort_id = get_student_cohort(target)
+        error = None
+        if cohort_id is None:
+            error = "TARGET_NOT_IN_USERS_STUDENTS"
+        elif not teacher_can_access(user, cohort_id):
+            error = "COHORT_FORBIDDEN"
+
+        if error:
+            results.append(BatchItemResult(index=i, target_user_id=target, ok=False, error=error))
+            continue
+        rows.append((cohort_id, user["user_id"], target, scores_to_dict(item.scores), created_at))
+        results.append(BatchItemResult(index=i, target_user_id=target, ok=True))
+
+    _write_batch("teacher", rows)
+    return _batch_response(results)
+
+
+@router.post("/peer/batch", response_model=BatchResponse)
+def submit_peer_batch(payload: SubmitPeerBatchRequest, user=Depends(get_current_user)):
+    """
+    同儕評分批次送出：
+    - student：只能以自己為 rater（rater_user_id 可省略）
+    - teacher：匯入線下收集的同儕分數，每筆需帶 rater_user_id
+    每筆仍檢查名單與 peer_assignments 分派
+    """
+    if user["role"] not in ("student", "teacher"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail={"ok": False, "error": "FORBIDDEN"})
+    _check_batch_size(payload.items)
+
+    created_at = now_iso()
+    rows: list[score_store.UpsertRow] = []
+    results: list[BatchItemResult] = []
+
+    for i, item in enumerate(payload.items):
+        target = item.target_user_id.strip()
+        rater = (item.rater_user_id or "").strip()
+        if user["role"] == "student":
+            rater = rater or user["user_id"]
+        # rater 與 target 必須在同一個 cohort（以 rater 的 cohort 為準）
+        cohort_id = get_student_cohort(rater) if rater else None
+
+        error = None
+        if user["role"] == "student" and rater != user["user_id"]:
+            error = "FORBIDDEN_RATER"
+        elif not rater:
+            error = "MISSING_RATER"
+        elif cohort_id is None:
+            error = "RATER_NOT_IN_USERS_STUDENTS"
+        elif user["role"] == "teacher" and not teacher_can_access(user, cohort_id):
+            error = "COHORT_FORBIDDEN"
+        elif target not in students_set_from_users_csv(cohort_id):
+            error = "TARGET_NOT_IN_USERS_STUDENTS"
+        elif target == rater:
+            error = "CANNOT_RATE_SELF"
+        elif not is_assigned(rater, target, cohort_id):
+            error = "TARGET_NOT_ASSIGNED"
+
+        if error:
+            results.append(BatchItemResult(index=i, target_user_id=target, ok=False, error=error))
+            continue
+        rows.append((cohort_id, rater, target, scores_to_dict(item.scores), created_at))
+        results.append(BatchItemResult(index=i, target_user_id=target, ok=True))
+
+    _write_batch("peer", rows)
+    return _batch_response(results)
@@ -1,14 +1,34 @@
 # backend/app/api/routes/teacher.py
 from __future__ import annotations
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.deps import get_current_user
-from app.db import db_session
-from app.services.users_csv import get_students
+import asyncio
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from app.deps import (
+    get_current_user,
+    json_bytes,
+    json_response,
+    make_etag,
+    not_modified_or_none,
+    set_etag,
+    teacher_can_access,
+    teacher_cohort_or_403,
+    user_from_token,
+)
+from app.services.users_csv import get_cohorts, get_roster_version, get_students
+from app.services.peer_assignments_csv import get_assignments_version
+from app.services import data_version
+from app.services.completion import compute_completion
+from app.services.completion_hub import hub
+from app.services.single_flight import aggregations
 
 router = APIRouter(prefix="/api/teacher", tags=["teacher"])
 
 @router.get("/completion", summary="老師查看全班完成度（自評/同儕送出/同儕收到）")
-def class_completion(user=Depends(get_current_user)):
+def class_completion(
+    cohort_id: str | None = None,
+    if_none_match: str | None = Header(default=None),
+    user=Depends(get_current_user),
+):
     # 只允許 teacher
     if user["role"] != "teacher":
         raise HTTPException(
@@ -16,113 +36,88 @@ def class_completion(user=Depends(get_current_user)):
             detail={"ok": False, "error": "FORBIDDEN"},
         )
 
-    students = get_students()
-    n = len(students)
-
-    # 我們的同儕規則：每人要評 2 位
-    required_peer_given = 2
-    # 在環狀分派中，每位學生理論上也會「被 2 位同學評分」
-    required_peer_received = 2
-
-    # 先把所有人狀態初始化
-    result = {
-        sid: {
-            "user_id": sid,
-            "self_submitted": False,
-            "peer_given_count": 0,
-            "peer_received_count": 0,
-            "required_peer_given": required_peer_given,
-            "required_peer_received": required_peer_received,
-
-            #新增
-            "teacher_scored": False,
-            "required_teacher": 1,
-        }
-        for sid in students
-    }
-
-    with db_session() as conn:
-        # 自評：每人只要有一筆，就算完成（也可改成看 latest）
-        rows = conn.execute("""
-            SELECT user_id, COUNT(*) AS cnt
-            FROM scores_self
-            GROUP BY user_id
-        """).fetchall()
-        for r in rows:
-            uid = r["user_id"]
-            if uid in result:
-                result[uid]["self_submitted"] = (r["cnt"] > 0)
-
-        # 同儕送出：每人送出幾筆
-        rows = conn.execute("""
-            SELECT rater_user_id AS user_id, COUNT(*) AS cnt
-            FROM scores_peer
-            GROUP BY rater_user_id
-        """).fetchall()
-        for r in rows:
-            uid = r["user_id"]
-            if uid in result:
-                result[uid]["peer_given_count"] = int(r["cnt"])
-
-        # 同儕收到：每人被評幾筆
-        rows = conn.execute("""
-            SELECT target_user_id AS user_id, COUNT(*) AS cnt
-            FROM scores_peer
-            GROUP BY target_user_id
-        """).fetchall()
-        for r in rows:
-            uid = r["user_id"]
-            if uid in result:
-                result[uid]["peer_received_count"] = int(r["cnt"])
-
-        # 老師評分：每位學生是否已被老師評過（target_user_id 只要有一筆就算完成）
-        rows = conn.execute("""
-            SELECT target_user_id AS user_id, COUNT(*) AS cnt
-            FROM scores_teacher
-            GROUP BY target_user_id
-        """).fetchall()
-        for r in rows:
-            uid = r["user_id"]
-            if uid in result:
-                result[uid]["teacher_scored"] = (int(r["cnt"]) >= 1)
-
-
-    # 統計：哪些人沒交
-    not_submitted_self = [sid for sid in students if not result[sid]["self_submitted"]]
-    not_done_peer_given = [
-        sid for sid in students if result[sid]["peer_given_count"] < required_peer_given
-    ]
-    not_done_teacher = [sid for sid in students if not result[sid]["teacher_scored"]]
-
-
-    # 全班明細（照 roster 順序）
-    detail = []
-    for sid in students:
-        item = result[sid]
-        #item["peer_given_done"] = (item["peer_given_count"] >= required_peer_given)
-        #item["peer_received_done"] = (item["peer_received_count"] >= required_peer_received)
-        #item["all_done"] = (item["self_submitted"] and item["peer_given_done"])
-        item["peer_given_done"] = (item["peer_given_count"] >= required_peer_given)
-        item["peer_received_done"] = (item["peer_received_count"] >= required_peer_received)
-
-        # 老師評分是否完成（已在 teacher_scored）
-        item["teacher_done"] = item["teacher_scored"]
-        
-        # all_done：自評 + 同儕送出達標 + 老師評分完成
-        item["all_done"] = (item["self_submitted"] and item["peer_given_done"] and item["teacher_done"])
-
-        detail.append(item)
-
-    return {
-        "ok": True,
-        "class_size": n,
-        "required_peer_given": required_peer_given,
-        "required_peer_received": required_peer_received,
-        "not_submitted_self": not_submitted_self,
-        "not_done_peer_given": not_done_peer_given,
-        "detail": detail,
-        "not_done_teacher": not_done_teacher,
-    }
+    cohort_id = teacher_cohort_or_403(user, cohort_id)
+    versions = (get_roster_version(), get_assignments_version())
+
+    # 資料版本（主鍵查詢一次）、名單、分派都沒變：直接 304，不做計算
+    etag = make_etag("teacher_completion", cohort_id, data_version.current(), *versions)
+    not_modified = not_modified_or_none(if_none_match, etag)
+    if not_modified is not None:
+        return not_modified
+
+    # 序列化結果也快取（同一版本只序列化一次）；WebSocket 推播用的是 cached_completion 的 dict
+    body = aggregations.do(
+        ("teacher_completion_json", cohort_id, *versions),
+        lambda: json_bytes(cached_completion(cohort_id)),
+    )
+    return json_response(body, etag)
+
+
+def cached_completion(cohort_id: str) -> dict:
+    # 同時開 dashboard 的老師共用同一次計算（寫入分數、名單或分派變動後失效）
+    versions = (get_roster_version(), get_assignments_version())
+    return aggregations.do(
+        ("teacher_completion", cohort_id, *versions),
+        lambda: compute_completion(cohort_id),
+    )
+
+
+async def _send_snapshot(websocket: WebSocket, cohort_id: str) -> None:
+    # 先讀版本再算（讀 DB，不在 event loop 上做）
+    version = await run_in_threadpool(data_version.current)
+    data = await run_in_threadpool(cached_completion, cohort_id)
+    await websocket.send_json({"type": "snapshot", "data_version": version, "data": data})
+
+
+async def _wait_disconnect(websocket: WebSocket) -> None:
+    # 用戶端送來的訊息都忽略，只等斷線（閒置連線不用等到下一次推播才發現斷了）
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+
+@router.websocket("/completion/ws")
+async def completion_ws(websocket: WebSocket, token: str | None = None, cohort_id: str | None = None):
+    """
+    完成度即時推播（取代一直重新整理 /completion）：
+    - 連線：/api/teacher/completion/ws?token=<access_token>&cohort_id=...
+    - 先送 {"type": "snapshot", "data": <同 /completion>}
+    - 之後有自評/同儕/老師評分寫入時送 {"type": "delta", "items": [<detail 項目>...]}（只含受影響的學生）
+    - 連線太慢、更新被丟掉時重送 snapshot
+    """
+    try:
+        user = user_from_token(token or "")
+        if user["role"] != "teacher":
+            raise HTTPException(status_code=403, detail={"ok": False, "error": "FORBIDDEN"})
+        cohort_id = teacher_cohort_or_403(user, cohort_id)
+    except HTTPException as e:
+        # 4000 + HTTP 狀態碼，例如 4401 / 4403 / 4404
+        await websocket.close(code=4000 + e.status_code, reason=e.detail.get("error", ""))
+        return
+
+    await websocket.accept()
+    sub = hub.subscribe(cohort_id)
+    disconnected = asyncio.create_task(_wait_disconnect(websocket))
+    try:
+        await _send_snapshot(websocket, cohort_id)
+        while True:
+            next_event = asyncio.ensure_future(sub.queue.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                next_event.cancel()
+                return
+            event = next_event.result()
+            if event["type"] == "resync":
+                await _send_snapshot(websocket, cohort_id)
+            else:
+                await websocket.send_json(event)
+    except (WebSocketDisconnect, RuntimeError):
+        # 送出失敗（用戶端已斷線）
+        return
+    finally:
+        disconnected.cancel()
+        hub.unsubscribe(sub)
 
 
 # @router.get("/students", summary="老師取得全班學生名單（roster）")
@@ -136,9 +131,32 @@ def class_completion(user=Depends(get_current_user)):
 #     return {"ok": True, "students": students}
 
 @router.get("/students")
-def list_students_api(user=Depends(get_current_user)):
+def list_students_api(
+    response: Response,
+    cohort_id: str | None = None,
+    if_none_match: str | None = Header(default=None),
+    user=Depends(get_current_user),
+):
     if user["role"] != "teacher":
         raise HTTPException(status_code=403, detail={"ok": False})
 
-    students = get_students()
-    return {"ok": True, "students": students}
+    cohort_id = teacher_cohort_or_403(user, cohort_id)
+
+    # 名單只來自 users.csv：檔案沒變就 304
+    etag = make_etag("teacher_students", cohort_id, get_roster_version())
+    not_modified = not_modified_or_none(if_none_match, etag)
+    if not_modified is not None:
+        return not_modified
+    set_etag(response, etag)
+
+    students = get_students(cohort_id)
+    return {"ok": True, "cohort_id": cohort_id, "students": students}
+
+
+@router.get("/cohorts", summary="老師可查看的 cohort（班級/梯次）")
+def list_cohorts_api(user=Depends(get_current_user)):
+    if user["role"] != "teacher":
+        raise HTTPException(status_code=403, detail={"ok": False, "error": "FORBIDDEN"})
+
+    cohorts = [c for c in get_cohorts() if teacher_can_access(user, c)]
+    return {"ok": True, "cohorts": cohorts}
@@ -0,0 +1,192 @@
+# backend/app/assign_peers.py
+"""
+產生 / 檢查同儕分派（peer_assignments.csv）：
+
+  cd backend
+  python -m app.assign_peers -k 5 --seed 2024 --force                 # 依 users.csv 重新產生
+  python -m app.assign_peers -k 4 --no-reciprocal --no-same-team --out /tmp/peers.csv
+  python -m app.assign_peers --cohort 2024A --cohort 2024B -k 3 --out /tmp/2024.csv
+  python -m app.assign_peers --check -k 5 --no-reciprocal             # 只檢查現有的檔案
+
+產生規則（app.services.peer_assignment_gen）：每個 cohort 各自產生，
+每位學生剛好評 k 位、也被 k 位評，不會評自己；
+--no-reciprocal：不會互評（k 最多 (人數-1)/2）
+--no-same-team：不會評同組的人（users.csv 的 team 欄，可用 --team-column 換欄名；留空 = 不分組）
+同一個 --seed 每次結果都一樣；沒給 seed 時隨機挑一個並印出來。
+
+寫檔前會先驗證（平衡、條件），寫到暫存檔再換名，服務中的快取會在下一個請求時自動重新載入。
+有給 --cohort 且輸出檔已存在時，只換掉這些 cohort 的分派，其他 cohort 的列原樣保留。
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+import zlib
+from pathlib import Path
+
+from app.services.peer_assignment_gen import AssignmentError, plan_assignments, validate_assignments
+from app.services.peer_assignments_csv import ASSIGNMENTS_CSV_PATH
+from app.services.users_csv import DEFAULT_COHORT, USERS_CSV_PATH
+
+
+def read_students(path: Path, team_column: str) -> tuple[dict[str, list[str]], dict[str, str]]:
+    """users.csv → ({cohort_id: [student user_id, ...]}, {user_id: team})"""
+    by_cohort: dict[str, list[str]] = {}
+    team_of: dict[str, str] = {}
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            if (row.get("role") or "").strip() != "student":
+                continue
+            uid = (row.get("user_id") or "").strip()
+            if not uid:
+                continue
+            cohort = (row.get("cohort_id") or "").strip() or DEFAULT_COHORT
+            by_cohort.setdefault(cohort, []).append(uid)
+            team = (row.get(team_column) or "").strip()
+            if team:
+                team_of[uid] = team
+    for students in by_cohort.values():
+        students.sort()
+    return by_cohort, team_of
+
+
+def read_assignments(path: Path) -> dict[str, list[tuple[str, str]]]:
+    by_cohort: dict[str, list[tuple[str, str]]] = {}
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            rater = (row.get("rater_id") or "").strip()
+            target = (row.get("target_id") or "").strip()
+            if rater and target:
+                cohort = (row.get("cohort_id") or "").strip() or DEFAULT_COHORT
+                by_cohort.setdefault(cohort, []).append((rater, target))
+    return by_cohort
+
+
+def write_assignments(path: Path, rows: list[tuple[str, list[tuple[str, str]]]]) -> int:
+    """rows：[(cohort_id, [(rater, target), ...])]；只有預設 cohort 時不寫 cohort_id 欄"""
+    with_cohort = any(cohort != DEFAULT_COHORT for cohort, _ in rows)
+    tmp = path.with_name(f".{path.name}.tmp")
+    count = 0
+    with tmp.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["rater_id", "target_id", "cohort_id"] if with_cohort else ["rater_id", "target_id"])
+        for cohort, pairs in rows:
+            if with_cohort:
+                w.writerows((r, t, cohort) for r, t in pairs)
+            else:
+                w.writerows(pairs)
+            count += len(pairs)
+    os.replace(tmp, path)
+    return count
+
+
+def check(args, by_cohort: dict[str, list[str]], team_of: dict[str, str]) -> int:
+    assigned = read_assignments(args.assignments)
+    failed = False
+    for cohort in args.cohort or sorted(by_cohort):
+        problems = validate_assignments(
+            assigned.get(cohort, []), by_cohort.get(cohort, []), args.k,
+            no_reciprocal=args.no_reciprocal, team_of=team_of if args.no_same_team else None,
+        )
+        n_pairs = len(assigned.get(cohort, []))
+        print(f"{cohort}: {len(by_cohort.get(cohort, [])):,} students, {n_pairs:,} assignments"
+              + ("" if problems else "  OK"))
+        for p in problems:
+            print(f"  {p}")
+        failed = failed or bool(problems)
+    for cohort in sorted(set(assigned) - set(by_cohort)):
+        print(f"{cohort}: not in users.csv ({len(assigned[cohort]):,} assignments)")
+        failed = True
+    return 1 if failed else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        prog="python -m app.assign_peers",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    ap.add_argument("-k", type=int, default=None, help="每人評幾位（產生時必填；--check 時不給 = 只要求人人一樣）")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--no-reciprocal", action="store_true", help="不允許 A 評 B 且 B 評 A")
+    ap.add_argument("--no-same-team", action="store_true", help="不允許評同組的人")
+    ap.add_argument("--team-column", default="team", help="users.csv 的組別欄位")
+    ap.add_argument("--cohort", action="append", default=[], help="只處理這些 cohort（可重複，預設全部）")
+    ap.add_argument("--users", type=Path, default=USERS_CSV_PATH)
+    ap.add_argument("--out", type=Path, default=ASSIGNMENTS_CSV_PATH, help="輸出檔（預設 peer_assignments.csv；有給 --cohort 時保留其他 cohort 的分派）")
+    ap.add_argument("--force", action="store_true", help="輸出檔已存在時覆寫")
+    ap.add_argument("--check", action="store_true", help="不產生，只檢查 --assignments 是否平衡且符合條件")
+    ap.add_argument("--assignments", type=Path, default=ASSIGNMENTS_CSV_PATH, help="--check 要檢查的檔案")
+    args = ap.parse_args(argv)
+
+    if not args.users.exists():
+        print(f"file not found: {args.users}", file=sys.stderr)
+        return 2
+    by_cohort, team_of = read_students(args.users, args.team_column)
+    if args.no_same_team and not team_of:
+        print(f"--no-same-team: users.csv has no '{args.team_column}' values", file=sys.stderr)
+        return 2
+    unknown = [c for c in args.cohort if c not in by_cohort]
+    if unknown:
+        print(f"unknown cohort: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    if args.check:
+        if not args.assignments.exists():
+            print(f"file not found: {args.assignments}", file=sys.stderr)
+            return 2
+        return check(args, by_cohort, team_of)
+
+    if args.k is None:
+        ap.error("-k is required when generating")
+    if args.out.exists() and not args.force:
+        print(f"{args.out} already exists (use --force to replace it)", file=sys.stderr)
+        return 2
+
+    seed = args.seed if args.seed is not None else random.SystemRandom().randrange(2 ** 32)
+    teams = team_of if args.no_same_team else None
+    rows: list[tuple[str, list[tuple[str, str]]]] = []
+    t0 = time.perf_counter()
+    for cohort in args.cohort or sorted(by_cohort):
+        students = by_cohort[cohort]
+        try:
+            # 每個 cohort 用不同但固定的 seed（只重產其中一個 cohort 時結果也一樣）
+            plan = plan_assignments(students, args.k, zlib.crc32(f"{seed}:{cohort}".encode("utf-8")),
+                                    no_reciprocal=args.no_reciprocal, team_of=teams)
+        except AssignmentError as e:
+            print(f"{cohort}: {e}", file=sys.stderr)
+            return 1
+        pairs = list(plan.pairs())
+        problems = validate_assignments(pairs, students, args.k,
+                                        no_reciprocal=args.no_reciprocal, team_of=teams)
+        if problems:
+            # 不應該發生：產生器的保證被打破，不寫檔
+            print(f"{cohort}: generated assignments failed validation:", file=sys.stderr)
+            for p in problems:
+                print(f"  {p}", file=sys.stderr)
+            return 1
+        rows.append((cohort, pairs))
+        print(f"{cohort}: {len(students):,} students x k={args.k} -> {len(pairs):,} assignments")
+
+    if args.cohort and args.out.exists():
+        # 只重產部分 cohort：其他 cohort 的分派原樣寫回（不然會被整個檔案覆寫掉）
+        regenerated = dict(rows)
+        existing = read_assignments(args.out)
+        kept = [(cohort, pairs) for cohort, pairs in existing.items() if cohort not in regenerated]
+        rows = [(cohort, regenerated.pop(cohort, pairs)) for cohort, pairs in existing.items()]
+        rows.extend(regenerated.items())
+        if kept:
+            print(f"kept {sum(len(p) for _, p in kept):,} assignments of other cohorts: "
+                  + ", ".join(cohort for cohort, _ in kept))
+
+    count = write_assignments(args.out, rows)
+    print(f"wrote {count:,} assignments to {args.out} (seed {seed}, {time.perf_counter() - t0:.2f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+# backend/app/datagen.py
+"""
+合成資料產生器（壓力測試 / 容量規劃用，同一個 --seed 每次產生一模一樣的資料）：
+
+  cd backend
+  python -m app.datagen /tmp/pa360-10k
+  python -m app.datagen /tmp/pa360-1m --students 1000000 --cohorts 20 --peers 5 --self-repeats 3
+  python -m app.datagen /tmp/pa360-csv --no-scores          # 只要 CSV
+
+  PA360_DATA_DIR=/tmp/pa360-10k PA360_DB_PATH=/tmp/pa360-10k/app.db uvicorn app.main:app
+
+輸出（OUT_DIR 底下）：
+- users.csv：--students 位學生（S0000000…，依序分到 --cohorts 個 cohort）、
+  --teachers 位老師（T0000…，輪流負責一個 cohort；只有一個 cohort 時可看全部）、1 位 master（admin）
+  密碼一律是 --password
+- peer_assignments.csv：每個 cohort 內洗牌後環狀分派，每人評 --peers 位、也被 --peers 位評，不會評自己
+- poke.csv：--catalog-size 筆的參考名單；--catalog NAME 另外產生 catalogs/NAME.csv
+- app.db（或 --db）：自評（每人 --self-repeats 筆）、分派內的同儕評分、每人一筆老師評分，
+  --fill 控制每一筆實際有交的機率（< 1 時完成度才會有缺）
+
+分數：每位學生有一組「真實能力」，自評/同儕/老師都是它加上雜訊；
+每位評分者另外有固定的寬嚴偏差，同儕評分才會有「手鬆」「手緊」的人。
+
+做法：CSV 逐列寫出、分數用 generator 每 --batch-size 筆 executemany 一次並 commit，
+記憶體只跟學生數有關（每人一組能力值），跟分數筆數無關。
+寫入期間拿掉唯一索引（同 app.db_import），寫完再建回來，最後重建 student_aggregates、rater_stats 與 peer_norm_sums 並把資料版本 +1。
+中途失敗（含 Ctrl-C）時不做收尾，並刪掉寫到一半的 DB 檔。
+各部分用各自的亂數序列（seed + 名稱），只改其中一個參數不會讓其他檔案整個變掉。
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from app import db
+from app.services import aggregates, data_version, rater_stats
+from app.services.scoring import METRICS
+from app.services.users_csv import DEFAULT_COHORT
+
+DEFAULT_SEED = 42
+DEFAULT_BATCH_SIZE = 50_000
+
+# created_at 從這個時間開始往後排（固定值，輸出才可重現）
+BASE_TIME = datetime(2024, 9, 1, tzinfo=timezone.utc)
+SPAN_SEC = 30 * 24 * 3600
+
+SCORE_MIN, SCORE_MAX = 1, 10
+
+
+def student_id(i: int) -> str:
+    return f"S{i:07d}"
+
+
+def teacher_id(j: int) -> str:
+    return f"T{j:04d}"
+
+
+def cohort_name(c: int, cohorts: int) -> str:
+    return DEFAULT_COHORT if cohorts <= 1 else f"C{c + 1:03d}"
+
+
+def cohort_of(i: int, students: int, cohorts: int) -> int:
+    """第 i 位學生屬於第幾個 cohort（依序切成大小相近的幾段）"""
+    return i * cohorts // students
+
+
+def cohort_ranges(students: int, cohorts: int) -> Iterator[tuple[str, range]]:
+    """(cohort_id, 學生編號範圍)"""
+    for c in range(cohorts):
+        # cohort_of(i) == c  ⇔  ceil(c·N/C) <= i < ceil((c+1)·N/C)
+        yield cohort_name(c, cohorts), range(-(-c * students // cohorts), -(-(c + 1) * students // cohorts))
+
+
+def _rng(seed: int, part: str) -> np.random.Generator:
+    return np.random.default_rng([seed, zlib.crc32(part.encode("utf-8"))])
+
+
+def _scores(mean: np.ndarray, noise_sd: float, rng: np.random.Generator) -> list[list[int]]:
+    """(n, 6) 期望值 + 常態雜訊 → 四捨五入並夾在 1~10；回傳每個指標一個 list（給 zip 用）"""
+    raw = mean + rng.normal(0.0, noise_sd, size=mean.shape)
+    return np.clip(np.rint(raw), SCORE_MIN, SCORE_MAX).astype(np.int64).T.tolist()
+
+
+def _created_at(n: int, rng: np.random.Generator) -> list[str]:
+    ts = np.datetime64(BASE_TIME.replace(tzinfo=None), "s") + rng.integers(0, SPAN_SEC, size=n).astype("timedelta64[s]")
+    return [f"{t}+00:00" for t in ts.astype(str).tolist()]
+
+
+# ---- CSV ----
+
+def write_users(path: Path, students: int, teachers: int, cohorts: int, password: str) -> None:
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["role", "user_id", "password", "display_name", "cohort_id"])
+        for cohort, members in cohort_ranges(students, cohorts):
+            w.writerows(
+                ("student", student_id(i), password, f"student{i}", cohort if cohorts > 1 else "")
+                for i in members
+            )
+        for j in range(teachers):
+            w.writerow(["teacher", teacher_id(j), password, f"teacher{j}",
+                        cohort_name(j % cohorts, cohorts) if cohorts > 1 else ""])
+        w.writerow(["master", "admin", password, "Master", ""])
+
+
+def iter_assignments(students: int, cohorts: int, k: int, seed: int,
+                     block: int = DEFAULT_BATCH_SIZE) -> Iterator[tuple[str, np.ndarray, np.ndarray]]:
+    """
+    (cohort_id, raters, targets)，每次最多約 block 對：
+    每個 cohort 內先洗牌，再讓第 p 位評 p+1 … p+k（環狀）
+    → 每人送出、收到都剛好 min(k, cohort 人數-1) 份，不會評自己
+    """
+    rng = _rng(seed, "assignments")
+    for cohort, members in cohort_ranges(students, cohorts):
+        order = rng.permutation(np.arange(members.start, members.stop))
+        n = len(order)
+        kk = min(k, n - 1)
+        if kk <= 0:
+            continue
+        offsets = np.arange(1, kk + 1)
+        step = max(1, block // kk)
+        for p0 in range(0, n, step):
+            p = np.arange(p0, min(n, p0 + step))
+            yield (cohort, np.repeat(order[p], kk),
+                   order[(p[:, None] + offsets) % n].ravel())
+
+
+def write_assignments(path: Path, students: int, cohorts: int, k: int, seed: int) -> int:
+    count = 0
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["rater_id", "target_id", "cohort_id"] if cohorts > 1 else ["rater_id", "target_id"])
+        for cohort, raters, targets in iter_assignments(students, cohorts, k, seed):
+            pairs = zip(map(student_id, raters.tolist()), map(student_id, targets.tolist()))
+            if cohorts > 1:
+                w.writerows((r, t, cohort) for r, t in pairs)
+            else:
+                w.writerows(pairs)
+            count += len(raters)
+    return count
+
+
+def write_catalog(path: Path, size: int, seed: int, name: str) -> None:
+    """欄位同 poke.csv：poke_num, poke_name, hp … spe（數值分布大致同原始 poke.csv）"""
+    rng = _rng(seed, f"catalog:{name}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    base = rng.normal(4.0, 1.2, size=(size, 1))
+    cols = _scores(np.broadcast_to(base, (size, len(METRICS))), 1.0, rng)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["poke_num", "poke_name", *METRICS])
+        w.writerows((i + 1, f"{name}-{i + 1:05d}", *vals) for i, vals in enumerate(zip(*cols)))
+
+
+# ---- 分數 ----
+# 每個 generator 一次 yield 一批 INSERT 參數（list of tuple），同一批都在同一個 cohort
+
+def _abilities(students: int, seed: int) -> np.ndarray:
+    return _rng(seed, "ability").normal(6.0, 1.5, size=(students, len(METRICS)))
+
+
+def _biases(count: int, seed: int, part: str, sd: float) -> np.ndarray:
+    return _rng(seed, part).normal(0.0, sd, size=count)
+
+
+def _student_blocks(students: int, cohorts: int, block: int) -> Iterator[tuple[str, np.ndarray]]:
+    for cohort, members in cohort_ranges(students, cohorts):
+        for s in range(members.start, members.stop, block):
+            yield cohort, np.arange(s, min(members.stop, s + block))
+
+
+def iter_self_rows(students: int, cohorts: int, repeats: int, fill: float, ability: np.ndarray,
+                   seed: int, block: int = DEFAULT_BATCH_SIZE) -> Iterator[list[tuple]]:
+    rng = _rng(seed, "self")
+    if repeats <= 0:
+        return
+    for cohort, ids in _student_blocks(students, cohorts, max(1, block // repeats)):
+        ids = np.repeat(ids, repeats)
+        ids = ids[rng.random(len(ids)) < fill]
+        cols = _scores(ability[ids] + 0.5, 1.0, rng)
+        yield list(zip([cohort] * len(ids), map(student_id, ids.tolist()),
+                       _created_at(len(ids), rng), *cols))
+
+
+def iter_peer_rows(students: int, cohorts: int, k: int, fill: float, ability: np.ndarray,
+                   seed: int, block: int = DEFAULT_BATCH_SIZE) -> Iterator[list[tuple]]:
+    rng = _rng(seed, "peer")
+    bias = _biases(students, seed, "peer-bias", 1.0)
+    for cohort, raters, targets in iter_assignments(students, cohorts, k, seed, block):
+        keep = rng.random(len(raters)) < fill
+        raters, targets = raters[keep], targets[keep]
+        cols = _scores(ability[targets] + bias[raters][:, None], 1.2, rng)
+        yield list(zip([cohort] * len(raters), map(student_id, raters.tolist()),
+                       map(student_id, targets.tolist()), _created_at(len(raters), rng), *cols))
+
+
+def iter_teacher_rows(students: int, cohorts: int, teachers: int, fill: float, ability: np.ndarray,
+                      seed: int, block: int = DEFAULT_BATCH_SIZE) -> Iterator[list[tuple]]:
+    rng = _rng(seed, "teacher")
+    bias = _biases(teachers, seed, "teacher-bias", 0.5)
+    for cohort, ids in _student_blocks(students, cohorts, block):
+        c = cohort_of(int(ids[0]), students, cohorts)
+        ids = ids[rng.random(len(ids)) < fill]
+        # 多 cohort 時找負責這個 cohort 的老師（老師 j 負責 j % cohorts）
+        j = c + cohorts * rng.integers(0, (teachers - c + cohorts - 1) // cohorts, size=len(ids))
+        cols = _scores(ability[ids] + bias[j][:, None], 0.7, rng)
+        yield list(zip([cohort] * len(ids), map(teacher_id, j.tolist()),
+                       map(student_id, ids.tolist()), _created_at(len(ids), rng), *cols))
+
+
+_INSERTS = {
+    "scores_self": ("cohort_id", "user_id"),
+    "scores_peer": ("cohort_id", "rater_user_id", "target_user_id"),
+    "scores_teacher": ("cohort_id", "teacher_user_id", "target_user_id"),
+}
+
+
+def insert_stream(conn, table: str, batches: Iterator[list[tuple]], log=print) -> int:
+    cols = [*_INSERTS[table], "created_at", *METRICS]
+    sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+    inserted = 0
+    t0 = time.perf_counter()
+    for batch in batches:
+        if not batch:
+            continue
+        conn.executemany(sql, batch)
+        conn.commit()
+        inserted += len(batch)
+        elapsed = time.perf_counter() - t0
+        log(f"  {table}: {inserted:,} rows  {inserted / elapsed:,.0f} rows/sec")
+    return inserted
+
+
+def write_scores(students: int, teachers: int, cohorts: int, k: int, self_repeats: int,
+                 fill: float, seed: int, batch_size: int = DEFAULT_BATCH_SIZE, log=print) -> dict:
+    """把分數寫進 db.DB_PATH（應該是空的 DB），回傳各表筆數"""
+    ability = _abilities(students, seed)
+
+    db.init_db()
+    conn = db.get_conn()
+    # 一次性的產生資料：不需要每次 commit 都 fsync
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+
+    counts: dict[str, int] = {}
+    try:
+        for index_name, _ in db.UNIQUE_INDEXES.values():
+            conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+        conn.commit()
+
+        counts["scores_self"] = insert_stream(
+            conn, "scores_self",
+            iter_self_rows(students, cohorts, self_repeats, fill, ability, seed, batch_size), log)
+        counts["scores_peer"] = insert_stream(
+            conn, "scores_peer",
+            iter_peer_rows(students, cohorts, k, fill, ability, seed, batch_size), log)
+        if teachers:
+            counts["scores_teacher"] = insert_stream(
+                conn, "scores_teacher",
+                iter_teacher_rows(students, cohorts, teachers, fill, ability, seed, batch_size), log)
+    except BaseException:
+        # 寫到一半失敗：不建索引、不重建彙總、不 bump 版本，DB 留著也不完整（main 會刪掉）
+        conn.close()
+        raise
+    else:
+        try:
+            # 產生的 (owner, target) 本來就不重複：直接建回唯一索引，不用先跑去重
+            for table, (index_name, cols) in db.UNIQUE_INDEXES.items():
+                conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table} ({cols})")
+            aggregates.rebuild(conn)
+            rater_stats.rebuild(conn)
+            data_version.bump(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    return counts
+
+
+def generate(out_dir: Path, students: int, teachers: int, cohorts: int, k: int,
+             self_repeats: int, fill: float, catalog_size: int, catalogs: list[str],
+             seed: int = DEFAULT_SEED, password: str = "pw", scores: bool = True,
+             batch_size: int = DEFAULT_BATCH_SIZE, log=print) -> dict:
+    """寫出整套資料；分數寫進 db.DB_PATH（呼叫前先設定好）"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+
+    write_users(out_dir / "users.csv", students, teachers, cohorts, password)
+    assignments = write_assignments(out_dir / "peer_assignments.csv", students, cohorts, k, seed)
+    write_catalog(out_dir / "poke.csv", catalog_size, seed, "poke")
+    for name in catalogs:
+        write_catalog(out_dir / "catalogs" / f"{name}.csv", catalog_size, seed, name)
+    log(f"csv: {students:,} students, {teachers:,} teachers, {assignments:,} assignments "
+        f"({time.perf_counter() - t0:.1f}s)")
+
+    counts = {}
+    if scores:
+        counts = write_scores(students, teachers, cohorts, k, self_repeats, fill, seed, batch_size, log)
+    return {
+        "students": students,
+        "assignments": assignments,
+        **counts,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        prog="python -m app.datagen",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    ap.add_argument("out_dir", type=Path)
+    ap.add_argument("--students", type=int, default=10_000)
+    ap.add_argument("--teachers", type=int, default=20)
+    ap.add_argument("--cohorts", type=int, default=1)
+    ap.add_argument("--peers", type=int, default=5, help="每位學生要評幾位")
+    ap.add_argument("--self-repeats", type=int, default=2, help="每位學生幾筆自評")
+    ap.add_argument("--fill", type=float, default=1.0, help="每筆分數實際有交的機率（0~1）")
+    ap.add_argument("--catalog-size", type=int, default=1_000)
+    ap.add_argument("--catalog", action="append", default=[], metavar="NAME",
+                    help="另外產生 catalogs/NAME.csv（可重複）")
+    ap.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    ap.add_argument("--password", default="pw")
+    ap.add_argument("--db", type=Path, default=None, help="分數寫到哪個 SQLite 檔（預設 OUT_DIR/app.db）")
+    ap.add_argument("--no-scores", action="store_true", help="只產生 CSV")
+    ap.add_argument("--force", action="store_true", help="DB 檔已存在時先刪掉")
+    ap.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = ap.parse_args(argv)
+
+    if args.students < 2 or args.cohorts < 1 or args.cohorts > args.students:
+        ap.error("need --students >= 2 and 1 <= --cohorts <= --students")
+    if args.peers < 0 or args.teachers < 0 or args.self_repeats < 0 or args.catalog_size < 1:
+        ap.error("counts must not be negative (and --catalog-size >= 1)")
+    if not 0.0 <= args.fill <= 1.0:
+        ap.error("--fill must be between 0 and 1")
+    if args.cohorts > 1 and 0 < args.teachers < args.cohorts:
+        ap.error("--teachers must be >= --cohorts so every cohort has a teacher")
+    if args.catalog and any(not n.replace("-", "").replace("_", "").isalnum() for n in args.catalog):
+        ap.error("catalog names may only contain letters, digits, - and _")
+
+    db_path = args.db or args.out_dir / "app.db"
+    if not args.no_scores:
+        if db_path.exists():
+            if not args.force:
+                print(f"{db_path} already exists (use --force to replace it)", file=sys.stderr)
+                return 2
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        db.DB_PATH = db_path
+
+    print(f"generating into {args.out_dir} (seed {args.seed})")
+    try:
+        result = generate(
+            args.out_dir, args.students, args.teachers, args.cohorts, args.peers,
+            args.self_repeats, args.fill, args.catalog_size, args.catalog,
+            seed=args.seed, password=args.password, scores=not args.no_scores,
+            batch_size=max(1, args.batch_size),
+        )
+    except BaseException:
+        db.close_pools()
+        if not args.no_scores:
+            # 這次新建的 DB 只寫了一半：刪掉，免得被當成完整資料拿去用
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+            print(f"generation failed; removed incomplete {db_path}", file=sys.stderr)
+        raise
+    db.close_pools()
+    print("done: " + ", ".join(f"{k}={v:,}" if isinstance(v, int) else f"{k}={v}"
+                               for k, v in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
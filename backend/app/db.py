@@ -1,106 +1,760 @@
 # backend/app/db.py
 from __future__ import annotations
 
+import logging
+import math
+import os
+import re
 import sqlite3
+import threading
+import time
+from contextvars import ContextVar
 from pathlib import Path
 from contextlib import contextmanager
 
-DB_PATH = Path(__file__).resolve().parent / "app.db"
+from app.services import data_version, metrics
 
+# 預設 app/app.db；PA360_DB_PATH 可換掉（benchmark / 大量測試資料用）
+DB_PATH = Path(os.environ.get("PA360_DB_PATH") or Path(__file__).resolve().parent / "app.db")
 
-def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+# 連線池與 SQLite 參數（可用環境變數調整）
+DB_POOL_SIZE = int(os.environ.get("PA360_DB_POOL_SIZE", "8"))          # 讀、寫各自的連線上限
+DB_POOL_TIMEOUT = float(os.environ.get("PA360_DB_POOL_TIMEOUT", "30"))  # 等待可用連線的秒數
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("PA360_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.environ.get("PA360_DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.environ.get("PA360_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# SQL 追蹤（預設關閉）：每個請求記錄執行了哪些 SQL、花多久、回傳幾筆，回應加 Server-Timing
+SQL_TRACE = os.environ.get("PA360_SQL_TRACE", "0") == "1"
+# 超過這個毫秒數的語句，把 EXPLAIN QUERY PLAN 寫進 log（< 0 = 不做）
+SQL_SLOW_MS = float(os.environ.get("PA360_SQL_SLOW_MS", "50"))
+# 每個請求最多保留幾筆語句明細（超過只累計總數）
+SQL_TRACE_MAX = int(os.environ.get("PA360_SQL_TRACE_MAX", "500"))
+
+logger = logging.getLogger(__name__)
+
+
+def _configure(conn: sqlite3.Connection, readonly: bool) -> None:
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    # 負數代表 KiB
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        # WAL：讀者不會被寫入擋住；journal_mode 會寫進檔案，之後的連線都沿用
+        conn.execute("PRAGMA journal_mode = WAL")
+        # WAL 模式下 NORMAL 已足夠安全（只在 checkpoint 時 fsync）
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+
+def get_conn(readonly: bool = False) -> sqlite3.Connection:
+    """開一條新的（不經連線池）已設定好 pragma 的連線，給腳本/工具用"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    _configure(conn, readonly)
     return conn
 
 
+# ---- SQL tracing（PA360_SQL_TRACE=1）----
+# 請求開始時 start_trace()，之後同一個請求（包含丟到 threadpool 的同步 route）
+# 透過連線池拿到的連線執行的每個語句，都記到同一個 QueryTrace
+
+_WS_RE = re.compile(r"\s+")
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def normalize_sql(sql: str) -> str:
+    """空白壓成一格、常數換成 ?、IN (?, ?, …) 合併成一個，同一種查詢才會歸在一起"""
+    sql = _LITERAL_RE.sub("?", _WS_RE.sub(" ", sql).strip())
+    return _IN_LIST_RE.sub("(?…)", sql)
+
+
+class TracedQuery:
+    __slots__ = ("sql", "seconds", "rows", "explained")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.seconds = 0.0
+        self.rows = 0
+        self.explained = False
+
+    def as_dict(self) -> dict:
+        return {"sql": self.sql, "ms": round(self.seconds * 1000, 3), "rows": self.rows}
+
+
+class QueryTrace:
+    """一個請求的 SQL 紀錄（只在該請求的 thread/task 間共用）"""
+
+    def __init__(self):
+        self.queries: list[TracedQuery] = []
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+
+    def add(self, sql: str) -> TracedQuery:
+        q = TracedQuery(normalize_sql(sql))
+        self.count += 1
+        if len(self.queries) < SQL_TRACE_MAX:
+            self.queries.append(q)
+        return q
+
+    def record(self, q: TracedQuery, seconds: float, rows: int = 0) -> None:
+        q.seconds += seconds
+        q.rows += rows
+        self.seconds += seconds
+        self.rows += rows
+
+    def summary(self, top: int = 5) -> dict:
+        slowest = sorted(self.queries, key=lambda q: q.seconds, reverse=True)[:top]
+        return {
+            "queries": self.count,
+            "db_ms": round(self.seconds * 1000, 3),
+            "rows": self.rows,
+            "slowest": [q.as_dict() for q in slowest],
+        }
+
+
+_trace: ContextVar[QueryTrace | None] = ContextVar("pa360_sql_trace", default=None)
+
+
+def start_trace():
+    """開始記錄目前請求的 SQL；回傳給 end_trace 用的 token"""
+    return _trace.set(QueryTrace())
+
+
+def current_trace() -> QueryTrace | None:
+    return _trace.get()
+
+
+def end_trace(token) -> None:
+    _trace.reset(token)
+
+
+_EXPLAINABLE_RE = re.compile(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def _maybe_explain(conn: sqlite3.Connection, q: TracedQuery, sql: str, params) -> None:
+    """累計時間超過 SQL_SLOW_MS 時（每個語句一次），把查詢計畫寫進 log：SCAN <table> 就是全表掃描"""
+    if q.explained or SQL_SLOW_MS < 0 or q.seconds * 1000 < SQL_SLOW_MS:
+        return
+    q.explained = True
+    plan = ""
+    if _EXPLAINABLE_RE.match(sql):
+        try:
+            # 用原生 Cursor：不要把 EXPLAIN 本身也記進 trace
+            rows = sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            depth = {0: 0}
+            lines = []
+            for node_id, parent, _, detail in rows:
+                depth[node_id] = depth.get(parent, 0) + 1
+                lines.append("  " * depth[node_id] + detail)
+            plan = "\n" + "\n".join(lines)
+        except sqlite3.Error as e:
+            plan = f"\n  (EXPLAIN failed: {e})"
+    logger.warning("slow query %.1f ms, %d rows: %s%s", q.seconds * 1000, q.rows, q.sql, plan)
+
+
+class TracedCursor(sqlite3.Cursor):
+    """記錄 execute 與逐筆讀取的時間、筆數；沒有進行中的 trace 時直接走原本的實作"""
+
+    _query: TracedQuery | None = None
+
+    def _run(self, method, sql: str, params, many: bool = False) -> None:
+        trace = _trace.get()
+        self._query = None
+        if trace is None:
+            method(sql, params)
+            return
+        q = trace.add(sql)
+        conn = self.connection
+        conn._in_wrapper = True
+        t0 = time.perf_counter()
+        try:
+            method(sql, params)
+        finally:
+            trace.record(q, time.perf_counter() - t0)
+            conn._in_wrapper = False
+        if many:
+            return
+        self._query, self._owner, self._sql, self._params = q, trace, sql, params
+        # 彙總/排序類查詢的成本大多在第一步就花掉了
+        _maybe_explain(conn, q, sql, params)
+
+    def execute(self, sql: str, params=()):
+        self._run(super().execute, sql, params)
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        self._run(super().executemany, sql, seq_of_params, many=True)
+        return self
+
+    def _fetched(self, t0: float, rows: int, done: bool) -> None:
+        q = self._query
+        self._owner.record(q, time.perf_counter() - t0, rows)
+        if done:
+            _maybe_explain(self.connection, q, self._sql, self._params)
+
+    def __next__(self):
+        if self._query is None:
+            return super().__next__()
+        t0 = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(t0, 0, True)
+            raise
+        self._fetched(t0, 1, False)
+        return row
+
+    def fetchone(self):
+        if self._query is None:
+            return super().fetchone()
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(t0, row is not None, True)
+        return row
+
+    def fetchmany(self, size: int | None = None):
+        if self._query is None:
+            return super().fetchmany(size or self.arraysize)
+        t0 = time.perf_counter()
+        rows = super().fetchmany(size or self.arraysize)
+        self._fetched(t0, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        if self._query is None:
+            return super().fetchall()
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(t0, len(rows), True)
+        return rows
+
+
+class TracedConnection(sqlite3.Connection):
+    """
+    連線池在 SQL_TRACE 開啟時用這個連線類別：
+    - conn.execute / executemany 改走 TracedCursor（內建版本不會呼叫被覆寫的 cursor()）
+    - commit / rollback 也計時
+    - sqlite3 的 trace callback 補記不是經由上面這些方法執行的語句（不計時）
+    """
+
+    _in_wrapper = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(self._on_statement)
+
+    def _on_statement(self, sql: str) -> None:
+        if self._in_wrapper:
+            return
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(sql)
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql: str, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def _timed(self, name: str, method) -> None:
+        trace = _trace.get()
+        if trace is None:
+            return method()
+        q = trace.add(name)
+        self._in_wrapper = True
+        t0 = time.perf_counter()
+        try:
+            return method()
+        finally:
+            trace.record(q, time.perf_counter() - t0)
+            self._in_wrapper = False
+
+    def commit(self) -> None:
+        self._timed("COMMIT", super().commit)
+
+    def rollback(self) -> None:
+        self._timed("ROLLBACK", super().rollback)
+
+
+class ConnectionPool:
+    """
+    固定上限的 SQLite 連線池：
+    - 閒置連線以 LIFO 取用（最近用過的連線 cache 比較熱）
+    - 同一個 thread 巢狀取用時，直接沿用它手上那條連線（同一個交易）
+    - 用滿時最多等 DB_POOL_TIMEOUT 秒
+    """
+
+    def __init__(self, path: Path, size: int, readonly: bool = False):
+        self.path = path
+        self.size = max(1, size)
+        self.readonly = readonly
+        self._idle: list[sqlite3.Connection] = []
+        self._all: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        factory = TracedConnection if SQL_TRACE else sqlite3.Connection
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=factory)
+        _configure(conn, self.readonly)
+        return conn
+
+    def checkout(self) -> tuple[sqlite3.Connection, bool]:
+        """回傳 (conn, owned)；owned=False 代表是同 thread 的巢狀取用"""
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            return held, False
+
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise sqlite3.OperationalError("database connection pool exhausted")
+
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+                with self._lock:
+                    self._all.append(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        self._local.conn = conn
+        return conn, True
+
+    def checkin(self, conn: sqlite3.Connection) -> None:
+        self._local.conn = None
+        with self._lock:
+            self._idle.append(conn)
+        self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._all.clear()
+            self._idle.clear()
+
+
+_pools: dict[bool, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(readonly: bool = False) -> ConnectionPool:
+    pool = _pools.get(readonly)
+    # DB_PATH 被換掉（例如測試/匯入工具）時重建連線池
+    if pool is not None and pool.path == DB_PATH:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(readonly)
+        if pool is None or pool.path != DB_PATH:
+            if pool is not None:
+                pool.close()
+            pool = ConnectionPool(DB_PATH, DB_POOL_SIZE, readonly=readonly)
+            _pools[readonly] = pool
+        return pool
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
 @contextmanager
-def db_session():
-    conn = get_conn()
+def _pooled_session(readonly: bool):
+    pool = get_pool(readonly)
+    t0 = time.perf_counter()
+    conn, owned = pool.checkout()
+    if not owned:
+        # 巢狀 session：交給最外層決定 commit/rollback
+        yield conn
+        return
+
     try:
+        if readonly:
+            # 整個 session 共用同一個讀取快照（多個查詢結果一致）
+            conn.execute("BEGIN")
+        else:
+            # 一開始就拿寫入鎖：session 內「先讀舊值再寫」不會被其他寫入插隊
+            conn.execute("BEGIN IMMEDIATE")
+        # 等連線 + 等交易（寫入時是等寫入鎖）的時間
+        metrics.DB_ACQUIRE.observe(time.perf_counter() - t0, ("read" if readonly else "write",))
         yield conn
-        conn.commit()
+        if readonly:
+            conn.rollback()  # 結束讀取交易，釋放 WAL snapshot
+        else:
+            conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
     finally:
-        conn.close()
+        pool.checkin(conn)
 
 
-def init_db() -> None:
-    with db_session() as conn:
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS scores_self (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+@contextmanager
+def db_session():
+    """讀寫 session：正常結束 commit，例外 rollback"""
+    with _pooled_session(readonly=False) as conn:
+        yield conn
+
+
+@contextmanager
+def db_read_session():
+    """唯讀 session（query_only）：給 dashboard 查詢用，WAL 下不會等寫入"""
+    with _pooled_session(readonly=True) as conn:
+        yield conn
+
+
+# 覆寫式分數表的唯一索引：同一 cohort 內同一對 (owner, target) 只能有一筆
+UNIQUE_INDEXES = {
+    "scores_teacher": ("ux_scores_teacher_teacher_target", "cohort_id, teacher_user_id, target_user_id"),
+    "scores_peer": ("ux_scores_peer_rater_target", "cohort_id, rater_user_id, target_user_id"),
+}
+
+
+def dedupe_and_index(conn: sqlite3.Connection, table: str,
+                     spec: tuple[str, str] | None = None) -> None:
+    """
+    先去除重複資料（避免後面建 UNIQUE index 失敗）：
+    保留每組 (owner, target) 中 id 最大的那筆（視為最新），再建立唯一索引
+    spec 預設為 UNIQUE_INDEXES[table]；舊版 migration 會傳入當時的定義
+    """
+    index_name, cols = spec or UNIQUE_INDEXES[table]
+    conn.execute(f"""
+    DELETE FROM {table}
+    WHERE id NOT IN (
+      SELECT MAX(id)
+      FROM {table}
+      GROUP BY {cols}
+    )
+    """)
+    conn.execute(f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS {index_name}
+    ON {table} ({cols})
+    """)
+
+
+# ---- Schema migrations ----
+# 版本記在 PRAGMA user_version；每個 migration 只會執行一次
+# 已是最新版本的 DB 啟動時只讀一次 user_version（不再每次掃整張分數表）
+
+def _m001_score_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS scores_self (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        hp INTEGER NOT NULL,
+        atk INTEGER NOT NULL,
+        def INTEGER NOT NULL,
+        spa INTEGER NOT NULL,
+        spd INTEGER NOT NULL,
+        spe INTEGER NOT NULL
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS scores_peer (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        rater_user_id TEXT NOT NULL,
+        target_user_id TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        hp INTEGER NOT NULL,
+        atk INTEGER NOT NULL,
+        def INTEGER NOT NULL,
+        spa INTEGER NOT NULL,
+        spd INTEGER NOT NULL,
+        spe INTEGER NOT NULL
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS scores_teacher (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        teacher_user_id TEXT NOT NULL,
+        target_user_id TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        hp INTEGER NOT NULL,
+        atk INTEGER NOT NULL,
+        def INTEGER NOT NULL,
+        spa INTEGER NOT NULL,
+        spd INTEGER NOT NULL,
+        spe INTEGER NOT NULL
+    )
+    """)
+
+
+def _m002_dedupe_unique_indexes(conn: sqlite3.Connection) -> None:
+    # 這裡固定用當時（尚無 cohort 欄位）的索引定義
+    # Teacher：同一位老師對同一位學生只保留最新一筆（覆寫）
+    dedupe_and_index(conn, "scores_teacher",
+                     ("ux_scores_teacher_teacher_target", "teacher_user_id, target_user_id"))
+
+    # 同一個 rater 對同一個 target 只保留最新一筆（覆寫）
+    dedupe_and_index(conn, "scores_peer",
+                     ("ux_scores_peer_rater_target", "rater_user_id, target_user_id"))
+
+
+# migration 一經發佈就不再修改；內容一律是當時的 SQL（不呼叫 app.services 的程式），
+# 之後服務端的表格或算法改了，舊 migration 的行為也不會跟著變 —— 要改請新增 migration
+_M_METRICS = ("hp", "atk", "def", "spa", "spd", "spe")
+
+
+def _m_cols(prefix: str) -> str:
+    return ", ".join(f"{prefix}_{m}" for m in _M_METRICS)
+
+
+def _m_fill_aggregates(conn: sqlite3.Connection, keys: tuple[str, ...]) -> None:
+    """
+    從分數表填 student_aggregates（最新自評、老師/同儕份數與總和），再補上加權欄位
+    keys：("user_id",)（migration 3）或 ("cohort_id", "user_id")（migration 5）
+    """
+    sums = ", ".join(f"SUM({m}) AS {m}" for m in _M_METRICS)
+    # teacher / peer 以 target_user_id 為準
+    target_keys = ", ".join("target_user_id AS user_id" if k == "user_id" else k for k in keys)
+    group = ", ".join("target_user_id" if k == "user_id" else k for k in keys)
+
+    def on(alias: str) -> str:
+        return " AND ".join(f"{alias}.{k} = u.{k}" for k in keys)
+
+    conn.execute(f"""
+        INSERT INTO student_aggregates (
+            {", ".join(keys)}, self_id, {_m_cols("self")},
+            teacher_cnt, {_m_cols("teacher_sum")}, peer_cnt, {_m_cols("peer_sum")}
+        )
+        SELECT {", ".join(f"u.{k}" for k in keys)}, s.id, {", ".join(f"s.{m}" for m in _M_METRICS)},
+               COALESCE(t.cnt, 0), {", ".join(f"COALESCE(t.{m}, 0)" for m in _M_METRICS)},
+               COALESCE(p.cnt, 0), {", ".join(f"COALESCE(p.{m}, 0)" for m in _M_METRICS)}
+        FROM (
+            SELECT {", ".join(keys)} FROM scores_self
+            UNION SELECT {target_keys} FROM scores_teacher
+            UNION SELECT {target_keys} FROM scores_peer
+        ) u
+        LEFT JOIN (
+            SELECT * FROM scores_self
+            WHERE id IN (SELECT MAX(id) FROM scores_self GROUP BY {", ".join(keys)})
+        ) s ON {on("s")}
+        LEFT JOIN (
+            SELECT {target_keys}, COUNT(*) AS cnt, {sums} FROM scores_teacher GROUP BY {group}
+        ) t ON {on("t")}
+        LEFT JOIN (
+            SELECT {target_keys}, COUNT(*) AS cnt, {sums} FROM scores_peer GROUP BY {group}
+        ) p ON {on("p")}
+    """)
+
+    # 加權：當時的權重（老師 0.4 / 自評 0.2 / 同儕 0.4），六指標與平均各取小數 2 位
+    rows = conn.execute(f"""
+        SELECT rowid, teacher_cnt, peer_cnt, {_m_cols("self")}, {_m_cols("teacher_sum")}, {_m_cols("peer_sum")}
+        FROM student_aggregates
+        WHERE self_id IS NOT NULL AND teacher_cnt > 0 AND peer_cnt >= 1
+    """).fetchall()
+    updates = []
+    for r in rows:
+        w = [
+            round(0.40 * (r[f"teacher_sum_{m}"] / r["teacher_cnt"]) + 0.20 * float(r[f"self_{m}"])
+                  + 0.40 * (r[f"peer_sum_{m}"] / r["peer_cnt"]), 2)
+            for m in _M_METRICS
+        ]
+        updates.append((*w, round(sum(w) / len(w), 2), r["rowid"]))
+    sets = ", ".join(f"w_{m} = ?" for m in _M_METRICS)
+    conn.executemany(f"UPDATE student_aggregates SET {sets}, w_mean = ? WHERE rowid = ?", updates)
+
+
+def _m003_student_aggregates(conn: sqlite3.Connection) -> None:
+    # 每位學生的彙總表：從現有分數重算（當時以 user_id 為主鍵）
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS student_aggregates (
+            user_id TEXT PRIMARY KEY,
+            self_id INTEGER,
+            {", ".join(f"self_{m} REAL" for m in _M_METRICS)},
+            teacher_cnt INTEGER NOT NULL DEFAULT 0,
+            peer_cnt INTEGER NOT NULL DEFAULT 0,
+            {", ".join(f"teacher_sum_{m} REAL NOT NULL DEFAULT 0" for m in _M_METRICS)},
+            {", ".join(f"peer_sum_{m} REAL NOT NULL DEFAULT 0" for m in _M_METRICS)},
+            {", ".join(f"w_{m} REAL" for m in _M_METRICS)},
+            w_mean REAL
+        )
+    """)
+    conn.execute("DELETE FROM student_aggregates")
+    _m_fill_aggregates(conn, ("user_id",))
+
+
+def _m004_hot_query_indexes(conn: sqlite3.Connection) -> None:
+    # 最新自評：GROUP BY user_id + MAX(id) 可直接走索引
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_scores_self_user_id ON scores_self (user_id, id)")
+    # 依 target 彙總（完成度、收到份數）
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_scores_peer_target ON scores_peer (target_user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_scores_teacher_target ON scores_teacher (target_user_id)")
+
+
+def _m005_cohorts(conn: sqlite3.Connection) -> None:
+    # 分數表加上 cohort_id（既有資料歸到預設 cohort "default"）
+    for table in ("scores_self", "scores_peer", "scores_teacher"):
+        cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        if "cohort_id" not in cols:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN cohort_id TEXT NOT NULL DEFAULT 'default'")
+
+    # 唯一鍵與熱查詢索引都改成 cohort_id 開頭（取代 migration 2、4 建立的索引）
+    conn.execute("DROP INDEX IF EXISTS ux_scores_teacher_teacher_target")
+    conn.execute("DROP INDEX IF EXISTS ux_scores_peer_rater_target")
+    dedupe_and_index(conn, "scores_teacher",
+                     ("ux_scores_teacher_teacher_target", "cohort_id, teacher_user_id, target_user_id"))
+    dedupe_and_index(conn, "scores_peer",
+                     ("ux_scores_peer_rater_target", "cohort_id, rater_user_id, target_user_id"))
+    conn.execute("DROP INDEX IF EXISTS ix_scores_self_user_id")
+    conn.execute("DROP INDEX IF EXISTS ix_scores_peer_target")
+    conn.execute("DROP INDEX IF EXISTS ix_scores_teacher_target")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS ix_scores_self_cohort_user ON scores_self (cohort_id, user_id, id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS ix_scores_peer_cohort_target ON scores_peer (cohort_id, target_user_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS ix_scores_teacher_cohort_target "
+        "ON scores_teacher (cohort_id, target_user_id)"
+    )
+
+    # 彙總表主鍵改為 (cohort_id, user_id)：整張重建
+    conn.execute("DROP TABLE IF EXISTS student_aggregates")
+    conn.execute(f"""
+        CREATE TABLE student_aggregates (
+            cohort_id TEXT NOT NULL,
             user_id TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            hp INTEGER NOT NULL,
-            atk INTEGER NOT NULL,
-            def INTEGER NOT NULL,
-            spa INTEGER NOT NULL,
-            spd INTEGER NOT NULL,
-            spe INTEGER NOT NULL
+            self_id INTEGER,
+            {", ".join(f"self_{m} REAL" for m in _M_METRICS)},
+            teacher_cnt INTEGER NOT NULL DEFAULT 0,
+            peer_cnt INTEGER NOT NULL DEFAULT 0,
+            {", ".join(f"teacher_sum_{m} REAL NOT NULL DEFAULT 0" for m in _M_METRICS)},
+            {", ".join(f"peer_sum_{m} REAL NOT NULL DEFAULT 0" for m in _M_METRICS)},
+            {", ".join(f"w_{m} REAL" for m in _M_METRICS)},
+            w_mean REAL,
+            PRIMARY KEY (cohort_id, user_id)
+        )
+    """)
+    _m_fill_aggregates(conn, ("cohort_id", "user_id"))
+
+
+def _m006_data_version(conn: sqlite3.Connection) -> None:
+    # 分數資料版本號（ETag 用）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
         )
-        """)
+    """)
+    conn.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+
 
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS scores_peer (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+def _m007_rater_stats(conn: sqlite3.Connection) -> None:
+    # 同儕評分者的份數/總和/平方和（寬嚴校正用），由既有的 scores_peer 算出
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS rater_stats (
+            cohort_id TEXT NOT NULL,
             rater_user_id TEXT NOT NULL,
-            target_user_id TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            hp INTEGER NOT NULL,
-            atk INTEGER NOT NULL,
-            def INTEGER NOT NULL,
-            spa INTEGER NOT NULL,
-            spd INTEGER NOT NULL,
-            spe INTEGER NOT NULL
+            cnt INTEGER NOT NULL DEFAULT 0,
+            {", ".join(f"sum_{m} REAL NOT NULL DEFAULT 0" for m in _M_METRICS)},
+            {", ".join(f"sq_{m} REAL NOT NULL DEFAULT 0" for m in _M_METRICS)},
+            PRIMARY KEY (cohort_id, rater_user_id)
         )
-        """)
+    """)
+    conn.execute("DELETE FROM rater_stats")
+    conn.execute(f"""
+        INSERT INTO rater_stats (cohort_id, rater_user_id, cnt, {_m_cols("sum")}, {_m_cols("sq")})
+        SELECT cohort_id, rater_user_id, COUNT(*),
+               {", ".join(f"SUM({m})" for m in _M_METRICS)},
+               {", ".join(f"SUM({m} * {m})" for m in _M_METRICS)}
+        FROM scores_peer
+        GROUP BY cohort_id, rater_user_id
+    """)
+
 
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS scores_teacher (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            teacher_user_id TEXT NOT NULL,
+def _m008_peer_norm_sums(conn: sqlite3.Connection) -> None:
+    # 每位被評者的同儕 z 分數總和（份數 ≥ 2 的 rater，標準差下限 0.5）與份數不足 rater 的原始分數總和
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS peer_norm_sums (
+            cohort_id TEXT NOT NULL,
             target_user_id TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            hp INTEGER NOT NULL,
-            atk INTEGER NOT NULL,
-            def INTEGER NOT NULL,
-            spa INTEGER NOT NULL,
-            spd INTEGER NOT NULL,
-            spe INTEGER NOT NULL
+            z_cnt INTEGER NOT NULL DEFAULT 0,
+            {", ".join(f"z_sum_{m} REAL NOT NULL DEFAULT 0" for m in _M_METRICS)},
+            raw_cnt INTEGER NOT NULL DEFAULT 0,
+            {", ".join(f"raw_sum_{m} REAL NOT NULL DEFAULT 0" for m in _M_METRICS)},
+            PRIMARY KEY (cohort_id, target_user_id)
         )
-        """)
-
-        # Teacher：同一位老師對同一位學生只保留最新一筆（覆寫）
-        # 先去除重複（保留每組 teacher+target id 最大的那筆）
-        conn.execute("""
-        DELETE FROM scores_teacher
-        WHERE id NOT IN (
-          SELECT MAX(id)
-          FROM scores_teacher
-          GROUP BY teacher_user_id, target_user_id
-        )
-        """)
-
-        # 建立唯一索引：同一對 (teacher, target) 只能有一筆
-        conn.execute("""
-        CREATE UNIQUE INDEX IF NOT EXISTS ux_scores_teacher_teacher_target
-        ON scores_teacher (teacher_user_id, target_user_id)
-        """)
-
-        # 同一個 rater 對同一個 target 只保留最新一筆（覆寫）
-        # 先去除重複資料（避免後面建 UNIQUE index 失敗）
-        # 這段會保留每個 (rater_user_id, target_user_id) 中 id 最大的那筆（視為最新）
-        conn.execute("""
-        DELETE FROM scores_peer
-        WHERE id NOT IN (
-          SELECT MAX(id)
-          FROM scores_peer
-          GROUP BY rater_user_id, target_user_id
+    """)
+    conn.create_function("m008_sqrt", 1, math.sqrt, deterministic=True)
+
+    def z(m: str) -> str:
+        mean = f"(r.sum_{m} * 1.0 / r.cnt)"
+        std = f"MAX(m008_sqrt(MAX(r.sq_{m} * 1.0 / r.cnt - {mean} * {mean}, 0.0)), 0.5)"
+        return f"SUM(CASE WHEN r.cnt >= 2 THEN (p.{m} - {mean}) / {std} ELSE 0.0 END)"
+
+    conn.execute("DELETE FROM peer_norm_sums")
+    conn.execute(f"""
+        INSERT INTO peer_norm_sums (
+            cohort_id, target_user_id, z_cnt, {_m_cols("z_sum")}, raw_cnt, {_m_cols("raw_sum")}
         )
-        """)
+        SELECT p.cohort_id, p.target_user_id,
+               SUM(r.cnt >= 2), {", ".join(z(m) for m in _M_METRICS)},
+               SUM(r.cnt < 2), {", ".join(f"SUM(CASE WHEN r.cnt < 2 THEN p.{m} ELSE 0 END)" for m in _M_METRICS)}
+        FROM scores_peer p
+        JOIN rater_stats r ON r.cohort_id = p.cohort_id AND r.rater_user_id = p.rater_user_id
+        GROUP BY p.cohort_id, p.target_user_id
+    """)
+
 
-        # 建立唯一索引：同一對 (rater, target) 只能有一筆
-        conn.execute("""
-        CREATE UNIQUE INDEX IF NOT EXISTS ux_scores_peer_rater_target
-        ON scores_peer (rater_user_id, target_user_id)
-        """)
+MIGRATIONS = [
+    (1, _m001_score_tables),
+    (2, _m002_dedupe_unique_indexes),
+    (3, _m003_student_aggregates),
+    (4, _m004_hot_query_indexes),
+    (5, _m005_cohorts),
+    (6, _m006_data_version),
+    (7, _m007_rater_stats),
+    (8, _m008_peer_norm_sums),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("PRAGMA user_version").fetchone()[0])
+
+
+def migrate(conn: sqlite3.Connection) -> list[int]:
+    """在同一個交易內依序執行尚未套用的 migration，回傳這次套用的版本"""
+    current = schema_version(conn)
+    applied = []
+    for version, step in MIGRATIONS:
+        if version <= current:
+            continue
+        step(conn)
+        conn.execute(f"PRAGMA user_version = {version}")
+        applied.append(version)
+    return applied
+
+
+def init_db() -> list[int]:
+    # 已是最新版本：不拿寫入鎖、不做任何掃描
+    with db_read_session() as conn:
+        if schema_version(conn) >= SCHEMA_VERSION:
+            data_version.load(conn)
+            return []
+
+    with db_session() as conn:
+        applied = migrate(conn)
+        data_version.load(conn)
+        return applied
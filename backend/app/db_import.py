@@ -0,0 +1,184 @@
+# backend/app/db_import.py
+"""
+歷史分數離線匯入（不經 HTTP）：
+
+  cd backend
+  python -m app.db_import self    data/self_2024.csv
+  python -m app.db_import peer    data/peer_2024.ndjson
+  python -m app.db_import teacher data/teacher_2024.csv --batch-size 100000
+  python -m app.db_import peer    data/peer_2023.csv --cohort 2023A
+
+檔案格式（CSV 表頭或 NDJSON 每行一個物件）：
+  self:    [cohort_id], user_id, [created_at], hp, atk, def, spa, spd, spe
+  peer:    [cohort_id], rater_user_id, target_user_id, [created_at], hp, atk, def, spa, spd, spe
+  teacher: [cohort_id], teacher_user_id, target_user_id, [created_at], hp, atk, def, spa, spd, spe
+cohort_id 欄位沒有或留空時用 --cohort（預設 default）
+
+做法：
+- 串流讀檔，每 --batch-size 筆 executemany 一次（記憶體用量固定）
+- peer/teacher 匯入期間先拿掉唯一索引，匯入完用 init_db 相同規則去重
+  （同一對保留 id 最大＝最後寫入的那筆），再把唯一索引建回來
+- 最後重建 student_aggregates、rater_stats 與 peer_norm_sums，並把資料版本 +1
+- 以上全部在同一個交易內：全部成功才 commit；中途失敗（例如檔案格式錯誤）整個 rollback，
+  資料、索引與資料版本都維持匯入前的樣子（欄位值不合法的單筆只會略過並計入 skipped）
+請在服務停止時執行。
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+from app import db
+from app.services import aggregates, data_version, rater_stats
+from app.services.scoring import METRICS
+from app.services.users_csv import DEFAULT_COHORT
+
+KINDS = {
+    # kind: (table, 身分欄位)
+    "self": ("scores_self", ("user_id",)),
+    "peer": ("scores_peer", ("rater_user_id", "target_user_id")),
+    "teacher": ("scores_teacher", ("teacher_user_id", "target_user_id")),
+}
+
+DEFAULT_BATCH_SIZE = 50_000
+
+
+def iter_records(path: Path, fmt: str) -> Iterator[dict]:
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        if fmt == "ndjson":
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def to_row(rec: dict, id_cols: tuple[str, ...], default_created_at: str,
+           default_cohort: str = DEFAULT_COHORT) -> tuple:
+    """一筆紀錄 → INSERT 參數；不合法時丟 ValueError"""
+    ids = [str(rec.get("cohort_id") or "").strip() or default_cohort]
+    for c in id_cols:
+        v = str(rec.get(c) or "").strip()
+        if not v:
+            raise ValueError(f"missing {c}")
+        ids.append(v)
+
+    values = []
+    for m in METRICS:
+        v = int(rec[m])
+        if not 1 <= v <= 10:
+            raise ValueError(f"{m} out of range: {v}")
+        values.append(v)
+
+    created_at = str(rec.get("created_at") or "").strip() or default_created_at
+    return (*ids, created_at, *values)
+
+
+def import_file(path: Path, kind: str, fmt: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                cohort_id: str = DEFAULT_COHORT, log=print) -> dict:
+    table, id_cols = KINDS[kind]
+    cols = ["cohort_id", *id_cols, "created_at", *METRICS]
+    insert_sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+    now = datetime.now(timezone.utc).isoformat()
+
+    db.init_db()
+    conn = db.get_conn()
+    # 大量寫入：加大 page cache
+    conn.execute("PRAGMA cache_size = -262144")
+
+    inserted = 0
+    skipped = 0
+    t0 = time.perf_counter()
+    index = db.UNIQUE_INDEXES.get(table)
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if index:
+            # 匯入期間不維護唯一索引（每筆插入少一次 B-tree 查找/更新）；rollback 時索引也會回來
+            conn.execute(f"DROP INDEX IF EXISTS {index[0]}")
+
+        batch: list[tuple] = []
+        for rec in iter_records(path, fmt):
+            try:
+                batch.append(to_row(rec, id_cols, now, cohort_id))
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+
+            if len(batch) >= batch_size:
+                conn.executemany(insert_sql, batch)
+                inserted += len(batch)
+                batch.clear()
+                elapsed = time.perf_counter() - t0
+                log(f"  {inserted:,} rows  {inserted / elapsed:,.0f} rows/sec")
+
+        if batch:
+            conn.executemany(insert_sql, batch)
+            inserted += len(batch)
+
+        if index:
+            db.dedupe_and_index(conn, table)
+        aggregates.rebuild(conn)
+        rater_stats.rebuild(conn)
+        # 讓 dashboard 的 ETag 失效（服務重啟後讀到新版本）
+        data_version.bump(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "kind": kind,
+        "inserted": inserted,
+        "skipped": skipped,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(inserted / elapsed) if elapsed > 0 else None,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        prog="python -m app.db_import",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    ap.add_argument("kind", choices=sorted(KINDS))
+    ap.add_argument("file", type=Path)
+    ap.add_argument("--format", choices=("csv", "ndjson"), default=None,
+                    help="預設依副檔名判斷（.ndjson/.jsonl 為 NDJSON，其餘 CSV）")
+    ap.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    ap.add_argument("--cohort", default=DEFAULT_COHORT, help="檔案沒有 cohort_id 欄位時歸入的 cohort")
+    ap.add_argument("--db", type=Path, default=None, help="匯入到指定的 SQLite 檔（預設 app/app.db）")
+    args = ap.parse_args(argv)
+
+    if not args.file.exists():
+        print(f"file not found: {args.file}", file=sys.stderr)
+        return 2
+
+    fmt = args.format or ("ndjson" if args.file.suffix.lower() in (".ndjson", ".jsonl") else "csv")
+    if args.db is not None:
+        db.DB_PATH = args.db
+
+    print(f"importing {args.kind} scores from {args.file} ({fmt}) into {db.DB_PATH}")
+    cohort_id = args.cohort.strip() or DEFAULT_COHORT
+    result = import_file(args.file, args.kind, fmt, max(1, args.batch_size), cohort_id)
+    db.close_pools()
+    print(
+        f"done: {result['inserted']:,} inserted, {result['skipped']:,} skipped, "
+        f"{result['seconds']}s, {result['rows_per_sec'] or 0:,} rows/sec"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
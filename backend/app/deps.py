@@ -1,9 +1,16 @@
 # backend/app/deps.py
 from __future__ import annotations
 
-from fastapi import Header, HTTPException, status
+import hashlib
 
-# 先沿用 Step2 的 demo token：demo.<role>.<user_id>
+import orjson
+from fastapi import Header, HTTPException, Response, status
+
+from app.services import tokens
+from app.services.tokens import TokenError
+from app.services.users_csv import DEFAULT_COHORT, get_cohorts, get_student_cohort, get_user
+
+# 登入 token 為 HMAC 簽章、有到期時間（app.services.tokens）；驗證只用 CPU，不查使用者名單
 def get_current_user(authorization: str | None = Header(default=None)) -> dict:
     if not authorization:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
@@ -15,18 +22,108 @@ def get_current_user(authorization: str | None = Header(default=None)) -> dict:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail={"ok": False, "error": "BAD_AUTH_HEADER"})
 
-    if token_type.lower() not in ("bearer", "demo"):
+    if token_type.lower() != "bearer":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail={"ok": False, "error": "BAD_TOKEN_TYPE"})
 
-    if not token.startswith("demo."):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                            detail={"ok": False, "error": "INVALID_TOKEN"})
+    return user_from_token(token.strip())
+
 
-    parts = token.split(".")
-    if len(parts) != 3:
+def user_from_token(token: str) -> dict:
+    """
+    token 本體 → {"role", "user_id", "display_name", "claims"}
+    （WebSocket 無法帶 header，改從 query string 傳進來）
+    """
+    try:
+        claims = tokens.verify(token)
+    except TokenError as e:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                            detail={"ok": False, "error": "INVALID_TOKEN"})
+                            detail={"ok": False, "error": e.args[0]})
+    return {
+        "role": claims["role"],
+        "user_id": claims["sub"],
+        "display_name": claims["name"],
+        "claims": claims,
+    }
+
+
+# ---- Cohort（班級/梯次）----
+
+def cohort_or_404(cohort_id: str | None) -> str:
+    """查詢參數的 cohort_id：未帶時用預設 cohort；名單上沒有的 cohort → 404"""
+    cohort_id = (cohort_id or "").strip() or DEFAULT_COHORT
+    if cohort_id != DEFAULT_COHORT and cohort_id not in get_cohorts():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail={"ok": False, "error": "UNKNOWN_COHORT"})
+    return cohort_id
+
+
+def teacher_can_access(user: dict, cohort_id: str) -> bool:
+    """users.csv 的 teacher cohort_id 欄位留空＝可管理全部 cohort"""
+    teacher = get_user("teacher", user["user_id"])
+    allowed = teacher.get("cohorts") if teacher else None
+    return allowed is None or cohort_id in allowed
+
+
+def teacher_cohort_or_403(user: dict, cohort_id: str | None) -> str:
+    cohort_id = cohort_or_404(cohort_id)
+    if not teacher_can_access(user, cohort_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail={"ok": False, "error": "COHORT_FORBIDDEN"})
+    return cohort_id
+
+
+def student_cohort(user_id: str) -> str:
+    """學生所屬 cohort；不在 users.csv 的帳號歸到預設 cohort"""
+    return get_student_cohort(user_id) or DEFAULT_COHORT
+
+
+# ---- ETag（dashboard 條件式請求）----
+
+def make_etag(*parts) -> str:
+    """由資料版本、名單/分派檔版本等組成的強 ETag"""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 可能是多個以逗號分隔，也可能帶 W/ 前綴（弱比對）
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return etag in tags
+
+
+# 瀏覽器每次都帶 If-None-Match 回來驗證（不直接用本地快取）
+ETAG_CACHE_CONTROL = "private, no-cache"
+
+
+def not_modified_or_none(if_none_match: str | None, etag: str) -> Response | None:
+    """ETag 相符 → 304 Response；否則 None（呼叫端照常產生內容）"""
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304,
+                        headers={"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL})
+    return None
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = ETAG_CACHE_CONTROL
+
+
+# ---- 預先序列化的 JSON（dashboard 大型回應）----
+
+def json_bytes(data) -> bytes:
+    """orjson 序列化；結果可以跟資料一起快取，同一版本只序列化一次"""
+    return orjson.dumps(data)
+
 
-    _, role, user_id = parts
-    return {"role": role, "user_id": user_id}
+def json_response(body: bytes, etag: str | None = None) -> Response:
+    """
+    已序列化的 JSON 直接回傳，不經過 FastAPI 的 jsonable_encoder（上萬位學生的巢狀 dict 逐層走訪要好幾秒）
+    直接回傳 Response 時注入的 response 參數不會生效，ETag 在這裡設定
+    """
+    headers = {"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL} if etag else None
+    return Response(content=body, media_type="application/json", headers=headers)
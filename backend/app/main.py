@@ -1,11 +1,17 @@
+import os
 from pathlib import Path
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from app.api.routes.auth import router as auth_router
 from app.api.routes.scores import router as scores_router
 from app.api.routes.assignments import router as assignments_router
 from app.api.routes.teacher import router as teacher_router
-from app.db import init_db
+from app.db import SQL_TRACE, init_db, close_pools
+from app.middleware import MetricsMiddleware, SqlTraceMiddleware
+from app.services import metrics
+from app.services.completion_hub import hub as completion_hub
+from app.services.write_behind import writer as write_behind
 
 from app.api.routes.master import router as master_router
 
@@ -17,14 +23,33 @@ app.include_router(assignments_router)
 app.include_router(teacher_router)
 app.include_router(master_router)
 
+# 每個 route 的請求數 / 延遲 histogram（/metrics）；PA360_METRICS=0 可關掉
+if os.environ.get("PA360_METRICS", "1") != "0":
+    app.add_middleware(MetricsMiddleware)
+
+# 每個請求的 SQL 次數/時間（Server-Timing header）與慢查詢計畫；PA360_SQL_TRACE=1 才開
+if SQL_TRACE:
+    app.add_middleware(SqlTraceMiddleware)
+
 @app.on_event("startup")
 def _startup():
     init_db()
 
+@app.on_event("shutdown")
+def _shutdown():
+    # 先把排隊中的分數寫完（會推播完成度），再關推播與連線池
+    write_behind.close()
+    completion_hub.close()
+    close_pools()
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 FRONTEND_DIR = PROJECT_ROOT / "frontend"
 app.mount("/", StaticFiles(directory=FRONTEND_DIR, html=True), name="frontend")
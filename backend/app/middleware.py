@@ -0,0 +1,115 @@
+# backend/app/middleware.py
+from __future__ import annotations
+
+import logging
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match, Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import db
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# (method, path) → route 樣板 的快取上限（超過就每次重新比對，不再加進快取）
+ROUTE_CACHE_SIZE = 4096
+
+
+class MetricsMiddleware:
+    """
+    每個 HTTP 請求記錄：次數（method/route/status）、進行中數量、延遲 histogram
+    - route 用樣板（/api/master/summary），靜態檔一律記成 "static"、沒對到的記成 "unmatched"，
+      label 數量固定，不會被任意網址撐爆
+    - 純 ASGI（不用 BaseHTTPMiddleware），每個請求只多一次 dict 查詢與幾次 thread-local 加法
+    WebSocket 不計（長連線，延遲沒有意義）
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes: dict[tuple[str, str], str] = {}
+
+    def _route(self, scope: Scope) -> str:
+        key = (scope["method"], scope["path"])
+        label = self._routes.get(key)
+        if label is None:
+            label = _resolve_route(scope)
+            if len(self._routes) < ROUTE_CACHE_SIZE:
+                self._routes[key] = label
+        return label
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        labels = (method, self._route(scope))
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.HTTP_IN_FLIGHT.inc(labels)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.HTTP_LATENCY.observe(time.perf_counter() - t0, labels)
+            metrics.HTTP_IN_FLIGHT.dec(labels)
+            metrics.HTTP_REQUESTS.inc((*labels, str(status)))
+
+
+class SqlTraceMiddleware:
+    """
+    PA360_SQL_TRACE=1 時才掛上：每個 HTTP 請求開一份 db.QueryTrace，
+    回應加上 Server-Timing: db;dur=<毫秒>;desc="<N> queries", app;dur=<毫秒>
+    （瀏覽器 DevTools 的 Timing 分頁看得到），DEBUG log 另外列出最慢的幾個語句
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = db.start_trace()
+        trace = db.current_trace()
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={trace.seconds * 1000:.2f};desc="{trace.count} queries", '
+                    f"app;dur={(time.perf_counter() - t0) * 1000:.2f}",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            db.end_trace(token)
+            if trace.count and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("%s %s: %s", scope["method"], scope["path"], trace.summary())
+
+
+def _resolve_route(scope: Scope) -> str:
+    partial = None
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.NONE:
+            continue
+        if isinstance(route, Mount):
+            return "static"
+        if match == Match.FULL:
+            return route.path
+        partial = partial or route.path   # path 對到但 method 不對（405）
+    return partial or "unmatched"
@@ -20,5 +20,11 @@ class LoginResponse(BaseModel):
     user_id: str
     display_name: str | None = None
     next_path: str = Field(..., description="前端登入成功後導向的路徑")
-    access_token: str = Field(..., description="示範用 token（之後可換 JWT）")
+    access_token: str = Field(..., description="HMAC 簽章 token（含角色與到期時間）")
     token_type: str = "bearer"
+    expires_at: int | None = Field(default=None, description="token 到期時間（Unix 秒）")
+
+
+class RevokeRequest(BaseModel):
+    role: Role
+    user_id: str = Field(..., min_length=1)
@@ -0,0 +1,37 @@
+# backend/app/schemas/master.py
+from pydantic import BaseModel, Field
+
+from app.services.scoring import W_PEER, W_SELF, W_TEACHER
+
+
+class MatchBatchRequest(BaseModel):
+    # 不給就是全班（只回傳資料齊全的學生）
+    student_ids: list[str] | None = Field(default=None, description="只比對這些學生")
+    top_k: int = Field(default=3, description="每位學生回傳幾筆（1~20）")
+    method: str = Field(
+        default="euclidean",
+        description="euclidean / manhattan / chebyshev / cosine / minkowski",
+    )
+    catalog: str = Field(default="poke", description="參考資料名稱（app/data/catalogs/<name>.csv）")
+    p: float | None = Field(default=None, description="minkowski 的 p（>= 1，預設 2）")
+    weights: list[float] | None = Field(default=None, description="minkowski 的六指標權重")
+    cohort_id: str | None = Field(default=None, description="班級/梯次（預設 default）")
+    peer_source: str = Field(default="raw", description="同儕平均：raw（原始）/ normalized（評分者寬嚴校正）")
+
+
+class WeightScheme(BaseModel):
+    name: str | None = Field(default=None, description="方案名稱（回傳時原樣帶回）")
+    # 數字 = 六指標都用同一個權重；list = 依 hp, atk, def, spa, spd, spe 各自的權重
+    teacher: float | list[float] = Field(default=W_TEACHER, description="老師分數的權重")
+    self_: float | list[float] = Field(default=W_SELF, alias="self", description="自評的權重")
+    peer: float | list[float] = Field(default=W_PEER, description="同儕分數的權重")
+    metric_weights: list[float] | None = Field(default=None, description="總分裡六指標的比重（預設平均）")
+
+
+class WeightSimRequest(BaseModel):
+    schemes: list[WeightScheme] = Field(..., description="要比較的權重方案（最多 1000 組）")
+    normalize: bool = Field(default=True, description="每個指標的老師/自評/同儕權重調成總和 1")
+    top: int = Field(default=10, description="每個方案回傳前幾名（0~100）")
+    movers: int = Field(default=5, description="名次往前/往後最多的各回傳幾位（0~100）")
+    student_ids: list[str] | None = Field(default=None, description="另外回傳這些學生在每個方案的分數與名次")
+    cohort_id: str | None = Field(default=None, description="班級/梯次（預設 default）")
@@ -30,4 +30,32 @@ class OkResponse(BaseModel):
 
 class SubmitTeacherRequest(BaseModel):
     target_user_id: str
-    scores: Scores
\ No newline at end of file
+    scores: Scores
+
+class SubmitTeacherBatchRequest(BaseModel):
+    items: list[SubmitTeacherRequest]
+
+
+class SubmitPeerBatchItem(BaseModel):
+    # 學生送出時可省略（就是自己）；老師匯入線下收集的同儕分數時必填
+    rater_user_id: str | None = None
+    target_user_id: str
+    scores: Scores
+
+
+class SubmitPeerBatchRequest(BaseModel):
+    items: list[SubmitPeerBatchItem]
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    target_user_id: str
+    ok: bool
+    error: str | None = None
+
+
+class BatchResponse(BaseModel):
+    ok: bool = True
+    accepted: int
+    rejected: int
+    results: list[BatchItemResult]
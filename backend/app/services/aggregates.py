@@ -0,0 +1,329 @@
+# backend/app/services/aggregates.py
+from __future__ import annotations
+
+import sqlite3
+import sys
+
+from app.services.scoring import (
+    METRICS,
+    MIN_PEER_RECEIVED_FOR_CALC,
+    row_to_scores,
+    weighted_mean,
+    weighted_scores,
+)
+
+# student_aggregates：每個 (cohort, 學生) 一列的彙總表，跟著每次寫入分數在同一個交易內更新
+# - self_*：最新一筆自評（self_id = scores_self.id）
+# - teacher_cnt / teacher_sum_*：老師評分的份數與總和（平均 = 總和 / 份數）
+# - peer_cnt / peer_sum_*：同儕收到的份數與總和
+# - w_* / w_mean：三者齊全時預先算好的加權六指標與平均
+
+SOURCES = ("teacher", "peer")
+
+
+def _cols(prefix: str) -> list[str]:
+    return [f"{prefix}_{m}" for m in METRICS]
+
+
+def create_table(conn: sqlite3.Connection) -> None:
+    sums = ",\n            ".join(
+        f"{c} REAL NOT NULL DEFAULT 0" for src in SOURCES for c in _cols(f"{src}_sum")
+    )
+    selfs = ",\n            ".join(f"{c} REAL" for c in _cols("self"))
+    weighted = ",\n            ".join(f"{c} REAL" for c in _cols("w"))
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS student_aggregates (
+            cohort_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            self_id INTEGER,
+            {selfs},
+            teacher_cnt INTEGER NOT NULL DEFAULT 0,
+            peer_cnt INTEGER NOT NULL DEFAULT 0,
+            {sums},
+            {weighted},
+            w_mean REAL,
+            PRIMARY KEY (cohort_id, user_id)
+        )
+    """)
+
+
+def _ensure_row(conn: sqlite3.Connection, cohort_id: str, user_id: str) -> None:
+    conn.execute(
+        "INSERT OR IGNORE INTO student_aggregates (cohort_id, user_id) VALUES (?, ?)",
+        (cohort_id, user_id),
+    )
+
+
+def _refresh_weighted(conn: sqlite3.Connection, cohort_id: str, user_id: str) -> None:
+    row = conn.execute(
+        "SELECT * FROM student_aggregates WHERE cohort_id = ? AND user_id = ?", (cohort_id, user_id)
+    ).fetchone()
+    if row is None:
+        return
+
+    item = _row_to_item(row)
+    if item["complete"]:
+        w = weighted_scores(item["teacher_avg"], item["self_latest"], item["peer_avg"])
+        values = [w[m] for m in METRICS] + [weighted_mean(w)]
+    else:
+        values = [None] * (len(METRICS) + 1)
+
+    sets = ", ".join(f"{c} = ?" for c in [*_cols("w"), "w_mean"])
+    conn.execute(
+        f"UPDATE student_aggregates SET {sets} WHERE cohort_id = ? AND user_id = ?",
+        (*values, cohort_id, user_id),
+    )
+
+
+def apply_self(conn: sqlite3.Connection, cohort_id: str, user_id: str, row_id: int,
+               scores: dict) -> None:
+    """新增一筆自評後呼叫：比現有的新（id 較大）才取代最新自評"""
+    _ensure_row(conn, cohort_id, user_id)
+    sets = ", ".join(f"{c} = ?" for c in _cols("self"))
+    cur = conn.execute(
+        f"""
+        UPDATE student_aggregates SET self_id = ?, {sets}
+        WHERE cohort_id = ? AND user_id = ? AND (self_id IS NULL OR self_id < ?)
+        """,
+        (row_id, *[scores[m] for m in METRICS], cohort_id, user_id, row_id),
+    )
+    if cur.rowcount:
+        _refresh_weighted(conn, cohort_id, user_id)
+
+
+def apply_upsert(
+    conn: sqlite3.Connection,
+    source: str,
+    cohort_id: str,
+    target_user_id: str,
+    old: dict | None,
+    new: dict,
+) -> None:
+    """
+    teacher/peer 覆寫式寫入後呼叫：
+    old=None 代表新增（份數 +1），否則是覆寫（總和換掉舊值，份數不變）
+    """
+    if source not in SOURCES:
+        raise ValueError(f"unknown source: {source}")
+
+    _ensure_row(conn, cohort_id, target_user_id)
+    sets = ", ".join(f"{c} = {c} + ?" for c in _cols(f"{source}_sum"))
+    delta = [new[m] - (old[m] if old else 0) for m in METRICS]
+    conn.execute(
+        f"""
+        UPDATE student_aggregates
+        SET {source}_cnt = {source}_cnt + ?, {sets}
+        WHERE cohort_id = ? AND user_id = ?
+        """,
+        (0 if old else 1, *delta, cohort_id, target_user_id),
+    )
+    _refresh_weighted(conn, cohort_id, target_user_id)
+
+
+def fetch_existing(conn: sqlite3.Connection, table: str, owner_col: str, cohort_id: str,
+                   owner_id: str, target_user_id: str) -> dict | None:
+    """upsert 前先讀出舊分數（同一交易內），給 apply_upsert 算差值"""
+    row = conn.execute(
+        f"""
+        SELECT {', '.join(METRICS)} FROM {table}
+        WHERE cohort_id = ? AND {owner_col} = ? AND target_user_id = ?
+        """,
+        (cohort_id, owner_id, target_user_id),
+    ).fetchone()
+    return row_to_scores(row) if row else None
+
+
+def _row_to_item(row) -> dict:
+    teacher_cnt = int(row["teacher_cnt"])
+    peer_cnt = int(row["peer_cnt"])
+    has_self = row["self_id"] is not None
+    teacher_avg = (
+        {m: row[f"teacher_sum_{m}"] / teacher_cnt for m in METRICS} if teacher_cnt else None
+    )
+    peer_avg = {m: row[f"peer_sum_{m}"] / peer_cnt for m in METRICS} if peer_cnt else None
+    self_latest = {m: float(row[f"self_{m}"]) for m in METRICS} if has_self else None
+
+    has_teacher = teacher_cnt > 0
+    has_peer = peer_cnt >= MIN_PEER_RECEIVED_FOR_CALC
+    complete = has_teacher and has_self and has_peer
+
+    weighted = None
+    mean = None
+    if complete and row["w_mean"] is not None:
+        weighted = {m: row[f"w_{m}"] for m in METRICS}
+        mean = row["w_mean"]
+
+    return {
+        "user_id": row["user_id"],
+        "has_teacher": has_teacher,
+        "has_self": has_self,
+        "has_peer": has_peer,
+        "peer_received_count": peer_cnt,
+        "complete": complete,
+        "teacher_avg": teacher_avg,
+        "self_latest": self_latest,
+        "peer_avg": peer_avg,
+        "weighted": weighted,
+        "weighted_mean": mean,
+    }
+
+
+def empty_item(user_id: str) -> dict:
+    return {
+        "user_id": user_id,
+        "has_teacher": False,
+        "has_self": False,
+        "has_peer": False,
+        "peer_received_count": 0,
+        "complete": False,
+        "teacher_avg": None,
+        "self_latest": None,
+        "peer_avg": None,
+        "weighted": None,
+        "weighted_mean": None,
+    }
+
+
+def load_aggregates(conn: sqlite3.Connection, cohort_id: str) -> dict[str, dict]:
+    """回傳該 cohort 的 {user_id: summary item}，只含有任何分數的學生（走主鍵範圍掃描）"""
+    rows = conn.execute("SELECT * FROM student_aggregates WHERE cohort_id = ?", (cohort_id,))
+    return {r["user_id"]: _row_to_item(r) for r in rows}
+
+
+def iter_aggregates(conn: sqlite3.Connection, cohort_id: str):
+    """依 user_id 排序逐列產生 (user_id, summary item)，用 cursor 串流不整批載入"""
+    for r in conn.execute(
+        "SELECT * FROM student_aggregates WHERE cohort_id = ? ORDER BY user_id", (cohort_id,)
+    ):
+        yield r["user_id"], _row_to_item(r)
+
+
+def _compute_from_scores(conn: sqlite3.Connection) -> dict[tuple[str, str], dict]:
+    """直接從分數表 GROUP BY 算出每個 (cohort, 學生) 的彙總（rebuild/check 用）"""
+    metric_sums = ", ".join(f"SUM({m}) AS {m}" for m in METRICS)
+    out: dict[tuple[str, str], dict] = {}
+
+    def slot(r) -> dict:
+        return out.setdefault((r["cohort_id"], r["user_id"]),
+                              {"self_id": None, "self": None,
+                               "teacher_cnt": 0, "teacher_sum": None,
+                               "peer_cnt": 0, "peer_sum": None})
+
+    for r in conn.execute(f"""
+        SELECT s.id, s.cohort_id, s.user_id, {', '.join('s.' + m for m in METRICS)}
+        FROM scores_self s
+        JOIN (
+            SELECT cohort_id, user_id, MAX(id) AS max_id
+            FROM scores_self
+            GROUP BY cohort_id, user_id
+        ) last ON last.max_id = s.id
+    """):
+        d = slot(r)
+        d["self_id"] = r["id"]
+        d["self"] = row_to_scores(r)
+
+    for source, table in (("teacher", "scores_teacher"), ("peer", "scores_peer")):
+        for r in conn.execute(f"""
+            SELECT cohort_id, target_user_id AS user_id, COUNT(*) AS cnt, {metric_sums}
+            FROM {table}
+            GROUP BY cohort_id, target_user_id
+        """):
+            d = slot(r)
+            d[f"{source}_cnt"] = int(r["cnt"])
+            d[f"{source}_sum"] = row_to_scores(r)
+
+    return out
+
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """清空並從分數表重算整張彙總表，回傳 (cohort, 學生) 數"""
+    create_table(conn)
+    conn.execute("DELETE FROM student_aggregates")
+
+    computed = _compute_from_scores(conn)
+    cols = ["cohort_id", "user_id", "self_id", *_cols("self"), "teacher_cnt", "peer_cnt",
+            *_cols("teacher_sum"), *_cols("peer_sum")]
+    rows = []
+    zeros = {m: 0.0 for m in METRICS}
+    for (cohort_id, uid), d in computed.items():
+        self_vals = [d["self"][m] for m in METRICS] if d["self"] else [None] * len(METRICS)
+        rows.append((
+            cohort_id, uid, d["self_id"], *self_vals, d["teacher_cnt"], d["peer_cnt"],
+            *[(d["teacher_sum"] or zeros)[m] for m in METRICS],
+            *[(d["peer_sum"] or zeros)[m] for m in METRICS],
+        ))
+    conn.executemany(
+        f"INSERT INTO student_aggregates ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+        rows,
+    )
+    for cohort_id, uid in computed:
+        _refresh_weighted(conn, cohort_id, uid)
+    return len(computed)
+
+
+def check(conn: sqlite3.Connection) -> list[str]:
+    """比對彙總表與分數表即時計算結果，回傳不一致的「cohort/user_id」"""
+    computed = _compute_from_scores(conn)
+    stored = {(r["cohort_id"], r["user_id"]): r for r in conn.execute("SELECT * FROM student_aggregates")}
+    bad: list[str] = []
+
+    for key in sorted(set(computed) | set(stored)):
+        d = computed.get(key)
+        r = stored.get(key)
+        label = "/".join(key)
+        if d is None:
+            # 彙總表多出來的列只要全是空的就無所謂
+            if r["self_id"] is not None or r["teacher_cnt"] or r["peer_cnt"]:
+                bad.append(label)
+            continue
+        if r is None:
+            bad.append(label)
+            continue
+
+        same = (r["self_id"] == d["self_id"]
+                and r["teacher_cnt"] == d["teacher_cnt"]
+                and r["peer_cnt"] == d["peer_cnt"])
+        for src in SOURCES:
+            sums = d[f"{src}_sum"]
+            if sums:
+                same = same and all(abs(r[f"{src}_sum_{m}"] - sums[m]) < 1e-6 for m in METRICS)
+        if same:
+            item = _row_to_item(r)
+            if item["complete"]:
+                w = weighted_scores(item["teacher_avg"], item["self_latest"], item["peer_avg"])
+                same = item["weighted"] == w
+        if not same:
+            bad.append(label)
+
+    return bad
+
+
+def main(argv: list[str]) -> int:
+    """
+    用法（在 backend/ 底下）：
+      python -m app.services.aggregates rebuild   # 從分數表重建彙總表
+      python -m app.services.aggregates check     # 檢查彙總表是否與分數表一致
+    """
+    from app.db import db_session
+
+    cmd = argv[0] if argv else ""
+    if cmd == "rebuild":
+        with db_session() as conn:
+            n = rebuild(conn)
+        print(f"student_aggregates rebuilt: {n} rows")
+        return 0
+    if cmd == "check":
+        with db_session() as conn:
+            bad = check(conn)
+        if bad:
+            print(f"student_aggregates inconsistent for {len(bad)} students: {', '.join(bad[:20])}")
+            return 1
+        print("student_aggregates OK")
+        return 0
+
+    print(main.__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,163 @@
+# backend/app/services/cohort_stats.py
+from __future__ import annotations
+
+import sqlite3
+import threading
+
+import numpy as np
+
+from app.db import db_read_session
+from app.services import data_version, metrics
+from app.services.scoring import METRICS
+from app.services.single_flight import aggregations
+
+# cohort 統計（master 分析頁）：來源（老師/自評/同儕/加權）× 六指標
+# - 每個分數表只掃一次，cursor 每次取 CHUNK_ROWS 列轉成矩陣累加，記憶體與歷史筆數無關
+# - 平均 / 變異數：每塊先算自己的平均與平方差和，再用 Welford（Chan 的合併公式）併入，不會有大數相減的誤差
+# - 百分位數 sketch：分數範圍 [SCORE_MIN, SCORE_MAX] 以 0.01 為一格計數（901 格），
+#   百分位數誤差最多 0.005（分數本身是整數、加權結果是小數 2 位 → 實際上是精確值）
+# - 直方圖：由同一份計數合併成固定的 HIST_EDGES 區間（以整數分數為中心，寬 1）
+# 結果依資料版本快取：分數沒有再寫入前都直接回傳
+#
+# 自評用全部紀錄（含重複送出），加權用 student_aggregates 裡資料齊全學生的結果
+
+SCORE_MIN = 1.0
+SCORE_MAX = 10.0
+SKETCH_STEP = 0.01
+SKETCH_BINS = int(round((SCORE_MAX - SCORE_MIN) / SKETCH_STEP)) + 1
+# [0.5, 1.5) → 1 分、…、[9.5, 10.5] → 10 分
+HIST_EDGES = tuple(i + 0.5 for i in range(int(SCORE_MIN) - 1, int(SCORE_MAX) + 1))
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+# 每次從 cursor 取幾列
+CHUNK_ROWS = 20_000
+
+_COLS = ", ".join(METRICS)
+SOURCE_SQL = {
+    "teacher": f"SELECT {_COLS} FROM scores_teacher WHERE cohort_id = ?",
+    "self": f"SELECT {_COLS} FROM scores_self WHERE cohort_id = ?",
+    "peer": f"SELECT {_COLS} FROM scores_peer WHERE cohort_id = ?",
+    "weighted": (
+        f"SELECT {', '.join(f'w_{m}' for m in METRICS)} FROM student_aggregates "
+        "WHERE cohort_id = ? AND w_mean IS NOT NULL"
+    ),
+}
+
+
+# 每個 sketch 格子屬於哪個直方圖區間
+_CELL_BIN = np.clip(
+    np.searchsorted(HIST_EDGES, SCORE_MIN + np.arange(SKETCH_BINS) * SKETCH_STEP + 1e-9, side="right") - 1,
+    0, len(HIST_EDGES) - 2,
+)
+
+
+class Accumulator:
+    """一個來源六指標的串流統計；add() 一次吃一塊 (列數, 6) 的矩陣"""
+
+    def __init__(self):
+        k = len(METRICS)
+        self.n = 0
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)           # 與平均的平方差總和
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+        self.counts = np.zeros((k, SKETCH_BINS), dtype=np.int64)
+
+    def add(self, x: np.ndarray) -> None:
+        nb = len(x)
+        if not nb:
+            return
+        mean_b = x.mean(axis=0)
+        m2_b = ((x - mean_b) ** 2).sum(axis=0)
+        n = self.n + nb
+        delta = mean_b - self.mean
+        self.mean += delta * (nb / n)
+        self.m2 += m2_b + delta ** 2 * (self.n * nb / n)
+        self.n = n
+        np.minimum(self.min, x.min(axis=0), out=self.min)
+        np.maximum(self.max, x.max(axis=0), out=self.max)
+
+        # 六個指標一次 bincount：第 j 欄的格子編號加上 j × SKETCH_BINS
+        cells = np.clip(np.rint((x - SCORE_MIN) / SKETCH_STEP), 0, SKETCH_BINS - 1).astype(np.int64)
+        cells += np.arange(len(METRICS), dtype=np.int64) * SKETCH_BINS
+        self.counts += np.bincount(cells.ravel(), minlength=self.counts.size).reshape(self.counts.shape)
+
+    def percentiles(self, j: int) -> dict[str, float]:
+        """nearest-rank：第 p 百分位數 = 由小到大第 ceil(p/100 × n) 個"""
+        cum = np.cumsum(self.counts[j])
+        out = {}
+        for p in PERCENTILES:
+            rank = max(1, int(np.ceil(p / 100 * self.n)))
+            cell = int(np.searchsorted(cum, rank))
+            out[f"p{p}"] = round(SCORE_MIN + cell * SKETCH_STEP, 2)
+        return out
+
+    def histogram(self, j: int) -> list[int]:
+        counts = np.bincount(_CELL_BIN, weights=self.counts[j], minlength=len(HIST_EDGES) - 1)
+        return [int(v) for v in counts]
+
+    def result(self) -> dict:
+        if not self.n:
+            return {"count": 0, "metrics": None}
+        variance = self.m2 / (self.n - 1) if self.n > 1 else np.zeros(len(METRICS))
+        return {
+            "count": self.n,
+            "metrics": {
+                m: {
+                    "mean": round(float(self.mean[j]), 4),
+                    "variance": round(float(variance[j]), 4),
+                    "std": round(float(np.sqrt(variance[j])), 4),
+                    "min": float(self.min[j]),
+                    "max": float(self.max[j]),
+                    **self.percentiles(j),
+                    "histogram": self.histogram(j),
+                }
+                for j, m in enumerate(METRICS)
+            },
+        }
+
+
+def _scan(conn: sqlite3.Connection, sql: str, cohort_id: str) -> Accumulator:
+    acc = Accumulator()
+    cur = conn.cursor()
+    cur.row_factory = None      # tuple 比 sqlite3.Row 快，轉矩陣也直接
+    cur.execute(sql, (cohort_id,))
+    while True:
+        rows = cur.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        acc.add(np.asarray(rows, dtype=np.float64))
+    return acc
+
+
+def compute_stats(cohort_id: str) -> dict:
+    # 四個來源在同一個讀取交易內：同一份快照
+    with db_read_session() as conn:
+        sources = {src: _scan(conn, sql, cohort_id).result() for src, sql in SOURCE_SQL.items()}
+    return {
+        "cohort_id": cohort_id,
+        "percentiles": [f"p{p}" for p in PERCENTILES],
+        "histogram_edges": list(HIST_EDGES),
+        "sources": sources,
+    }
+
+
+_cache: dict[str, tuple[int, dict]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_stats(cohort_id: str) -> tuple[int, dict]:
+    """回傳 (資料版本, 統計)；同一版本只算一次，同時到達的請求共用（結果唯讀，勿修改）"""
+    version = data_version.current()
+    with _cache_lock:
+        hit = _cache.get(cohort_id)
+    if hit is not None and hit[0] == version:
+        metrics.CACHE_REQUESTS.inc(("cohort_stats", "hit"))
+        return hit
+    metrics.CACHE_REQUESTS.inc(("cohort_stats", "miss"))
+    # 版本在計算前讀：計算期間有新寫入時，結果只會比標示的版本新，下一個請求會再重算
+    result = aggregations.do(("cohort_stats", cohort_id, version), lambda: compute_stats(cohort_id))
+    with _cache_lock:
+        old = _cache.get(cohort_id)
+        if old is None or old[0] <= version:
+            _cache[cohort_id] = (version, result)
+    return version, result
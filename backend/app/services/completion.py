@@ -0,0 +1,148 @@
+# backend/app/services/completion.py
+from __future__ import annotations
+
+import sqlite3
+
+from app.db import db_read_session
+from app.services.peer_assignments_csv import AssignmentIndex, get_assignment_index
+from app.services.users_csv import DEFAULT_COHORT, get_student_set, get_students
+
+# 老師完成度：自評 / 同儕送出 / 同儕收到 / 老師評分
+# - compute_completion：全班（/api/teacher/completion）
+# - student_items：只算幾位學生（即時推播的差異更新）
+
+# 完成度統計用的查詢：(結果欄位, 學生欄位, SQL)；SQL 可以再接 AND <學生欄位> IN (...)
+_COUNT_QUERIES = (
+    ("self_submitted", "user_id", """
+        SELECT user_id, COUNT(*) AS cnt
+        FROM scores_self
+        WHERE cohort_id = ?{filter}
+        GROUP BY user_id
+    """),
+    ("peer_given_count", "rater_user_id", """
+        SELECT rater_user_id AS user_id, COUNT(*) AS cnt
+        FROM scores_peer
+        WHERE cohort_id = ?{filter}
+        GROUP BY rater_user_id
+    """),
+    ("peer_received_count", "target_user_id", """
+        SELECT target_user_id AS user_id, COUNT(*) AS cnt
+        FROM scores_peer
+        WHERE cohort_id = ?{filter}
+        GROUP BY target_user_id
+    """),
+    ("teacher_scored", "target_user_id", """
+        SELECT target_user_id AS user_id, COUNT(*) AS cnt
+        FROM scores_teacher
+        WHERE cohort_id = ?{filter}
+        GROUP BY target_user_id
+    """),
+)
+
+# student_items 一次 IN (...) 最多幾位
+_IN_CHUNK = 500
+
+
+def _new_item(sid: str, assignments: AssignmentIndex) -> dict:
+    return {
+        "user_id": sid,
+        "self_submitted": False,
+        "peer_given_count": 0,
+        "peer_received_count": 0,
+        "required_peer_given": assignments.expected_given(sid),
+        "required_peer_received": assignments.expected_received(sid),
+
+        #新增
+        "teacher_scored": False,
+        "required_teacher": 1,
+    }
+
+
+def _fill_counts(conn: sqlite3.Connection, cohort_id: str, result: dict[str, dict],
+                 user_ids: list[str] | None = None) -> None:
+    """把四種份數填進 result；user_ids 給定時只查這些學生（走 cohort_id 開頭的索引）"""
+    for field, col, sql in _COUNT_QUERIES:
+        params: list = [cohort_id]
+        filt = ""
+        if user_ids is not None:
+            filt = f" AND {col} IN ({', '.join('?' * len(user_ids))})"
+            params.extend(user_ids)
+        for r in conn.execute(sql.format(filter=filt), params):
+            uid = r["user_id"]
+            if uid not in result:
+                continue
+            if field == "self_submitted":
+                # 自評：每人只要有一筆，就算完成（也可改成看 latest）
+                result[uid][field] = (r["cnt"] > 0)
+            elif field == "teacher_scored":
+                # 老師評分：target_user_id 只要有一筆就算完成
+                result[uid][field] = (int(r["cnt"]) >= 1)
+            else:
+                result[uid][field] = int(r["cnt"])
+
+
+def _finish(item: dict) -> dict:
+    item["peer_given_done"] = (item["peer_given_count"] >= item["required_peer_given"])
+    item["peer_received_done"] = (item["peer_received_count"] >= item["required_peer_received"])
+
+    # 老師評分是否完成（已在 teacher_scored）
+    item["teacher_done"] = item["teacher_scored"]
+
+    # all_done：自評 + 同儕送出達標 + 老師評分完成
+    item["all_done"] = (item["self_submitted"] and item["peer_given_done"] and item["teacher_done"])
+    return item
+
+
+def compute_completion(cohort_id: str = DEFAULT_COHORT) -> dict:
+    students = get_students(cohort_id)
+    n = len(students)
+
+    # 同儕規則改由 peer_assignments.csv 決定：每人應送出/應收到的份數各自計算
+    assignments = get_assignment_index(cohort_id)
+    # 班級層級的顯示用要求份數（取名單中最多的那位）
+    required_peer_given = max((assignments.expected_given(sid) for sid in students), default=0)
+    required_peer_received = max((assignments.expected_received(sid) for sid in students), default=0)
+
+    # 先把所有人狀態初始化
+    result = {sid: _new_item(sid, assignments) for sid in students}
+
+    with db_read_session() as conn:
+        _fill_counts(conn, cohort_id, result)
+
+    # 統計：哪些人沒交
+    not_submitted_self = [sid for sid in students if not result[sid]["self_submitted"]]
+    not_done_peer_given = [
+        sid for sid in students
+        if result[sid]["peer_given_count"] < result[sid]["required_peer_given"]
+    ]
+    not_done_teacher = [sid for sid in students if not result[sid]["teacher_scored"]]
+
+    # 全班明細（照 roster 順序）
+    detail = [_finish(result[sid]) for sid in students]
+
+    return {
+        "ok": True,
+        "cohort_id": cohort_id,
+        "class_size": n,
+        "required_peer_given": required_peer_given,
+        "required_peer_received": required_peer_received,
+        "not_submitted_self": not_submitted_self,
+        "not_done_peer_given": not_done_peer_given,
+        "detail": detail,
+        "not_done_teacher": not_done_teacher,
+    }
+
+
+def student_items(cohort_id: str, user_ids: list[str]) -> list[dict]:
+    """幾位學生目前的完成度明細（格式同 compute_completion 的 detail），不在名單的略過"""
+    roster = get_student_set(cohort_id)
+    wanted = sorted(uid for uid in set(user_ids) if uid in roster)
+    if not wanted:
+        return []
+
+    assignments = get_assignment_index(cohort_id)
+    result = {sid: _new_item(sid, assignments) for sid in wanted}
+    with db_read_session() as conn:
+        for i in range(0, len(wanted), _IN_CHUNK):
+            _fill_counts(conn, cohort_id, result, wanted[i:i + _IN_CHUNK])
+    return [_finish(result[sid]) for sid in wanted]
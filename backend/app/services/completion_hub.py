@@ -0,0 +1,154 @@
+# backend/app/services/completion_hub.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import threading
+from typing import Iterable
+
+from app.services import data_version, metrics
+from app.services.completion import student_items
+
+logger = logging.getLogger(__name__)
+
+# 每個訂閱者最多累積幾則還沒送出的更新；超過代表連線太慢，改送一次完整 snapshot
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+class Subscriber:
+    """一條推播連線（WebSocket）：只在 event loop 上操作"""
+
+    def __init__(self, cohort_id: str):
+        self.cohort_id = cohort_id
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 丟掉累積的差異更新，改成要求重送完整 snapshot
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+
+
+class CompletionHub:
+    """
+    老師完成度的推播中心（fan-out）：
+    - 分數寫入 commit 後呼叫 publish((cohort_id, user_id), ...)：只把受影響的學生丟進佇列，立刻返回
+    - 背景 thread 一次取出所有待處理的學生，依 cohort 合併，每個 cohort 查一次 DB 算出這些學生的最新狀態
+    - 同一則更新在 event loop 上分送給該 cohort 的所有訂閱者（閒置的訂閱者只佔一個 asyncio.Queue）
+    沒有任何訂閱者的 cohort 完全不做事
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: dict[str, set[Subscriber]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending: queue.SimpleQueue = queue.SimpleQueue()
+        self._worker: threading.Thread | None = None
+        self.published = 0   # 送出的更新則數（每個 cohort 一則算一次）
+
+    # ---- 訂閱（在 event loop 上呼叫）----
+
+    def subscribe(self, cohort_id: str) -> Subscriber:
+        sub = Subscriber(cohort_id)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subs.setdefault(cohort_id, set()).add(sub)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="completion-hub", daemon=True)
+                self._worker.start()
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.cohort_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.cohort_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subs.values())
+
+    # ---- 發布（在寫入的 thread 呼叫）----
+
+    def publish(self, touched: Iterable[tuple[str, str]]) -> None:
+        with self._lock:
+            if not self._subs:
+                return
+            wanted = [(c, uid) for c, uid in touched if c in self._subs]
+        if wanted:
+            self._pending.put(wanted)
+
+    def close(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            self._pending.put(None)
+            self._worker.join(timeout=5)
+        self._worker = None
+
+    # ---- 背景 thread ----
+
+    def _run(self) -> None:
+        while True:
+            batch = self._pending.get()
+            if batch is None:
+                return
+            by_cohort: dict[str, set[str]] = {}
+            stop = False
+            # 把已經排隊的也一起處理（寫入密集時合併成一次查詢）
+            while batch is not None:
+                for cohort_id, uid in batch:
+                    by_cohort.setdefault(cohort_id, set()).add(uid)
+                try:
+                    batch = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                if batch is None:
+                    stop = True
+            for cohort_id, uids in by_cohort.items():
+                try:
+                    self._send(cohort_id, list(uids))
+                except Exception:
+                    logger.exception("completion hub: failed to build delta for %s", cohort_id)
+            if stop:
+                return
+
+    def _send(self, cohort_id: str, user_ids: list[str]) -> None:
+        with self._lock:
+            loop = self._loop
+            if cohort_id not in self._subs or loop is None:
+                return
+        items = student_items(cohort_id, user_ids)
+        if not items:
+            return
+        event = {
+            "type": "delta",
+            "cohort_id": cohort_id,
+            "data_version": data_version.last_seen(),
+            "items": items,
+        }
+        self.published += 1
+        try:
+            loop.call_soon_threadsafe(self._fanout, cohort_id, event)
+        except RuntimeError:
+            pass  # event loop 已關閉
+
+    def _fanout(self, cohort_id: str, event: dict) -> None:
+        with self._lock:
+            subs = list(self._subs.get(cohort_id, ()))
+        for sub in subs:
+            sub.offer(event)
+
+
+hub = CompletionHub()
+
+metrics.Gauge(
+    "pa360_completion_subscribers", "Open teacher completion WebSocket subscriptions.",
+).add_source(lambda: {(): hub.subscriber_count()})
+metrics.Counter(
+    "pa360_completion_deltas_total", "Completion delta events built for subscribers (one per cohort).",
+).add_source(lambda: {(): hub.published})
@@ -0,0 +1,72 @@
+# backend/app/services/data_version.py
+from __future__ import annotations
+
+import sqlite3
+import threading
+
+from app.services.single_flight import aggregations
+
+# 分數資料的版本號：每次分數寫入在同一個交易內 +1（存在 DB，重啟後延續、只增不減）
+# ETag 用的 current() 每次都讀 data_version 表（主鍵查詢），其他 worker 或
+# db_import / datagen 對同一個 DB 的寫入也看得到；看到不是本行程公開的新版本時，
+# 彙總快取（aggregations）一併失效
+# 行程內另外記一份最近看到的值（last_seen），給推播事件標版本用，不碰 DB
+
+_lock = threading.Lock()
+_current = 0
+
+
+def create_table(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+
+
+def bump(conn: sqlite3.Connection) -> int:
+    """在寫入交易內 +1，回傳新版本（commit 後再呼叫 publish）"""
+    conn.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+    return _read(conn)
+
+
+def _read(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+    return int(row[0]) if row else 0
+
+
+def load(conn: sqlite3.Connection) -> int:
+    """啟動時從 DB 讀回目前版本"""
+    publish(_read(conn))
+    return last_seen()
+
+
+def publish(version: int) -> None:
+    global _current
+    with _lock:
+        # 多個寫入交易 commit 順序可能和呼叫 publish 的順序不同：只往前走
+        if version > _current:
+            _current = version
+
+
+def current() -> int:
+    """目前 DB 裡的版本（讀 data_version 表）；跟上次看到的不同時讓彙總快取失效"""
+    from app.db import db_read_session
+
+    with db_read_session() as conn:
+        version = _read(conn)
+    global _current
+    with _lock:
+        changed = version != _current
+        _current = version
+    if changed:
+        # 可能是別的行程寫的（本行程寫入時 score_store 已經 invalidate 過，多做一次無妨）
+        aggregations.invalidate()
+    return version
+
+
+def last_seen() -> int:
+    """最近一次 publish / current() 看到的版本（不碰 DB）"""
+    return _current
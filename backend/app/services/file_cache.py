@@ -0,0 +1,64 @@
+# backend/app/services/file_cache.py
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Generic, TypeVar
+
+from app.services import metrics
+
+T = TypeVar("T")
+
+# (mtime_ns, size)：檔案內容版本的廉價指紋
+FileVersion = tuple[int, int]
+
+
+class FileCache(Generic[T]):
+    """
+    以檔案 mtime/size 為版本的快取：
+    - 第一次 get() 才解析檔案
+    - 之後每次 get() 只做一次 os.stat，版本沒變就直接回傳快取結果
+    - 版本改變（檔案被覆寫/編輯）才重新解析
+    """
+
+    def __init__(self, path: Path, loader: Callable[[Path], T]):
+        self.path = path
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value: T | None = None
+        self._version: FileVersion | None = None
+
+    def _stat_version(self) -> FileVersion:
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self) -> T:
+        try:
+            version = self._stat_version()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{self.path.name} not found: {self.path}") from None
+
+        if version == self._version and self._value is not None:
+            metrics.CACHE_REQUESTS.inc((self.path.name, "hit"))
+            return self._value
+
+        with self._lock:
+            # 可能別的 thread 已經重新載入過
+            if version != self._version or self._value is None:
+                metrics.CACHE_REQUESTS.inc((self.path.name, "miss"))
+                self._value = self._loader(self.path)
+                self._version = version
+            else:
+                metrics.CACHE_REQUESTS.inc((self.path.name, "hit"))
+            return self._value
+
+    @property
+    def version(self) -> FileVersion | None:
+        """目前快取內容對應的檔案版本（尚未載入時為 None）"""
+        return self._version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
+            self._version = None
@@ -0,0 +1,158 @@
+# backend/app/services/matching.py
+from __future__ import annotations
+
+import csv
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from app.services.file_cache import FileCache
+from app.services.nn_index import METHODS, Metric, NNIndex, parse_metric
+from app.services.scoring import METRICS
+from app.services.users_csv import DATA_DIR
+
+POKE_PATH = DATA_DIR / "poke.csv"
+# 其他參考資料（歷屆學生、標竿人設…）：app/data/catalogs/<name>.csv，欄位同 poke.csv
+CATALOG_DIR = DATA_DIR / "catalogs"
+DEFAULT_CATALOG = "poke"
+
+__all__ = ["METHODS", "Metric", "parse_metric", "Catalog", "MatchEngine", "get_match_engine"]
+
+# 批次比對時，每一塊（學生數 × 候選數）距離矩陣的元素上限（float64：4M ≈ 32MB）
+BATCH_MAX_CELLS = 4_000_000
+
+_CATALOG_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+@dataclass(frozen=True)
+class Catalog:
+    """比對用的參考資料（唯讀）：stats 是 n×6 的連續 float64 矩陣，欄位順序同 METRICS"""
+    nums: np.ndarray
+    names: list[str]
+    stats: np.ndarray
+    index: NNIndex
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def load_catalog(path: Path) -> Catalog:
+    nums: list[int] = []
+    names: list[str] = []
+    stats: list[list[float]] = []
+
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        required = {"poke_num", "poke_name", *METRICS}
+        if not reader.fieldnames or not required.issubset(set(reader.fieldnames)):
+            raise ValueError(f"{path.name} missing columns: need {required}, got {reader.fieldnames}")
+
+        for row in reader:
+            try:
+                poke_num = int(row["poke_num"])
+                poke_name = str(row["poke_name"])
+                values = [float(row[m]) for m in METRICS]
+            except Exception:
+                continue
+            nums.append(poke_num)
+            names.append(poke_name)
+            stats.append(values)
+
+    nums_arr = np.asarray(nums, dtype=np.int64)
+    stats_arr = np.ascontiguousarray(np.asarray(stats, dtype=np.float64).reshape(-1, len(METRICS)))
+    # 索引跟著 catalog 版本走：檔案變了整個重建
+    return Catalog(nums=nums_arr, names=names, stats=stats_arr, index=NNIndex(stats_arr, nums_arr))
+
+
+def _as_metric(method: str | Metric) -> Metric:
+    return method if isinstance(method, Metric) else parse_metric(method)
+
+
+class MatchEngine:
+    """
+    參考資料只在檔案變動時重新載入成矩陣（連同最近鄰索引）；
+    每次比對交給 NNIndex（小資料暴力向量化、大資料 KD-tree）
+    """
+
+    def __init__(self, path: Path = POKE_PATH):
+        self._catalog = FileCache(path, load_catalog)
+
+    @property
+    def path(self) -> Path:
+        return self._catalog.path
+
+    def catalog(self) -> Catalog:
+        return self._catalog.get()
+
+    def top_k(self, base: dict, top_k: int, method: str | Metric) -> list[dict]:
+        cat = self.catalog()
+        q = np.asarray([base[m] for m in METRICS], dtype=np.float64)
+        picked = cat.index.query(q, top_k, _as_metric(method))
+        return [result_item(cat, i, dist) for i, dist in picked]
+
+    def top_k_batch(self, bases: dict[str, dict], top_k: int, method: str | Metric) -> dict[str, list[dict]]:
+        """
+        多位學生一次比對：{student_id: weighted} → {student_id: top-k 結果}
+        依 BATCH_MAX_CELLS 分塊計算距離矩陣，記憶體用量與班級人數無關
+        """
+        cat = self.catalog()
+        ids = list(bases)
+        if not ids:
+            return {}
+
+        q = np.asarray([[bases[sid][m] for m in METRICS] for sid in ids], dtype=np.float64)
+        picked = cat.index.query_batch(q, top_k, _as_metric(method), BATCH_MAX_CELLS)
+        return {
+            sid: [result_item(cat, i, dist) for i, dist in rows]
+            for sid, rows in zip(ids, picked)
+        }
+
+    def stats(self) -> dict:
+        cat = self.catalog()
+        return {"path": self.path.name, **cat.index.stats_info.as_dict()}
+
+
+def result_item(cat: Catalog, i: int, dist: float) -> dict:
+    poke_num = int(cat.nums[i])
+    return {
+        "poke_num": poke_num,
+        "poke_name": cat.names[i],
+        "distance": dist,
+        "stats": {m: float(v) for m, v in zip(METRICS, cat.stats[i])},
+        # 台灣官方圖鑑：poke_num 補 4 碼
+        "official_url": f"https://tw.portal-pokemon.com/play/pokedex/{poke_num:04d}",
+    }
+
+
+_engines: dict[str, MatchEngine] = {DEFAULT_CATALOG: MatchEngine(POKE_PATH)}
+_engines_lock = threading.Lock()
+
+
+def list_catalogs() -> list[str]:
+    names = {DEFAULT_CATALOG}
+    if CATALOG_DIR.is_dir():
+        names.update(p.stem for p in CATALOG_DIR.glob("*.csv") if _CATALOG_NAME_RE.match(p.stem))
+    return sorted(names)
+
+
+def get_match_engine(catalog: str = DEFAULT_CATALOG) -> MatchEngine:
+    """依名稱取得參考資料的比對引擎；找不到時丟 KeyError"""
+    engine = _engines.get(catalog)
+    if engine is not None:
+        return engine
+
+    if not _CATALOG_NAME_RE.match(catalog or ""):
+        raise KeyError(catalog)
+    path = CATALOG_DIR / f"{catalog}.csv"
+    if not path.exists():
+        raise KeyError(catalog)
+
+    with _engines_lock:
+        return _engines.setdefault(catalog, MatchEngine(path))
+
+
+def loaded_engines() -> dict[str, MatchEngine]:
+    return dict(_engines)
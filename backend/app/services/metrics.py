@@ -0,0 +1,186 @@
+# backend/app/services/metrics.py
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+# 低成本的 Prometheus 指標（/metrics）：
+# - 每個 thread 各自一份計數（threading.local），寫入時不拿鎖，只有自己的 thread 會改
+# - /metrics 抓取時才把各 thread 的數字加總（複製 dict 在 GIL 下是原子的）
+# - source：抓取時才呼叫的函式，用來匯出其他模組本來就有的統計（不在熱路徑多記一次）
+#
+# label 值一律以 tuple 傳入，順序同 labelnames
+
+# 延遲 histogram 的上界（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[str, ...]
+Source = Callable[[], dict[Labels, float]]
+
+_registry: list["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._shards_lock = threading.Lock()
+        self._sources: list[Source] = []
+        with _registry_lock:
+            _registry.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values: dict = {}
+            self._local.values = values
+            with self._shards_lock:
+                self._shards.append(values)
+            return values
+
+    def _snapshots(self) -> list[dict]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        return [dict(s) for s in shards]
+
+    def add_source(self, fn: Source) -> None:
+        """抓取時另外併入 fn() 回傳的 {labels: value}"""
+        self._sources.append(fn)
+
+    def collect(self) -> dict[Labels, float]:
+        total: dict[Labels, float] = {}
+        for shard in self._snapshots():
+            for labels, v in shard.items():
+                total[labels] = total.get(labels, 0) + v
+        for fn in self._sources:
+            for labels, v in fn().items():
+                total[labels] = total.get(labels, 0) + v
+        return total
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, v in sorted(self.collect().items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        d = self._shard()
+        d[labels] = d.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    """可增可減；各 thread 的增減加總起來就是目前值（例如進行中的請求數）"""
+    kind = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        d = self._shard()
+        d[labels] = d.get(labels, 0) - amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        d = self._shard()
+        h = d.get(labels)
+        if h is None:
+            # 各 bucket 的（非累積）次數 + [+Inf] + [總和]
+            h = d[labels] = [0] * (len(self.buckets) + 2)
+        h[bisect_left(self.buckets, value)] += 1
+        h[-1] += value
+
+    def collect(self) -> dict[Labels, list]:
+        total: dict[Labels, list] = {}
+        for shard in self._snapshots():
+            for labels, h in shard.items():
+                h = list(h)
+                acc = total.get(labels)
+                if acc is None:
+                    total[labels] = h
+                else:
+                    for i, v in enumerate(h):
+                        acc[i] += v
+        return total
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, h in sorted(self.collect().items()):
+            cumulative = 0
+            for le, n in zip((*map(_num, self.buckets), "+Inf"), h):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels((*self.labelnames, 'le'), (*labels, le))} {cumulative}"
+            base = _labels(self.labelnames, labels)
+            yield f"{self.name}_sum{base} {_num(h[-1])}"
+            yield f"{self.name}_count{base} {cumulative}"
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: Labels) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+def _num(v: float) -> str:
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return repr(v)
+
+
+def render() -> str:
+    """所有指標的 Prometheus text format（0.0.4）"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines: list[str] = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ---- 全程式共用的指標 ----
+
+HTTP_REQUESTS = Counter(
+    "pa360_http_requests_total", "HTTP requests by route template and status code.",
+    ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "pa360_http_requests_in_flight", "HTTP requests currently being served.",
+    ("method", "route"),
+)
+HTTP_LATENCY = Histogram(
+    "pa360_http_request_duration_seconds", "HTTP request latency (until the response body is sent).",
+    ("method", "route"),
+)
+DB_ACQUIRE = Histogram(
+    "pa360_db_session_acquire_seconds",
+    "Time to get a pooled SQLite connection and begin the transaction (write = BEGIN IMMEDIATE).",
+    ("mode",),
+)
+CACHE_REQUESTS = Counter(
+    "pa360_cache_requests_total", "Cache lookups by cache and result (hit / miss / coalesced).",
+    ("cache", "result"),
+)
@@ -0,0 +1,327 @@
+# backend/app/services/nn_index.py
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# 支援的距離
+METHODS = ("euclidean", "manhattan", "chebyshev", "cosine", "minkowski")
+
+# 候選數少於這個值時直接暴力計算（建樹/走樹的成本反而比較高）
+BRUTE_FORCE_MAX_ROWS = 50_000
+# KD-tree 葉節點最多幾筆
+LEAF_SIZE = 128
+# 距離四捨五入到小數 4 位後可能平手的容忍值（平手要再比 poke_num）
+TIE_TOL = 1e-4
+
+
+@dataclass(frozen=True)
+class Metric:
+    """
+    距離定義：
+    - euclidean / manhattan / chebyshev
+    - cosine：1 - cos(a, b)
+    - minkowski：(Σ w_j |a_j - b_j|^p)^(1/p)，p >= 1，weights 為各指標權重（預設全 1）
+    """
+    name: str
+    p: float = 2.0
+    weights: tuple[float, ...] | None = None
+
+    def pairwise(self, stats: np.ndarray, bases: np.ndarray) -> np.ndarray:
+        """bases（m×d）對 stats（n×d）的距離矩陣（m×n），逐維累加，不產生 m×n×d 暫存"""
+        m, n = bases.shape[0], stats.shape[0]
+
+        if self.name == "cosine":
+            dots = bases @ stats.T
+            norms = np.linalg.norm(bases, axis=1)[:, None] * np.linalg.norm(stats, axis=1)[None, :]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                sim = np.where(norms > 0, dots / norms, 0.0)
+            return 1.0 - sim
+
+        out = np.zeros((m, n), dtype=np.float64)
+        for j in range(stats.shape[1]):
+            diff = np.abs(bases[:, j, None] - stats[None, :, j])
+            if self.name == "manhattan":
+                out += diff
+            elif self.name == "chebyshev":
+                np.maximum(out, diff, out=out)
+            elif self.name == "minkowski":
+                w = self.weights[j] if self.weights else 1.0
+                out += w * diff ** self.p
+            else:
+                out += diff * diff
+
+        if self.name == "euclidean":
+            np.sqrt(out, out=out)
+        elif self.name == "minkowski":
+            out **= 1.0 / self.p
+        return out
+
+    # ---- KD-tree 用：樹的座標空間與節點下界 ----
+
+    def tree_points(self, x: np.ndarray) -> np.ndarray:
+        """cosine 改在單位向量上用歐式距離找（兩者排序一致）"""
+        if self.name == "cosine":
+            norms = np.linalg.norm(x, axis=-1, keepdims=True)
+            return np.divide(x, norms, out=np.zeros_like(x), where=norms > 0)
+        return x
+
+    def tree_pairwise(self, stats: np.ndarray, q: np.ndarray) -> np.ndarray:
+        if self.name == "cosine":
+            diff = stats - q
+            return np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        return self.pairwise(stats, q[None, :])[0]
+
+    def box_lower_bound(self, q: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> float:
+        gap = np.maximum(np.maximum(lo - q, q - hi), 0.0)
+        if self.name == "manhattan":
+            return float(gap.sum())
+        if self.name == "chebyshev":
+            return float(gap.max())
+        if self.name == "minkowski":
+            w = np.asarray(self.weights) if self.weights else 1.0
+            return float((w * gap ** self.p).sum() ** (1.0 / self.p))
+        return float(np.sqrt((gap * gap).sum()))
+
+    def tree_slack(self, bound: float) -> float:
+        """把「第 k 名距離」放寬到可能四捨五入後平手的範圍（以樹的座標空間表示）"""
+        if self.name == "cosine":
+            # cosine = d_e^2 / 2
+            return float(np.sqrt(bound * bound + 2 * TIE_TOL))
+        return bound + TIE_TOL
+
+
+def select_top_k(d: np.ndarray, nums: np.ndarray, top_k: int) -> list[tuple[int, float]]:
+    """
+    部分排序取前 k 名，回傳 [(索引, 四捨五入後距離)]
+    排序規則：距離（取到小數 4 位）小的優先；平手取 num 小的
+    """
+    n = len(d)
+    if n == 0:
+        return []
+    k = min(top_k, n)
+
+    if k < n:
+        kth = np.partition(d, k - 1)[k - 1]
+        # 放寬一點點，讓四捨五入後可能與第 k 名平手的也進候選
+        cand = np.flatnonzero(d <= kth + TIE_TOL)
+    else:
+        cand = np.arange(n)
+
+    # lexsort：最後一個 key 為主要排序鍵
+    order = cand[np.lexsort((nums[cand], np.round(d[cand], 4)))][:k]
+    return [(int(i), round(float(d[i]), 4)) for i in order]
+
+
+def parse_metric(method: str, p: float | None = None, weights=None) -> Metric:
+    """從 API 參數建立 Metric，不合法時丟 ValueError"""
+    name = (method or "euclidean").lower().strip()
+    if name not in METHODS:
+        raise ValueError("BAD_METHOD")
+
+    if name != "minkowski":
+        return Metric(name)
+
+    try:
+        p = 2.0 if p is None else float(p)
+    except (TypeError, ValueError):
+        raise ValueError("BAD_MINKOWSKI_P") from None
+    if not np.isfinite(p) or p < 1:
+        raise ValueError("BAD_MINKOWSKI_P")
+    w = None
+    if weights is not None:
+        try:
+            w = tuple(float(x) for x in weights)
+        except (TypeError, ValueError):
+            # 不能把 float() 的錯誤訊息直接當成 API 錯誤碼
+            raise ValueError("BAD_METRIC_WEIGHTS") from None
+        if len(w) != 6 or any((not np.isfinite(x)) or x < 0 for x in w):
+            raise ValueError("BAD_METRIC_WEIGHTS")
+    return Metric(name, p=p, weights=w)
+
+
+class KDTree:
+    """
+    陣列版 KD-tree：每個節點記錄外接盒（lo/hi）與 perm 上的 [start, end)
+    以最寬的維度取中位數切分，葉節點最多 LEAF_SIZE 筆
+    """
+
+    def __init__(self, points: np.ndarray, leaf_size: int = LEAF_SIZE):
+        n = points.shape[0]
+        self.points = points
+        self.perm = np.arange(n)
+        lo: list[np.ndarray] = []
+        hi: list[np.ndarray] = []
+        start: list[int] = []
+        end: list[int] = []
+        left: list[int] = []
+        right: list[int] = []
+
+        def new_node(s: int, e: int) -> int:
+            pts = points[self.perm[s:e]]
+            lo.append(pts.min(axis=0))
+            hi.append(pts.max(axis=0))
+            start.append(s)
+            end.append(e)
+            left.append(-1)
+            right.append(-1)
+            return len(start) - 1
+
+        stack = [new_node(0, n)] if n else []
+        while stack:
+            node = stack.pop()
+            s, e = start[node], end[node]
+            if e - s <= leaf_size:
+                continue
+            dim = int(np.argmax(hi[node] - lo[node]))
+            if hi[node][dim] == lo[node][dim]:
+                continue  # 全部重合，不用再切
+            mid = (s + e) // 2
+            idx = self.perm[s:e]
+            order = np.argpartition(points[idx, dim], mid - s)
+            self.perm[s:e] = idx[order]
+            left[node] = new_node(s, mid)
+            right[node] = new_node(mid, e)
+            stack.extend((left[node], right[node]))
+
+        self.lo = np.asarray(lo)
+        self.hi = np.asarray(hi)
+        self.start = start
+        self.end = end
+        self.left = left
+        self.right = right
+
+    def candidates(self, q: np.ndarray, k: int, metric: Metric) -> np.ndarray:
+        """
+        回傳「可能進入前 k 名」的候選索引（含平手容忍範圍），最後由呼叫端精確排序
+        以下界由小到大走訪節點（best-first），下界超過目前第 k 名就剪掉
+        """
+        if not self.start:
+            return np.empty(0, dtype=np.int64)
+
+        best = np.empty(0)
+        bound = np.inf
+        found_idx: list[np.ndarray] = []
+        found_d: list[np.ndarray] = []
+        heap = [(0.0, 0)]
+
+        while heap:
+            lb, node = heapq.heappop(heap)
+            if lb > metric.tree_slack(bound):
+                break
+
+            if self.left[node] < 0:
+                idx = self.perm[self.start[node]:self.end[node]]
+                d = metric.tree_pairwise(self.points[idx], q)
+                merged = np.concatenate([best, d])
+                best = np.partition(merged, k - 1)[:k] if len(merged) > k else merged
+                if len(best) >= k:
+                    bound = float(best.max())
+                keep = d <= metric.tree_slack(bound)
+                found_idx.append(idx[keep])
+                found_d.append(d[keep])
+                continue
+
+            for child in (self.left[node], self.right[node]):
+                clb = metric.box_lower_bound(q, self.lo[child], self.hi[child])
+                if clb <= metric.tree_slack(bound):
+                    heapq.heappush(heap, (clb, child))
+
+        idx = np.concatenate(found_idx)
+        d = np.concatenate(found_d)
+        return idx[d <= metric.tree_slack(bound)]
+
+
+@dataclass
+class IndexStats:
+    size: int
+    strategy: str
+    build_ms: float = 0.0
+    queries: int = 0
+    query_ms_total: float = 0.0
+    query_ms_max: float = 0.0
+    by_strategy: dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        return {
+            "size": self.size,
+            "strategy": self.strategy,
+            "build_ms": round(self.build_ms, 3),
+            "queries": self.queries,
+            "query_ms_avg": round(self.query_ms_total / self.queries, 4) if self.queries else None,
+            "query_ms_max": round(self.query_ms_max, 4),
+            "by_strategy": dict(self.by_strategy),
+        }
+
+
+class NNIndex:
+    """
+    一份參考資料（n×6 矩陣）的最近鄰索引：
+    - 小資料：暴力計算（向量化）
+    - 大資料：依距離種類各自建一棵 KD-tree（第一次用到才建，建好就重用）
+    - 精確 top-k：樹只負責縮小候選，最後一律用 metric.pairwise 精確排序
+    """
+
+    def __init__(self, stats: np.ndarray, nums: np.ndarray, brute_force_max: int = BRUTE_FORCE_MAX_ROWS):
+        self.stats = stats
+        self.nums = nums
+        self.use_tree = len(stats) > brute_force_max
+        self._trees: dict[str, KDTree] = {}
+        self._lock = threading.Lock()
+        self.stats_info = IndexStats(size=len(stats), strategy="kdtree" if self.use_tree else "brute")
+
+    def _tree(self, metric: Metric) -> KDTree:
+        # cosine 用單位向量建樹；其他距離共用原始座標的樹
+        key = "cosine" if metric.name == "cosine" else "raw"
+        tree = self._trees.get(key)
+        if tree is None:
+            with self._lock:
+                tree = self._trees.get(key)
+                if tree is None:
+                    t0 = time.perf_counter()
+                    tree = KDTree(metric.tree_points(self.stats))
+                    self.stats_info.build_ms += (time.perf_counter() - t0) * 1000
+                    self._trees[key] = tree
+        return tree
+
+    def _record(self, strategy: str, ms: float, count: int = 1) -> None:
+        info = self.stats_info
+        info.queries += count
+        info.query_ms_total += ms
+        info.query_ms_max = max(info.query_ms_max, ms / max(count, 1))
+        info.by_strategy[strategy] = info.by_strategy.get(strategy, 0) + count
+
+    def query(self, base: np.ndarray, k: int, metric: Metric) -> list[tuple[int, float]]:
+        """回傳 [(索引, 四捨五入後距離)]，排序：距離小優先，平手取 num 小的"""
+        tree = self._tree(metric) if self.use_tree else None  # 建樹時間另計在 build_ms
+        t0 = time.perf_counter()
+        if tree is not None:
+            cand = tree.candidates(metric.tree_points(base), k, metric)
+            d = metric.pairwise(self.stats[cand], base[None, :])[0]
+            picked = [(int(cand[i]), dist) for i, dist in select_top_k(d, self.nums[cand], k)]
+            strategy = "kdtree"
+        else:
+            d = metric.pairwise(self.stats, base[None, :])[0]
+            picked = select_top_k(d, self.nums, k)
+            strategy = "brute"
+        self._record(strategy, (time.perf_counter() - t0) * 1000)
+        return picked
+
+    def query_batch(self, bases: np.ndarray, k: int, metric: Metric,
+                    max_cells: int) -> list[list[tuple[int, float]]]:
+        """多筆查詢；暴力模式以分塊距離矩陣計算，樹模式逐筆走樹"""
+        if self.use_tree:
+            return [self.query(b, k, metric) for b in bases]
+
+        t0 = time.perf_counter()
+        out: list[list[tuple[int, float]]] = []
+        chunk = max(1, max_cells // max(1, len(self.stats)))
+        for s in range(0, len(bases), chunk):
+            block = metric.pairwise(self.stats, bases[s:s + chunk])
+            out.extend(select_top_k(row, self.nums, k) for row in block)
+        self._record("brute", (time.perf_counter() - t0) * 1000, count=len(bases))
+        return out
@@ -0,0 +1,194 @@
+# backend/app/services/peer_assignment_gen.py
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+import numpy as np
+
+# 同儕分派產生器（k-regular）：
+# 1. 學生以 seed 洗牌排成一個環
+# 2. 環上第 p 位評 p+1 … p+k（就是原本 students[(i+1)%n]、students[(i+2)%n] 的做法，推廣到 k 位）
+#    → 每人剛好送出 k 份、收到 k 份，不會評自己；k < n/2 時也不會互評（p 評 q 代表 q 在 p 之後 1~k 位）
+# 3. 有分組（team）時：環上相距 1~k 的兩人同組就是衝突，把衝突的位置跟隨機位置交換，
+#    交換後兩個位置都沒有衝突才保留（其他人的配對不受影響）
+#    組別很大、條件很緊時隨機起點可能修不完，改用「同組的人輪流發到各排」的起點再修一次
+# 整體 O(N·k)；衝突修正只處理少數位置
+
+# 每個衝突位置最多試幾次交換
+REPAIR_TRIES = 200
+
+
+class AssignmentError(ValueError):
+    """條件無法滿足（人數太少、k 太大、某一組人數太多…）"""
+
+
+@dataclass(frozen=True)
+class AssignmentPlan:
+    """環狀分派：order[p] 評 order[(p + s) % n]，s ∈ offsets"""
+    order: list[str]
+    offsets: tuple[int, ...]
+
+    def __len__(self) -> int:
+        return len(self.order) * len(self.offsets)
+
+    def pairs(self) -> Iterator[tuple[str, str]]:
+        """(rater, target)，同一位 rater 的 k 筆連在一起"""
+        order, n = self.order, len(self.order)
+        for p, rater in enumerate(order):
+            for s in self.offsets:
+                yield rater, order[(p + s) % n]
+
+
+def _check_sizes(n: int, k: int, no_reciprocal: bool) -> None:
+    if k < 1:
+        raise AssignmentError("k must be at least 1")
+    limit = (n - 1) // 2 if no_reciprocal else n - 1
+    if k > limit:
+        raise AssignmentError(
+            f"k={k} is too large for {n} students"
+            + (" without reciprocal pairs" if no_reciprocal else "") + f" (max {limit})"
+        )
+
+
+def plan_assignments(students: list[str], k: int, seed: int | None = None, *,
+                     no_reciprocal: bool = False, team_of: dict[str, str] | None = None) -> AssignmentPlan:
+    """
+    students：同一個 cohort 的學生（不可重複）
+    team_of：user_id → 組別；給了就不會分到同組的人（沒有組別的學生不受限）
+    """
+    n = len(students)
+    if len(set(students)) != n:
+        raise AssignmentError("duplicate student ids")
+    _check_sizes(n, k, no_reciprocal)
+
+    rng = np.random.default_rng(seed)
+    order = [students[i] for i in rng.permutation(n).tolist()]
+    offsets = tuple(range(1, k + 1))
+
+    if team_of:
+        # 同組的 m 人在環上兩兩至少相隔 k+1 個位置 → 需要 m·(k+1) <= n
+        sizes = Counter(team_of[u] for u in students if team_of.get(u))
+        biggest = max(sizes.values(), default=0)
+        if biggest * (k + 1) > n:
+            raise AssignmentError(f"a team of {biggest} is too large to keep apart with k={k}")
+        if not _separate_teams(order, offsets, team_of, rng):
+            order = _spread_order(students, team_of, biggest, rng)
+            if not _separate_teams(order, offsets, team_of, rng):
+                raise AssignmentError("could not keep teams apart; try a smaller k or another seed")
+    return AssignmentPlan(order=order, offsets=offsets)
+
+
+def _spread_order(students: list[str], team_of: dict[str, str], rows: int,
+                  rng: np.random.Generator) -> list[str]:
+    """
+    依組別排好（大組在前、組內洗牌）後，一個一個輪流發到 rows 排，再一排一排接起來：
+    同組的人（rows 人以內）會落在不同排的同一欄附近，彼此在環上相隔約 n/rows 個位置
+    """
+    groups: dict[str, list[str]] = {}
+    for u in students:
+        groups.setdefault(team_of.get(u) or f"\0{u}", []).append(u)
+    names = list(groups)
+    rng.shuffle(names)
+    ordered: list[str] = []
+    for name in sorted(names, key=lambda g: -len(groups[g])):
+        members = groups[name]
+        rng.shuffle(members)
+        ordered.extend(members)
+    dealt: list[list[str]] = [[] for _ in range(rows)]
+    for j, u in enumerate(ordered):
+        dealt[j % rows].append(u)
+    return [u for row in dealt for u in row]
+
+
+def _separate_teams(order: list[str], offsets: tuple[int, ...], team_of: dict[str, str],
+                    rng: np.random.Generator) -> bool:
+    """原地交換 order，讓環上相距 1~k 的兩人不同組；修不完回傳 False"""
+    n = len(order)
+    # 組別轉成整數代碼；沒有組別的人各自一組（-1 - 位置，彼此不相等）
+    codes: dict[str, int] = {}
+    team = [codes.setdefault(team_of[u], len(codes)) if team_of.get(u) else -1 - i
+            for i, u in enumerate(order)]
+
+    # 向量化找出所有衝突位置
+    t = np.asarray(team)
+    bad = np.zeros(n, dtype=bool)
+    for s in offsets:
+        same = t == np.roll(t, -s)      # p 與 p+s 同組
+        bad |= same | np.roll(same, s)
+
+    def conflict(p: int) -> bool:
+        tp = team[p]
+        return any(team[(p + s) % n] == tp or team[(p - s) % n] == tp for s in offsets)
+
+    for p in np.flatnonzero(bad).tolist():
+        if not conflict(p):
+            continue      # 之前的交換已經順便修好了
+        for q in rng.integers(0, n, size=REPAIR_TRIES).tolist():
+            if q == p:
+                continue
+            order[p], order[q] = order[q], order[p]
+            team[p], team[q] = team[q], team[p]
+            if not conflict(p) and not conflict(q):
+                break
+            order[p], order[q] = order[q], order[p]
+            team[p], team[q] = team[q], team[p]
+        else:
+            return False
+    return True
+
+
+def validate_assignments(pairs: Iterable[tuple[str, str]], students: Iterable[str], k: int | None = None, *,
+                         no_reciprocal: bool = False, team_of: dict[str, str] | None = None,
+                         limit: int = 20) -> list[str]:
+    """
+    檢查分派是否平衡且符合條件，回傳問題描述（最多 limit 筆，空 list = 沒問題）：
+    不在名單、評自己、重複、送出/收到份數不是 k（k=None 時只要求全部一樣）、互評、同組
+    """
+    roster = set(students)
+    problems: list[str] = []
+
+    def problem(msg: str) -> bool:
+        problems.append(msg)
+        return len(problems) >= limit
+
+    given: Counter[str] = Counter()
+    received: Counter[str] = Counter()
+    seen: set[tuple[str, str]] = set()
+    for rater, target in pairs:
+        if rater not in roster or target not in roster:
+            if problem(f"not in roster: {rater} -> {target}"):
+                return problems
+            continue
+        if rater == target:
+            if problem(f"self rating: {rater}"):
+                return problems
+        if (rater, target) in seen:
+            if problem(f"duplicate: {rater} -> {target}"):
+                return problems
+            continue
+        seen.add((rater, target))
+        given[rater] += 1
+        received[target] += 1
+        if team_of and team_of.get(rater) and team_of.get(rater) == team_of.get(target):
+            if problem(f"same team ({team_of[rater]}): {rater} -> {target}"):
+                return problems
+
+    if no_reciprocal:
+        for rater, target in seen:
+            if rater < target and (target, rater) in seen:
+                if problem(f"reciprocal: {rater} <-> {target}"):
+                    return problems
+
+    expected = k
+    if expected is None:
+        expected = Counter(given[s] for s in roster).most_common(1)[0][0] if roster else 0
+    for s in sorted(roster):
+        if given[s] != expected:
+            if problem(f"{s} gives {given[s]} (expected {expected})"):
+                return problems
+        if received[s] != expected:
+            if problem(f"{s} receives {received[s]} (expected {expected})"):
+                return problems
+    return problems
@@ -1,26 +1,45 @@
 from __future__ import annotations
 
 import csv
+from dataclasses import dataclass
 from pathlib import Path
 
-ASSIGNMENTS_CSV_PATH = Path(__file__).resolve().parents[1] / "data" / "peer_assignments.csv"
-# services/ 往上 1 層是 app/，所以 app/data/peer_assignments.csv
+from app.services.file_cache import FileCache, FileVersion
+from app.services.users_csv import DATA_DIR, DEFAULT_COHORT
 
-def load_peer_assignments() -> dict[str, list[str]]:
+ASSIGNMENTS_CSV_PATH = DATA_DIR / "peer_assignments.csv"
+# 預設是 app/data/peer_assignments.csv（PA360_DATA_DIR 可換掉）
+
+
+@dataclass(frozen=True)
+class AssignmentIndex:
     """
-    回傳：
-    {
-      "S01": ["S02","S03"],
-      "S02": ["S03","S04"],
-      ...
-    }
+    peer_assignments.csv 的索引（唯讀，勿修改內容）：
+    - targets:     rater → 依檔案順序的 target 清單（給 /api/assignments/peers）
+    - target_sets: rater → target 集合（送出驗證用，O(1)）
+    - raters:      target → 依檔案順序的 rater 清單（反向索引）
     """
-    if not ASSIGNMENTS_CSV_PATH.exists():
-        raise FileNotFoundError(f"peer_assignments.csv not found: {ASSIGNMENTS_CSV_PATH}")
+    targets: dict[str, list[str]]
+    target_sets: dict[str, frozenset[str]]
+    raters: dict[str, list[str]]
+
+    def is_assigned(self, rater_id: str, target_id: str) -> bool:
+        s = self.target_sets.get(rater_id)
+        return s is not None and target_id in s
 
-    mapping: dict[str, list[str]] = {}
+    def expected_given(self, user_id: str) -> int:
+        """這位學生應送出幾份同儕評分"""
+        return len(self.targets.get(user_id, ()))
 
-    with ASSIGNMENTS_CSV_PATH.open("r", encoding="utf-8-sig", newline="") as f:
+    def expected_received(self, user_id: str) -> int:
+        """這位學生應收到幾份同儕評分"""
+        return len(self.raters.get(user_id, ()))
+
+
+def _read_assignments_csv(path: Path) -> list[tuple[str, str, str]]:
+    """回傳 [(cohort_id, rater, target)]；沒有 cohort_id 欄位（或留空）時歸到 DEFAULT_COHORT"""
+    pairs: list[tuple[str, str, str]] = []
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
         reader = csv.DictReader(f)
         required = {"rater_id", "target_id"}
         if not reader.fieldnames or not required.issubset(set(reader.fieldnames)):
@@ -29,13 +48,71 @@ def load_peer_assignments() -> dict[str, list[str]]:
         for row in reader:
             rater = (row.get("rater_id") or "").strip()
             target = (row.get("target_id") or "").strip()
+            cohort = (row.get("cohort_id") or "").strip() or DEFAULT_COHORT
             if not rater or not target:
                 continue
-            mapping.setdefault(rater, []).append(target)
+            pairs.append((cohort, rater, target))
+    return pairs
+
+
+def _build_indexes(path: Path) -> dict[str, AssignmentIndex]:
+    targets: dict[str, dict[str, list[str]]] = {}
+    raters: dict[str, dict[str, list[str]]] = {}
+    seen: set[tuple[str, str, str]] = set()
+
+    for cohort, rater, target in _read_assignments_csv(path):
+        # 重複列只算一次
+        if (cohort, rater, target) in seen:
+            continue
+        seen.add((cohort, rater, target))
+        targets.setdefault(cohort, {}).setdefault(rater, []).append(target)
+        raters.setdefault(cohort, {}).setdefault(target, []).append(rater)
+
+    return {
+        cohort: AssignmentIndex(
+            targets=t,
+            target_sets={r: frozenset(ts) for r, ts in t.items()},
+            raters=raters[cohort],
+        )
+        for cohort, t in targets.items()
+    }
+
+
+_EMPTY_INDEX = AssignmentIndex(targets={}, target_sets={}, raters={})
+
+# 全程式共用一份（每個 cohort 一個索引）：檔案 mtime/size 沒變就不重新解析
+_index = FileCache(ASSIGNMENTS_CSV_PATH, _build_indexes)
+
+
+def get_assignment_index(cohort_id: str = DEFAULT_COHORT) -> AssignmentIndex:
+    return _index.get().get(cohort_id, _EMPTY_INDEX)
+
+
+def get_assignments_version() -> FileVersion | None:
+    """peer_assignments.csv 目前內容的版本（先確認快取是最新的）"""
+    _index.get()
+    return _index.version
+
+
+def load_peer_assignments(cohort_id: str = DEFAULT_COHORT) -> dict[str, list[str]]:
+    """
+    回傳：
+    {
+      "S01": ["S02","S03"],
+      "S02": ["S03","S04"],
+      ...
+    }
+    """
+    return get_assignment_index(cohort_id).targets
+
+
+def get_targets_for_rater(rater_id: str, cohort_id: str = DEFAULT_COHORT) -> list[str]:
+    return get_assignment_index(cohort_id).targets.get(rater_id, [])
+
 
-    return mapping
+def get_raters_for_target(target_id: str, cohort_id: str = DEFAULT_COHORT) -> list[str]:
+    return get_assignment_index(cohort_id).raters.get(target_id, [])
 
 
-def get_targets_for_rater(rater_id: str) -> list[str]:
-    mapping = load_peer_assignments()
-    return mapping.get(rater_id, [])
+def is_assigned(rater_id: str, target_id: str, cohort_id: str = DEFAULT_COHORT) -> bool:
+    return get_assignment_index(cohort_id).is_assigned(rater_id, target_id)
@@ -0,0 +1,428 @@
+# backend/app/services/rater_stats.py
+from __future__ import annotations
+
+import math
+import sqlite3
+import sys
+import threading
+
+import numpy as np
+
+from app.services import data_version
+from app.services.scoring import METRICS, row_to_scores, weighted_mean, weighted_scores
+from app.services.single_flight import aggregations
+
+# 同儕評分者寬嚴校正：
+# rater_stats：每個 (cohort, rater) 一列，記錄他送出的同儕分數份數、六指標總和與平方和，
+# 跟著每次 peer 寫入在同一個交易內更新（覆寫時先扣掉舊分數再加新分數）→ 隨時可得平均與變異數
+#
+# 校正後的同儕平均（peer_source=normalized）：
+# 1. 每份分數換成 z = (分數 - 該 rater 平均) / 該 rater 標準差（六指標各自算）
+# 2. 每位被評者的 z 取平均，再換回全 cohort 同儕分數的尺度：全體平均 + 全體標準差 × 平均 z
+# 份數少於 MIN_RATER_COUNT 的 rater 沒有足夠資訊判斷寬嚴，用全體平均/標準差代替；
+# 標準差至少 MIN_STD（每份都打一樣的 rater 不會除以 0）
+#
+# peer_norm_sums：每個 (cohort, 被評者) 一列，也在寫入交易內更新
+# - z_cnt / z_sum_*：份數足夠的 rater 給的分數，以該 rater 目前的平均/標準差換算的 z 總和
+# - raw_cnt / raw_sum_*：份數不足的 rater 給的原始分數總和；全體平均/標準差每次寫入都會變，
+#   但 z 對它們是線性的 → 讀取時 (raw_sum - raw_cnt × 全體平均) / 全體標準差 一次換算
+# 一位 rater 送出/覆寫一份分數，他的平均/標準差跟著變 → 重算他評過的每一位（k 位）的貢獻差值
+# 讀取只掃 peer_norm_sums（每位學生一列），與同儕分數筆數無關
+
+PEER_SOURCES = ("raw", "normalized")
+
+MIN_RATER_COUNT = 2
+MIN_STD = 0.5
+SCORE_MIN = 1.0
+SCORE_MAX = 10.0
+# 一次查詢帶幾位 rater
+_FETCH_CHUNK = 300
+
+
+def _cols(prefix: str) -> list[str]:
+    return [f"{prefix}_{m}" for m in METRICS]
+
+
+_SUM_COLS = _cols("sum")
+_SQ_COLS = _cols("sq")
+_DELTA_COLS = ["cnt", *_SUM_COLS, *_SQ_COLS]
+# peer_norm_sums 的累加欄位（順序同 _target_deltas 的 list）
+_NORM_COLS = ["z_cnt", *_cols("z_sum"), "raw_cnt", *_cols("raw_sum")]
+
+
+def create_table(conn: sqlite3.Connection) -> None:
+    cols = ",\n            ".join(f"{c} REAL NOT NULL DEFAULT 0" for c in [*_SUM_COLS, *_SQ_COLS])
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS rater_stats (
+            cohort_id TEXT NOT NULL,
+            rater_user_id TEXT NOT NULL,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            {cols},
+            PRIMARY KEY (cohort_id, rater_user_id)
+        )
+    """)
+    norm = ",\n            ".join(
+        f"{c} INTEGER NOT NULL DEFAULT 0" if c.endswith("cnt") else f"{c} REAL NOT NULL DEFAULT 0"
+        for c in _NORM_COLS
+    )
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS peer_norm_sums (
+            cohort_id TEXT NOT NULL,
+            target_user_id TEXT NOT NULL,
+            {norm},
+            PRIMARY KEY (cohort_id, target_user_id)
+        )
+    """)
+
+
+_APPLY_SQL = f"""
+    INSERT INTO rater_stats (cohort_id, rater_user_id, {', '.join(_DELTA_COLS)})
+    VALUES (?, ?, {', '.join('?' * len(_DELTA_COLS))})
+    ON CONFLICT(cohort_id, rater_user_id) DO UPDATE SET
+        {', '.join(f'{c} = {c} + excluded.{c}' for c in _DELTA_COLS)}
+"""
+_APPLY_NORM_SQL = f"""
+    INSERT INTO peer_norm_sums (cohort_id, target_user_id, {', '.join(_NORM_COLS)})
+    VALUES (?, ?, {', '.join('?' * len(_NORM_COLS))})
+    ON CONFLICT(cohort_id, target_user_id) DO UPDATE SET
+        {', '.join(f'{c} = {c} + excluded.{c}' for c in _NORM_COLS)}
+"""
+
+
+def _delta(old: dict | None, new: dict) -> list[float]:
+    """覆寫：份數不變、總和與平方和換掉舊值；新增：份數 +1"""
+    return [
+        0 if old else 1,
+        *[new[m] - (old[m] if old else 0) for m in METRICS],
+        *[new[m] ** 2 - (old[m] ** 2 if old else 0) for m in METRICS],
+    ]
+
+
+def _rater_params(row) -> tuple[list[float], list[float]] | None:
+    """rater 的 (平均, 標準差 ≥ MIN_STD)；沒有紀錄或份數不足 → None（以原始分數計入 raw_*）"""
+    if row is None or row["cnt"] < MIN_RATER_COUNT:
+        return None
+    cnt = row["cnt"]
+    mean = [row[c] / cnt for c in _SUM_COLS]
+    std = [max(math.sqrt(max(row[q] / cnt - mu * mu, 0.0)), MIN_STD) for q, mu in zip(_SQ_COLS, mean)]
+    return mean, std
+
+
+def _contribution(params, scores: dict) -> list[float]:
+    """一份分數對被評者那一列的貢獻（順序同 _NORM_COLS）"""
+    k = len(METRICS)
+    if params is None:
+        return [0, *[0.0] * k, 1, *[scores[m] for m in METRICS]]
+    mean, std = params
+    return [1, *[(scores[m] - mu) / sd for m, mu, sd in zip(METRICS, mean, std)], 0, *[0.0] * k]
+
+
+def _by_rater(conn: sqlite3.Connection, sql: str, keys: list[tuple[str, str]]):
+    """sql 的 WHERE 帶 {keys}：分批以 (cohort_id, rater_user_id) IN (VALUES ...) 查詢"""
+    for i in range(0, len(keys), _FETCH_CHUNK):
+        chunk = keys[i:i + _FETCH_CHUNK]
+        values = ", ".join("(?, ?)" for _ in chunk)
+        yield from conn.execute(sql.format(keys=f"(cohort_id, rater_user_id) IN (VALUES {values})"),
+                                [x for key in chunk for x in key])
+
+
+def _fetch_stats(conn: sqlite3.Connection, keys: list[tuple[str, str]]) -> dict[tuple[str, str], tuple]:
+    return {
+        (r["cohort_id"], r["rater_user_id"]): r
+        for r in _by_rater(conn, "SELECT * FROM rater_stats WHERE {keys}", keys)
+    }
+
+
+def apply_upsert(conn: sqlite3.Connection, cohort_id: str, rater_user_id: str,
+                 old: dict | None, new: dict, target_user_id: str) -> None:
+    """peer 覆寫式寫入後呼叫（同一交易內）；old=None 代表新增"""
+    apply_many(conn, [(cohort_id, rater_user_id, target_user_id, old, new)])
+
+
+def apply_many(conn: sqlite3.Connection, changes: list[tuple[str, str, str, dict | None, dict]]) -> None:
+    """
+    peer 寫入後呼叫（同一交易內，scores_peer 已是寫入後的內容）：
+    changes = [(cohort_id, rater_user_id, target_user_id, old, new)]，每組 (cohort, rater, target) 最多一筆
+    1. rater_stats：同一位 rater 的差值合併後一次寫入
+    2. peer_norm_sums：每位有變動的 rater，以「舊平均/標準差 × 舊分數」→「新平均/標準差 × 新分數」
+       重算他評過的每一位的貢獻，差值累加（O(變動 rater 的評分份數)）
+    """
+    merged: dict[tuple[str, str], list[float]] = {}
+    replaced: dict[tuple[str, str], dict[str, dict | None]] = {}
+    for cohort_id, rater, target, old, new in changes:
+        key = (cohort_id, rater)
+        d = _delta(old, new)
+        acc = merged.get(key)
+        if acc is None:
+            merged[key] = d
+        else:
+            for i, v in enumerate(d):
+                acc[i] += v
+        replaced.setdefault(key, {})[target] = old
+    if not merged:
+        return
+    keys = list(merged)
+
+    before = _fetch_stats(conn, keys)
+    conn.executemany(_APPLY_SQL, [(*key, *d) for key, d in merged.items()])
+    after = _fetch_stats(conn, keys)
+
+    current: dict[tuple[str, str], dict[str, dict]] = {}
+    for r in _by_rater(
+        conn,
+        f"SELECT cohort_id, rater_user_id, target_user_id, {', '.join(METRICS)} FROM scores_peer WHERE {{keys}}",
+        keys,
+    ):
+        current.setdefault((r["cohort_id"], r["rater_user_id"]), {})[r["target_user_id"]] = row_to_scores(r)
+
+    deltas: dict[tuple[str, str], list[float]] = {}
+    for key in keys:
+        new_rows = current.get(key, {})
+        old_rows = dict(new_rows)
+        for target, old in replaced[key].items():
+            if old is None:
+                old_rows.pop(target, None)
+            else:
+                old_rows[target] = old
+        p_old = _rater_params(before.get(key))
+        p_new = _rater_params(after.get(key))
+        for target in old_rows.keys() | new_rows.keys():
+            acc = deltas.setdefault((key[0], target), [0.0] * len(_NORM_COLS))
+            if target in new_rows:
+                for i, v in enumerate(_contribution(p_new, new_rows[target])):
+                    acc[i] += v
+            if target in old_rows:
+                for i, v in enumerate(_contribution(p_old, old_rows[target])):
+                    acc[i] -= v
+    conn.executemany(
+        _APPLY_NORM_SQL, [(*key, *d) for key, d in deltas.items() if any(d)]
+    )
+
+
+_GROUP_SQL = f"""
+    SELECT cohort_id, rater_user_id, COUNT(*) AS cnt,
+           {', '.join(f'SUM({m}) AS sum_{m}' for m in METRICS)},
+           {', '.join(f'SUM({m} * {m}) AS sq_{m}' for m in METRICS)}
+    FROM scores_peer
+    GROUP BY cohort_id, rater_user_id
+"""
+
+
+def _norm_expr(m: str) -> str:
+    mean = f"(r.sum_{m} * 1.0 / r.cnt)"
+    std = f"MAX(pa360_sqrt(MAX(r.sq_{m} * 1.0 / r.cnt - {mean} * {mean}, 0.0)), {MIN_STD})"
+    return f"SUM(CASE WHEN r.cnt >= {MIN_RATER_COUNT} THEN (p.{m} - {mean}) / {std} ELSE 0.0 END)"
+
+
+# 從 scores_peer + rater_stats 直接算 peer_norm_sums（rebuild/check 用；sqrt 由 Python 提供）
+_NORM_GROUP_SQL = f"""
+    SELECT p.cohort_id, p.target_user_id,
+           SUM(r.cnt >= {MIN_RATER_COUNT}) AS z_cnt,
+           {', '.join(f'{_norm_expr(m)} AS z_sum_{m}' for m in METRICS)},
+           SUM(r.cnt < {MIN_RATER_COUNT}) AS raw_cnt,
+           {', '.join(f'SUM(CASE WHEN r.cnt < {MIN_RATER_COUNT} THEN p.{m} ELSE 0 END) AS raw_sum_{m}'
+                      for m in METRICS)}
+    FROM scores_peer p
+    JOIN rater_stats r ON r.cohort_id = p.cohort_id AND r.rater_user_id = p.rater_user_id
+    GROUP BY p.cohort_id, p.target_user_id
+"""
+
+
+def _sql_sqrt(conn: sqlite3.Connection) -> None:
+    conn.create_function("pa360_sqrt", 1, math.sqrt, deterministic=True)
+
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """清空並從 scores_peer 重算 rater_stats 與 peer_norm_sums，回傳 (cohort, rater) 數"""
+    create_table(conn)
+    _sql_sqrt(conn)
+    conn.execute("DELETE FROM rater_stats")
+    cur = conn.execute(
+        f"INSERT INTO rater_stats (cohort_id, rater_user_id, {', '.join(_DELTA_COLS)}) {_GROUP_SQL}"
+    )
+    conn.execute("DELETE FROM peer_norm_sums")
+    conn.execute(
+        f"INSERT INTO peer_norm_sums (cohort_id, target_user_id, {', '.join(_NORM_COLS)}) {_NORM_GROUP_SQL}"
+    )
+    return cur.rowcount
+
+
+def _diff(computed: dict, stored: dict, cols: list[str]) -> list[str]:
+    bad: list[str] = []
+    for key in sorted(set(computed) | set(stored)):
+        d = computed.get(key)
+        r = stored.get(key)
+        if d is None:
+            # 多出來的列只要份數都是 0 就無所謂（浮點累加誤差容許 1e-6）
+            if any(abs(r[c]) > 1e-6 for c in cols):
+                bad.append("/".join(key))
+            continue
+        if r is None or any(abs(r[c] - d[c]) > 1e-6 for c in cols):
+            bad.append("/".join(key))
+    return bad
+
+
+def check(conn: sqlite3.Connection) -> list[str]:
+    """比對 rater_stats、peer_norm_sums 與 scores_peer 即時計算結果，回傳不一致的「cohort/rater」「cohort/被評者」"""
+    _sql_sqrt(conn)
+    bad = _diff(
+        {(r["cohort_id"], r["rater_user_id"]): r for r in conn.execute(_GROUP_SQL)},
+        {(r["cohort_id"], r["rater_user_id"]): r for r in conn.execute("SELECT * FROM rater_stats")},
+        _DELTA_COLS,
+    )
+    # peer_norm_sums 要用 rater_stats 的內容算（上面不一致時這裡也會跟著不一致）
+    bad += _diff(
+        {(r["cohort_id"], r["target_user_id"]): r for r in conn.execute(_NORM_GROUP_SQL)},
+        {(r["cohort_id"], r["target_user_id"]): r for r in conn.execute("SELECT * FROM peer_norm_sums")},
+        _NORM_COLS,
+    )
+    return bad
+
+
+# ---- 讀取 ----
+
+
+def _cohort_moments(sums: np.ndarray, sqs: np.ndarray, total: float) -> tuple[np.ndarray, np.ndarray]:
+    """全體同儕分數的 (平均, 標準差)"""
+    k = len(METRICS)
+    if not total:
+        return np.zeros(k), np.zeros(k)
+    mean = sums / total
+    return mean, np.sqrt(np.maximum(sqs / total - mean ** 2, 0))
+
+
+class RaterTable:
+    """一個 cohort 所有 rater 的平均 / 標準差（(rater 數, 6) 矩陣）與全體同儕分數的平均 / 標準差"""
+
+    def __init__(self, rows: list):
+        self.ids = [r["rater_user_id"] for r in rows]
+        k = len(METRICS)
+        self.cnt = np.asarray([r["cnt"] for r in rows], dtype=np.float64)
+        sums = np.asarray([[r[c] for c in _SUM_COLS] for r in rows], dtype=np.float64).reshape(-1, k)
+        sqs = np.asarray([[r[c] for c in _SQ_COLS] for r in rows], dtype=np.float64).reshape(-1, k)
+
+        self.total = int(self.cnt.sum())
+        self.cohort_mean, self.cohort_std = _cohort_moments(sums.sum(axis=0), sqs.sum(axis=0), self.total)
+
+        cnt = np.maximum(self.cnt, 1)[:, None]
+        self.mean = sums / cnt
+        self.std = np.sqrt(np.maximum(sqs / cnt - self.mean ** 2, 0))
+
+
+def load_table(conn: sqlite3.Connection, cohort_id: str) -> RaterTable:
+    return RaterTable(conn.execute(
+        "SELECT * FROM rater_stats WHERE cohort_id = ? AND cnt > 0 ORDER BY rater_user_id", (cohort_id,)
+    ).fetchall())
+
+
+def compute_normalized(conn: sqlite3.Connection, cohort_id: str) -> dict[str, dict]:
+    """
+    {target_user_id: 校正後的同儕平均（六指標）}；只含收到過同儕分數的學生
+    成本：rater_stats 一次 SUM + peer_norm_sums 每位學生一列（與同儕分數筆數無關）
+    """
+    k = len(METRICS)
+    totals = conn.execute(
+        f"SELECT SUM(cnt), {', '.join(f'SUM({c})' for c in [*_SUM_COLS, *_SQ_COLS])} "
+        "FROM rater_stats WHERE cohort_id = ?",
+        (cohort_id,),
+    ).fetchone()
+    total = float(totals[0] or 0)
+    if not total:
+        return {}
+    mean, std = _cohort_moments(np.asarray(totals[1:1 + k], dtype=np.float64),
+                                np.asarray(totals[1 + k:], dtype=np.float64), total)
+
+    cur = conn.cursor()
+    cur.row_factory = None
+    rows = cur.execute(
+        f"SELECT target_user_id, {', '.join(_NORM_COLS)} FROM peer_norm_sums "
+        "WHERE cohort_id = ? AND z_cnt + raw_cnt > 0",
+        (cohort_id,),
+    ).fetchall()
+    if not rows:
+        return {}
+    ids = [r[0] for r in rows]
+    x = np.asarray([r[1:] for r in rows], dtype=np.float64)
+    z_cnt, z_sum = x[:, 0], x[:, 1:1 + k]
+    raw_cnt, raw_sum = x[:, 1 + k], x[:, 2 + k:]
+
+    # 份數不足的 rater：用全體平均 / 標準差換成 z
+    z_total = z_sum + (raw_sum - raw_cnt[:, None] * mean) / np.maximum(std, MIN_STD)
+    scaled = mean + std * (z_total / (z_cnt + raw_cnt)[:, None])
+    scaled = np.clip(scaled, SCORE_MIN, SCORE_MAX)
+    return {tid: dict(zip(METRICS, vals)) for tid, vals in zip(ids, scaled.tolist())}
+
+
+_cache: dict[str, tuple[int, dict[str, dict]]] = {}
+_cache_lock = threading.Lock()
+
+
+def normalized_peer_map(cohort_id: str) -> dict[str, dict]:
+    """
+    校正後的同儕平均；每個 cohort 保留最近一個資料版本的結果（結果唯讀，勿修改）
+    版本變了才重算：讀 peer_norm_sums（O(學生數)），不重掃 scores_peer
+    """
+    from app.db import db_read_session
+
+    version = data_version.current()
+    with _cache_lock:
+        hit = _cache.get(cohort_id)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+
+    def compute() -> dict[str, dict]:
+        with db_read_session() as conn:
+            return compute_normalized(conn, cohort_id)
+
+    result = aggregations.do(("normalized_peer", cohort_id, version), compute)
+    with _cache_lock:
+        old = _cache.get(cohort_id)
+        if old is None or old[0] <= version:
+            _cache[cohort_id] = (version, result)
+    return result
+
+
+def with_peer_avg(item: dict, peer_avg: dict | None) -> dict:
+    """
+    summary item 換成校正後的同儕平均（重算加權結果）；回傳新 dict，不改原本的（快取共用）
+    peer_normalized：peer_avg 是否為校正後的值；有同儕分數卻沒有校正值（不應發生）時保留原始平均並標 false，
+    呼叫端不要把兩種尺度混在一起比較
+    """
+    if peer_avg is None or item["peer_avg"] is None:
+        return {**item, "peer_normalized": False}
+    if not item["complete"]:
+        return {**item, "peer_avg": peer_avg, "peer_normalized": True}
+    w = weighted_scores(item["teacher_avg"], item["self_latest"], peer_avg)
+    return {**item, "peer_avg": peer_avg, "weighted": w, "weighted_mean": weighted_mean(w),
+            "peer_normalized": True}
+
+
+def main(argv: list[str]) -> int:
+    """
+    用法（在 backend/ 底下）：
+      python -m app.services.rater_stats rebuild   # 從 scores_peer 重建 rater_stats 與 peer_norm_sums
+      python -m app.services.rater_stats check     # 檢查兩張表是否與 scores_peer 一致
+    """
+    from app.db import db_session
+
+    cmd = argv[0] if argv else ""
+    if cmd == "rebuild":
+        with db_session() as conn:
+            n = rebuild(conn)
+        print(f"rater_stats / peer_norm_sums rebuilt: {n} raters")
+        return 0
+    if cmd == "check":
+        with db_session() as conn:
+            bad = check(conn)
+        if bad:
+            print(f"rater_stats / peer_norm_sums inconsistent for {len(bad)} rows: {', '.join(bad[:20])}")
+            return 1
+        print("rater_stats / peer_norm_sums OK")
+        return 0
+
+    print(main.__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,170 @@
+# backend/app/services/score_store.py
+from __future__ import annotations
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from app.db import db_session
+from app.services import aggregates, data_version, rater_stats
+from app.services.completion_hub import hub
+from app.services.single_flight import aggregations
+from app.services.scoring import METRICS, row_to_scores
+
+# 分數寫入集中在這裡：寫分數表 + 同一交易內維護 student_aggregates
+# 每筆分數都屬於某個 cohort（班級/梯次），唯一鍵與索引都以 cohort_id 開頭
+
+SELF_INSERT_SQL = """
+    INSERT INTO scores_self (cohort_id, user_id, created_at, hp, atk, def, spa, spd, spe)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# teacher/peer：同一 cohort 內同一對 (owner, target) 只保留最新一筆（覆寫）
+UPSERT_SQL = {
+    "peer": """
+        INSERT INTO scores_peer (cohort_id, rater_user_id, target_user_id, created_at, hp, atk, def, spa, spd, spe)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(cohort_id, rater_user_id, target_user_id) DO UPDATE SET
+            created_at = excluded.created_at,
+            hp = excluded.hp,
+            atk = excluded.atk,
+            def = excluded.def,
+            spa = excluded.spa,
+            spd = excluded.spd,
+            spe = excluded.spe
+    """,
+    "teacher": """
+        INSERT INTO scores_teacher (cohort_id, teacher_user_id, target_user_id, created_at, hp, atk, def, spa, spd, spe)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(cohort_id, teacher_user_id, target_user_id) DO UPDATE SET
+            created_at = excluded.created_at,
+            hp = excluded.hp,
+            atk = excluded.atk,
+            def = excluded.def,
+            spa = excluded.spa,
+            spd = excluded.spd,
+            spe = excluded.spe
+    """,
+}
+
+TABLES = {
+    "peer": ("scores_peer", "rater_user_id"),
+    "teacher": ("scores_teacher", "teacher_user_id"),
+}
+
+# 一次查詢舊分數時最多帶幾組 (cohort, owner, target)（每組 3 個參數）
+_FETCH_CHUNK = 300
+
+# 目前 thread 的 write_session 內被寫到的 (cohort_id, user_id)
+_touched = threading.local()
+
+
+@contextmanager
+def write_session():
+    """
+    分數寫入用的 db_session：
+    - 同一交易內把資料版本 +1（ETag 用）
+    - commit 成功後公開新版本、讓 dashboard 彙總快取失效，並推播受影響學生的完成度
+    """
+    _touched.items = set()
+    try:
+        with db_session() as conn:
+            yield conn
+            version = data_version.bump(conn)
+        touched = _touched.items
+    finally:
+        _touched.items = None
+    data_version.publish(version)
+    aggregations.invalidate()
+    hub.publish(touched)
+
+
+def _touch(cohort_id: str, *user_ids: str) -> None:
+    """記下這個 write_session 內完成度有變動的學生（不在 write_session 內時不記）"""
+    items = getattr(_touched, "items", None)
+    if items is not None:
+        items.update((cohort_id, uid) for uid in user_ids)
+
+
+# upsert_many 的一列：(cohort_id, owner_id, target_user_id, scores, created_at)
+UpsertRow = tuple[str, str, str, dict, str]
+
+
+def insert_self(conn: sqlite3.Connection, cohort_id: str, user_id: str, scores: dict,
+                created_at: str) -> int:
+    cur = conn.execute(
+        SELF_INSERT_SQL, (cohort_id, user_id, created_at, *[scores[m] for m in METRICS])
+    )
+    aggregates.apply_self(conn, cohort_id, user_id, cur.lastrowid, scores)
+    _touch(cohort_id, user_id)
+    return cur.lastrowid
+
+
+def upsert(conn: sqlite3.Connection, kind: str, cohort_id: str, owner_id: str,
+           target_user_id: str, scores: dict, created_at: str) -> None:
+    """單筆 teacher/peer 覆寫式寫入"""
+    table, owner_col = TABLES[kind]
+    old = aggregates.fetch_existing(conn, table, owner_col, cohort_id, owner_id, target_user_id)
+    conn.execute(
+        UPSERT_SQL[kind],
+        (cohort_id, owner_id, target_user_id, created_at, *[scores[m] for m in METRICS]),
+    )
+    aggregates.apply_upsert(conn, kind, cohort_id, target_user_id, old, scores)
+    if kind == "peer":
+        rater_stats.apply_upsert(conn, cohort_id, owner_id, old, scores, target_user_id)
+    _touch(cohort_id, owner_id, target_user_id)
+
+
+def _fetch_existing_many(conn: sqlite3.Connection, kind: str,
+                         keys: list[tuple[str, str, str]]) -> dict[tuple[str, str, str], dict]:
+    table, owner_col = TABLES[kind]
+    out: dict[tuple[str, str, str], dict] = {}
+    for i in range(0, len(keys), _FETCH_CHUNK):
+        chunk = keys[i:i + _FETCH_CHUNK]
+        values = ", ".join("(?, ?, ?)" for _ in chunk)
+        params = [x for key in chunk for x in key]
+        rows = conn.execute(
+            f"""
+            SELECT cohort_id, {owner_col} AS owner_id, target_user_id, {', '.join(METRICS)}
+            FROM {table}
+            WHERE (cohort_id, {owner_col}, target_user_id) IN (VALUES {values})
+            """,
+            params,
+        )
+        for r in rows:
+            out[(r["cohort_id"], r["owner_id"], r["target_user_id"])] = row_to_scores(r)
+    return out
+
+
+def upsert_many(conn: sqlite3.Connection, kind: str, rows: list[UpsertRow]) -> int:
+    """
+    批次 teacher/peer 寫入：rows = [(cohort_id, owner_id, target_user_id, scores, created_at)]
+    - 同一批內同一組 (cohort, owner, target) 以最後一筆為準
+    - 一次 executemany 寫入，彙總表以「寫入前的舊值 → 最終值」更新
+    回傳實際寫入的組數
+    """
+    final: dict[tuple[str, str, str], tuple[dict, str]] = {}
+    for cohort_id, owner_id, target, scores, created_at in rows:
+        key = (cohort_id, owner_id, target)
+        final.pop(key, None)  # 重新插入，保持最後出現的順序
+        final[key] = (scores, created_at)
+    if not final:
+        return 0
+
+    old = _fetch_existing_many(conn, kind, list(final))
+    conn.executemany(
+        UPSERT_SQL[kind],
+        [
+            (*key, created_at, *[scores[m] for m in METRICS])
+            for key, (scores, created_at) in final.items()
+        ],
+    )
+    for key, (scores, _) in final.items():
+        cohort_id, _, target = key
+        aggregates.apply_upsert(conn, kind, cohort_id, target, old.get(key), scores)
+        _touch(cohort_id, key[1], target)
+    if kind == "peer":
+        rater_stats.apply_many(
+            conn, [(*key, old.get(key), scores) for key, (scores, _) in final.items()]
+        )
+    return len(final)
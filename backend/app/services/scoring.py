@@ -0,0 +1,28 @@
+# backend/app/services/scoring.py
+from __future__ import annotations
+
+# 六指標（DB 欄位名）
+METRICS = ["hp", "atk", "def", "spa", "spd", "spe"]
+
+# 加權：老師40 / 自評20 / 同儕40
+W_TEACHER = 0.40
+W_SELF = 0.20
+W_PEER = 0.40
+
+# 同儕至少收到幾份才算有同儕分數
+MIN_PEER_RECEIVED_FOR_CALC = 1
+
+
+def row_to_scores(row) -> dict:
+    return {m: float(row[m]) for m in METRICS}
+
+
+def weighted_scores(teacher: dict, self_: dict, peer: dict) -> dict:
+    return {
+        m: round(W_TEACHER * teacher[m] + W_SELF * self_[m] + W_PEER * peer[m], 2)
+        for m in METRICS
+    }
+
+
+def weighted_mean(weighted: dict) -> float:
+    return round(sum(weighted[m] for m in METRICS) / len(METRICS), 2)
@@ -0,0 +1,130 @@
+# backend/app/services/single_flight.py
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Callable, Hashable
+
+from app.services import metrics
+
+# 計算結果保留幾秒（0 = 不保留，只合併同時進行中的請求）；分數寫入後會立即失效
+FLIGHT_TTL_SEC = float(os.environ.get("PA360_FLIGHT_TTL_SEC", "2"))
+# 結果快取最多幾筆（超過時先清掉過期的）
+FLIGHT_MAX_RESULTS = 256
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "generation")
+
+    def __init__(self, generation: int):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.generation = generation
+
+
+class SingleFlight:
+    """
+    同一個 key 的昂貴計算同時間只跑一次（single-flight）：
+    - 第一個呼叫者執行 fn()，同時到達的呼叫者等它算完，拿同一份結果（或同一個例外）
+    - 算完的結果保留 ttl 秒，期間同一個 key 直接回傳
+    - invalidate() 之後：快取清空，之前開始、還在跑的計算結果也不會被採用或共用
+    key 的第一個元素當作統計用的名稱（例如 ("master_summary", cohort_id, ...)）
+    回傳值會被多個請求共用，呼叫端不可修改
+    """
+
+    def __init__(self, ttl: float = FLIGHT_TTL_SEC, max_results: int = FLIGHT_MAX_RESULTS):
+        self.ttl = ttl
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        self._inflight: dict[Hashable, _Call] = {}
+        self._results: dict[Hashable, tuple[float, Any]] = {}
+        self._generation = 0
+        self._invalidations = 0
+        self._counters: dict[str, dict[str, int]] = {}
+
+    def _count(self, key: Hashable, what: str) -> None:
+        name = str(key[0] if isinstance(key, tuple) else key)
+        c = self._counters.setdefault(name, {"executed": 0, "coalesced": 0, "cache_hits": 0})
+        c[what] += 1
+
+    def _store(self, key: Hashable, call: _Call) -> None:
+        now = time.monotonic()
+        if len(self._results) >= self.max_results:
+            self._results = {k: v for k, v in self._results.items() if v[0] > now}
+        if len(self._results) < self.max_results:
+            self._results[key] = (now + self.ttl, call.result)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            hit = self._results.get(key)
+            if hit is not None and hit[0] > time.monotonic():
+                self._count(key, "cache_hits")
+                return hit[1]
+
+            call = self._inflight.get(key)
+            leader = call is None or call.generation != self._generation
+            if leader:
+                call = _Call(self._generation)
+                self._inflight[key] = call
+                self._count(key, "executed")
+            else:
+                self._count(key, "coalesced")
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is call:
+                    del self._inflight[key]
+                # 計算期間有寫入：結果可能是舊的，不放進快取
+                if call.error is None and self.ttl > 0 and call.generation == self._generation:
+                    self._store(key, call)
+            call.done.set()
+        return call.result
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._invalidations += 1
+            self._results.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_key = {name: dict(c) for name, c in self._counters.items()}
+            total = {
+                what: sum(c[what] for c in by_key.values())
+                for what in ("executed", "coalesced", "cache_hits")
+            }
+            return {
+                "ttl_sec": self.ttl,
+                "inflight": len(self._inflight),
+                "cached": len(self._results),
+                "invalidations": self._invalidations,
+                **total,
+                "by_key": by_key,
+            }
+
+    def cache_counts(self, cache: str) -> dict[tuple[str, str], int]:
+        """給 /metrics：{(cache.key名稱, hit|miss|coalesced): 次數}"""
+        with self._lock:
+            return {
+                (f"{cache}.{name}", result): c[what]
+                for name, c in self._counters.items()
+                for what, result in (("cache_hits", "hit"), ("executed", "miss"), ("coalesced", "coalesced"))
+            }
+
+
+# dashboard 彙總（master summary / teacher completion / 加權結果）共用一份
+aggregations = SingleFlight()
+metrics.CACHE_REQUESTS.add_source(lambda: aggregations.cache_counts("aggregations"))
@@ -0,0 +1,155 @@
+# backend/app/services/tokens.py
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from app.services import metrics
+
+# 登入 token：v1.<payload>.<簽章>（皆為 base64url）
+# - payload：{"sub": user_id, "role": ..., "name": 顯示名稱, "iat": 簽發時間, "exp": 到期時間, "jti": 編號}
+#   iat 為 time.time() 原值（小數秒）：與 revoke_user 記錄的時間同一精度，才分得出同一秒內撤銷前後簽發的 token
+# - 簽章：HMAC-SHA256(secret, "v1.<payload>")，以 hmac.compare_digest 比對
+# 驗證只用 CPU（不查 CSV/DB）；最近驗證過的 token 放在 LRU，命中時連 HMAC 都省掉
+#
+# PA360_TOKEN_SECRET 未設定時每次啟動隨機產生（重啟後舊 token 全部失效）
+
+TOKEN_VERSION = "v1"
+TOKEN_TTL_SEC = int(os.environ.get("PA360_TOKEN_TTL_SEC", str(8 * 3600)))
+TOKEN_CACHE_SIZE = int(os.environ.get("PA360_TOKEN_CACHE_SIZE", "4096"))
+ROLES = ("teacher", "student", "master")
+
+_env_secret = os.environ.get("PA360_TOKEN_SECRET")
+_SECRET = _env_secret.encode("utf-8") if _env_secret else secrets.token_bytes(32)
+
+
+class TokenError(ValueError):
+    """token 無效；args[0] 為錯誤碼（INVALID_TOKEN / TOKEN_EXPIRED / TOKEN_REVOKED）"""
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def _sign(signing_input: str) -> str:
+    return _b64encode(hmac.new(_SECRET, signing_input.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue(role: str, user_id: str, display_name: str | None = None,
+          ttl: int = TOKEN_TTL_SEC) -> tuple[str, dict]:
+    """簽發 token，回傳 (token, claims)"""
+    now = time.time()
+    claims = {
+        "sub": user_id,
+        "role": role,
+        "name": display_name or user_id,
+        "iat": now,
+        "exp": int(now) + ttl,
+        "jti": secrets.token_urlsafe(9),
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    signing_input = f"{TOKEN_VERSION}.{payload}"
+    return f"{signing_input}.{_sign(signing_input)}", claims
+
+
+# ---- 撤銷（deny-list，只存在記憶體）----
+
+_deny_lock = threading.Lock()
+_denied_jti: dict[str, int] = {}            # jti -> exp（過期後就可以忘掉）
+_revoked_before: dict[tuple[str, str], float] = {}   # (role, user_id) -> 這個時間以前簽發的都無效
+
+
+def revoke(claims: dict) -> None:
+    """撤銷單一 token（登出）"""
+    now = int(time.time())
+    with _deny_lock:
+        _denied_jti[claims["jti"]] = int(claims["exp"])
+        if len(_denied_jti) > TOKEN_CACHE_SIZE:
+            for jti in [j for j, exp in _denied_jti.items() if exp <= now]:
+                del _denied_jti[jti]
+
+
+def revoke_user(role: str, user_id: str) -> None:
+    """撤銷某位使用者目前為止簽發的所有 token（例如改密碼、停權）"""
+    with _deny_lock:
+        _revoked_before[(role, user_id)] = time.time()
+
+
+def _check_live(claims: dict, now: float) -> dict:
+    if claims["exp"] <= now:
+        raise TokenError("TOKEN_EXPIRED")
+    if claims["jti"] in _denied_jti:
+        raise TokenError("TOKEN_REVOKED")
+    before = _revoked_before.get((claims["role"], claims["sub"]))
+    if before is not None and claims["iat"] < before:
+        raise TokenError("TOKEN_REVOKED")
+    return claims
+
+
+# ---- 驗證 ----
+
+_cache_lock = threading.Lock()
+_cache: OrderedDict[str, dict] = OrderedDict()
+stats = {"verified": 0, "cache_hits": 0, "rejected": 0}
+# 已驗證 token 的 LRU：命中 = 省掉 HMAC，verified = 實際驗過簽章
+metrics.CACHE_REQUESTS.add_source(
+    lambda: {("token", "hit"): stats["cache_hits"], ("token", "miss"): stats["verified"]}
+)
+
+
+def _verify_signature(token: str) -> dict:
+    # 合法 token 只有 base64url 與「.」；非 ASCII 先擋掉（encode("ascii") / compare_digest 會丟別的例外）
+    if not token.isascii():
+        raise TokenError("INVALID_TOKEN")
+    parts = token.split(".")
+    if len(parts) != 3 or parts[0] != TOKEN_VERSION:
+        raise TokenError("INVALID_TOKEN")
+    signing_input = f"{parts[0]}.{parts[1]}"
+    if not hmac.compare_digest(_sign(signing_input), parts[2]):
+        raise TokenError("INVALID_TOKEN")
+    try:
+        claims = json.loads(_b64decode(parts[1]))
+        if (not isinstance(claims.get("sub"), str) or claims.get("role") not in ROLES
+                or not isinstance(claims.get("exp"), int)
+                or not isinstance(claims.get("iat"), (int, float))
+                or not isinstance(claims.get("jti"), str)):
+            raise TokenError("INVALID_TOKEN")
+    except (ValueError, UnicodeDecodeError, AttributeError):
+        raise TokenError("INVALID_TOKEN") from None
+    return claims
+
+
+def verify(token: str) -> dict:
+    """驗證 token 回傳 claims；無效時丟 TokenError"""
+    now = time.time()
+    with _cache_lock:
+        claims = _cache.get(token)
+        if claims is not None:
+            _cache.move_to_end(token)
+            stats["cache_hits"] += 1
+    try:
+        if claims is not None:
+            return _check_live(claims, now)
+
+        claims = _check_live(_verify_signature(token), now)
+    except TokenError:
+        stats["rejected"] += 1
+        raise
+
+    with _cache_lock:
+        stats["verified"] += 1
+        _cache[token] = claims
+        if len(_cache) > TOKEN_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return claims
@@ -1,24 +1,38 @@
 from __future__ import annotations
 
 import csv
+import os
+from dataclasses import dataclass
 from pathlib import Path
 
-USERS_CSV_PATH = Path(__file__).resolve().parents[1] / "data" / "users.csv"
-# ↑ services/ 往上 1 層是 app/，所以 app/data/users.csv
+from app.services.file_cache import FileCache, FileVersion
 
-def load_users() -> dict[tuple[str, str], dict]:
+# 資料目錄可用 PA360_DATA_DIR 換掉（benchmark / 大量測試資料用）
+DATA_DIR = Path(os.environ.get("PA360_DATA_DIR") or Path(__file__).resolve().parents[1] / "data")
+USERS_CSV_PATH = DATA_DIR / "users.csv"
+# ↑ services/ 往上 1 層是 app/，所以預設是 app/data/users.csv
+
+# users.csv 沒有 cohort_id 欄位（或留空）時的班級/梯次
+DEFAULT_COHORT = "default"
+
+
+@dataclass(frozen=True)
+class UserDirectory:
     """
-    回傳：
-    {
-      ("student","S01"): {"password":"1234","display_name":"小智"},
-      ...
-    }
+    users.csv 解析一次後的各種查詢視圖（唯讀，勿修改內容）
+    cohort_id 欄位：
+    - student：所屬班級/梯次（一個帳號一個 cohort）
+    - teacher：可管理的 cohort，多個以 ; 分隔；留空代表全部
     """
-    if not USERS_CSV_PATH.exists():
-        raise FileNotFoundError(f"users.csv not found: {USERS_CSV_PATH}")
+    users: dict[tuple[str, str], dict]
+    cohorts: list[str]                           # 所有有學生的 cohort，已排序
+    students_by_cohort: dict[str, list[str]]     # 各 cohort 的學生 user_id，已排序
+    student_sets: dict[str, frozenset[str]]
 
+
+def _read_users_csv(path: Path) -> dict[tuple[str, str], dict]:
     users: dict[tuple[str, str], dict] = {}
-    with USERS_CSV_PATH.open("r", encoding="utf-8-sig", newline="") as f:
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
         reader = csv.DictReader(f)
         required = {"role", "user_id", "password", "display_name"}
         if not reader.fieldnames or not required.issubset(set(reader.fieldnames)):
@@ -29,27 +43,89 @@ def load_users() -> dict[tuple[str, str], dict]:
             user_id = (row.get("user_id") or "").strip()
             password = (row.get("password") or "").strip()
             display_name = (row.get("display_name") or "").strip()
+            cohort = (row.get("cohort_id") or "").strip()
 
             if not role or not user_id:
                 continue
 
-            users[(role, user_id)] = {
+            user = {
                 "password": password,
                 "display_name": display_name or user_id,
             }
+            if role == "student":
+                user["cohort_id"] = cohort or DEFAULT_COHORT
+            elif role == "teacher":
+                # None = 全部 cohort
+                allowed = frozenset(c.strip() for c in cohort.split(";") if c.strip())
+                user["cohorts"] = allowed or None
+            users[(role, user_id)] = user
 
     return users
 
 
-def get_students() -> list[str]:
-    """回傳 users.csv 中 role=student 的 user_id，並按 ID 排序。"""
-    users = load_users()
-    students = [uid for (role, uid) in users.keys() if role == "student"]
-    students.sort()
-    return students
+def _build_directory(path: Path) -> UserDirectory:
+    users = _read_users_csv(path)
+    by_cohort: dict[str, list[str]] = {}
+    for (role, uid), u in users.items():
+        if role == "student":
+            by_cohort.setdefault(u["cohort_id"], []).append(uid)
+    for students in by_cohort.values():
+        students.sort()
+    return UserDirectory(
+        users=users,
+        cohorts=sorted(by_cohort),
+        students_by_cohort=by_cohort,
+        student_sets={c: frozenset(ids) for c, ids in by_cohort.items()},
+    )
+
+
+# 全程式共用一份：檔案 mtime/size 沒變就不重新解析
+_directory = FileCache(USERS_CSV_PATH, _build_directory)
+
+
+def get_user_directory() -> UserDirectory:
+    return _directory.get()
+
+
+def get_roster_version() -> FileVersion | None:
+    """users.csv 目前內容的版本（先確認快取是最新的）"""
+    get_user_directory()
+    return _directory.version
+
+
+def load_users() -> dict[tuple[str, str], dict]:
+    """
+    回傳：
+    {
+      ("student","S01"): {"password":"1234","display_name":"小智"},
+      ...
+    }
+    """
+    return get_user_directory().users
+
+
+def get_user(role: str, user_id: str) -> dict | None:
+    return get_user_directory().users.get((role, user_id))
+
+
+def get_students(cohort_id: str = DEFAULT_COHORT) -> list[str]:
+    """回傳 users.csv 中該 cohort、role=student 的 user_id，並按 ID 排序。"""
+    return get_user_directory().students_by_cohort.get(cohort_id, [])
+
+
+def get_student_set(cohort_id: str = DEFAULT_COHORT) -> frozenset[str]:
+    return get_user_directory().student_sets.get(cohort_id, frozenset())
+
+
+def get_cohorts() -> list[str]:
+    return get_user_directory().cohorts
+
+
+def get_student_cohort(user_id: str) -> str | None:
+    u = get_user("student", user_id)
+    return u["cohort_id"] if u else None
 
 
 def get_display_name(role: str, user_id: str) -> str | None:
-    users = load_users()
-    u = users.get((role, user_id))
+    u = get_user(role, user_id)
     return u.get("display_name") if u else None
@@ -0,0 +1,210 @@
+# backend/app/services/weight_sim.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.services.scoring import METRICS, W_PEER, W_SELF, W_TEACHER
+
+# 權重方案模擬（what-if）：
+# - 資料齊全的學生整理成 (學生數, 3 來源, 6 指標) 的矩陣，只在資料變動後重建一次
+# - 每組方案折成 18 個係數：來源權重（可逐指標）× 指標權重 / 指標權重總和
+#   → 所有方案的加權總分 = 一次矩陣乘法 (學生數×18) @ (18×方案數)
+# - 名次：總分先四捨五入到小數 2 位（同 weighted_mean），名次 = 1 + 分數比自己高的人數（同分同名次）
+#   分數範圍有限時用計數（bincount + 累加）算，不必每個方案各排序一次
+# - 名次變動以目前的權重（W_TEACHER / W_SELF / W_PEER、六指標平均）為基準，正數 = 名次往前
+
+SOURCES = ("teacher", "self", "peer")
+BASELINE = (W_TEACHER, W_SELF, W_PEER)
+
+# 一次最多模擬幾組方案
+MAX_SCHEMES = 1000
+# 每一塊（方案數 × 學生數）矩陣的元素上限（float64：4M ≈ 32MB）
+SIM_MAX_CELLS = 4_000_000
+
+
+@dataclass(frozen=True)
+class SourceMatrix:
+    """資料齊全的學生（依 user_id 排序）；values[i] = [老師平均, 最新自評, 同儕平均] × METRICS"""
+    ids: list[str]
+    values: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def build_sources(students: list[str], agg: dict[str, dict]) -> SourceMatrix:
+    """agg：aggregates.load_aggregates 的結果；只收 complete 的學生"""
+    ids: list[str] = []
+    rows: list[list[float]] = []
+    for sid in sorted(students):
+        item = agg.get(sid)
+        if not item or not item["complete"]:
+            continue
+        ids.append(sid)
+        rows.append([item[src][m] for src in ("teacher_avg", "self_latest", "peer_avg") for m in METRICS])
+    values = np.asarray(rows, dtype=np.float64).reshape(len(ids), len(SOURCES), len(METRICS))
+    return SourceMatrix(ids=ids, values=values)
+
+
+def _vector(value, what: str) -> np.ndarray:
+    """單一數字 → 六指標都一樣；list → 依 METRICS 順序的六個權重"""
+    vec = np.broadcast_to(np.asarray(value, dtype=np.float64), (len(METRICS),)) \
+        if np.ndim(value) == 0 else np.asarray(value, dtype=np.float64)
+    if vec.shape != (len(METRICS),):
+        raise ValueError(f"BAD_{what}_WEIGHTS")
+    if not np.all(np.isfinite(vec)) or np.any(vec < 0):
+        raise ValueError(f"BAD_{what}_WEIGHTS")
+    return vec
+
+
+def scheme_coefficients(teacher, self_, peer, metric_weights=None, normalize: bool = True) -> np.ndarray:
+    """
+    一組方案 → (3, 6) 係數，加權總分 = sum(係數 × 來源分數)
+    teacher / self_ / peer：數字或六指標各自的權重；normalize 時每個指標的三個來源權重調成總和 1
+    metric_weights：總分裡六指標的比重（預設平均）
+    丟 ValueError（錯誤碼）
+    """
+    src = np.stack([_vector(teacher, "TEACHER"), _vector(self_, "SELF"), _vector(peer, "PEER")])
+    if normalize:
+        totals = src.sum(axis=0)
+        if np.any(totals <= 0):
+            raise ValueError("ZERO_SOURCE_WEIGHTS")
+        src = src / totals
+    mw = _vector(1.0 if metric_weights is None else metric_weights, "METRIC")
+    if mw.sum() <= 0:
+        raise ValueError("ZERO_METRIC_WEIGHTS")
+    return src * (mw / mw.sum())
+
+
+def weighted_cents(sources: SourceMatrix, coeffs: np.ndarray) -> np.ndarray:
+    """coeffs (方案數, 3, 6) → (方案數, 學生數) 加權總分 × 100（四捨五入成整數 = 小數 2 位）"""
+    flat = sources.values.reshape(len(sources), -1)
+    out = coeffs.reshape(len(coeffs), -1) @ flat.T
+    out *= 100
+    return np.rint(out, out=out).astype(np.int64)
+
+
+def competition_ranks(cents: np.ndarray) -> np.ndarray:
+    """每一列各自排名（分數高 = 1；同分同名次，下一個名次跳號）"""
+    k, n = cents.shape
+    if n == 0:
+        return np.zeros((k, 0), dtype=np.int64)
+    lo = cents.min()
+    span = int(cents.max() - lo) + 1
+    if k * span <= SIM_MAX_CELLS:
+        # 計數：每列各分數的人數 → 由高往低累加 = 比自己高的人數
+        rel = cents - lo
+        counts = np.bincount((rel + (np.arange(k, dtype=np.int64) * span)[:, None]).ravel(),
+                             minlength=k * span).reshape(k, span)
+        above = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1] - counts
+        return np.take_along_axis(above, rel, axis=1) + 1
+
+    # 分數範圍太大（未正規化的大權重）：排序後同分取第一個位置
+    order = np.argsort(-cents, axis=1, kind="stable")
+    ranked = np.take_along_axis(cents, order, axis=1)
+    first = np.ones((k, n), dtype=bool)
+    first[:, 1:] = ranked[:, 1:] != ranked[:, :-1]
+    pos = np.where(first, np.arange(n), 0)
+    np.maximum.accumulate(pos, axis=1, out=pos)
+    ranks = np.empty_like(pos)
+    np.put_along_axis(ranks, order, pos + 1, axis=1)
+    return ranks
+
+
+def _top(values: np.ndarray, count: int) -> np.ndarray:
+    """每列最大的 count 個位置（大到小，同值依學生順序）"""
+    k, n = values.shape
+    count = min(count, n)
+    if count <= 0:
+        return np.zeros((k, 0), dtype=np.int64)
+    if count < n:
+        part = np.sort(np.argpartition(-values, count - 1, axis=1)[:, :count], axis=1)
+    else:
+        part = np.broadcast_to(np.arange(n), (k, n))
+    picked = np.take_along_axis(values, part, axis=1)
+    return np.take_along_axis(part, np.argsort(-picked, axis=1, kind="stable"), axis=1)
+
+
+def simulate(sources: SourceMatrix, coeffs: np.ndarray, *, top: int = 10, movers: int = 5,
+             student_ids: list[str] | None = None) -> dict:
+    """
+    coeffs：(方案數, 3, 6)，由 scheme_coefficients 組成
+    每個方案回傳：總分統計、前 top 名、名次變動統計（對基準）、往前/往後最多的 movers 位、指定學生的結果
+    """
+    n = len(sources)
+    ids = sources.ids
+    base_coeffs = scheme_coefficients(*BASELINE)[None]
+    base_cents = weighted_cents(sources, base_coeffs)
+    base_ranks = competition_ranks(base_cents)[0]
+    centered_base = base_ranks - base_ranks.mean() if n else base_ranks.astype(np.float64)
+    base_norm = float(np.sqrt(centered_base @ centered_base)) if n else 0.0
+
+    pos = {sid: i for i, sid in enumerate(ids)}
+    wanted = list(dict.fromkeys(student_ids or []))
+    wanted_idx = np.asarray([pos[sid] for sid in wanted if sid in pos], dtype=np.int64)
+
+    results: list[dict] = []
+    chunk = max(1, SIM_MAX_CELLS // max(n, 1))
+    for start in range(0, len(coeffs), chunk):
+        c = coeffs[start:start + chunk]
+        cents = weighted_cents(sources, c)
+        ranks = competition_ranks(cents)
+        scores = cents / 100
+        shift = base_ranks[None, :] - ranks
+
+        if n:
+            mean = scores.mean(axis=1)
+            std = scores.std(axis=1)
+            lo = scores.min(axis=1)
+            hi = scores.max(axis=1)
+            abs_shift = np.abs(shift)
+            changed = np.count_nonzero(shift, axis=1)
+            centered = ranks - ranks.mean(axis=1, keepdims=True)
+            denom = np.sqrt(np.einsum("ij,ij->i", centered, centered)) * base_norm
+            spearman = np.divide(centered @ centered_base, denom,
+                                 out=np.ones(len(c)), where=denom > 0)
+        top_idx = _top(scores, top)
+        up_idx = _top(shift, movers)
+        down_idx = _top(-shift, movers)
+
+        for j in range(len(c)):
+            def entry(i: int) -> dict:
+                return {
+                    "user_id": ids[i],
+                    "weighted_mean": float(scores[j, i]),
+                    "rank": int(ranks[j, i]),
+                    "baseline_rank": int(base_ranks[i]),
+                    "shift": int(shift[j, i]),
+                }
+
+            results.append({
+                "stats": {
+                    "mean": round(float(mean[j]), 4),
+                    "std": round(float(std[j]), 4),
+                    "min": float(lo[j]),
+                    "max": float(hi[j]),
+                } if n else None,
+                "rank_shift": {
+                    "changed": int(changed[j]),
+                    "mean_abs": round(float(abs_shift[j].mean()), 4),
+                    "max_abs": int(abs_shift[j].max()),
+                    "spearman": round(float(spearman[j]), 6),
+                } if n else None,
+                "top": [entry(i) for i in top_idx[j].tolist()],
+                "movers_up": [entry(i) for i in up_idx[j].tolist() if shift[j, i] > 0],
+                "movers_down": [entry(i) for i in down_idx[j].tolist() if shift[j, i] < 0],
+                "students": [entry(i) for i in wanted_idx.tolist()],
+            })
+
+    return {
+        "count": n,
+        "baseline": {
+            "weights": dict(zip(SOURCES, BASELINE)),
+            "mean": round(float(base_cents[0].mean()) / 100, 4) if n else None,
+        },
+        "schemes": results,
+        # 指定了但資料不齊（老師/自評/同儕缺一）或不在名單的學生
+        "incomplete": [sid for sid in wanted if sid not in pos],
+    }
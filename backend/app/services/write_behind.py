@@ -0,0 +1,224 @@
+# backend/app/services/write_behind.py
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+
+from app.services import metrics, score_store
+
+logger = logging.getLogger(__name__)
+
+# 寫入延後（write-behind）模式，PA360_WRITE_BEHIND=1 才開：
+# - /api/scores/self、/api/scores/peer 驗證通過後只把資料放進佇列
+# - 單一背景 thread 把佇列裡的資料合併成一個交易寫入（一次 fsync 寫很多筆），
+#   截止前全班一起送出時不會變成幾百個各自 fsync、排隊等 SQLite 唯一 writer 的小交易
+# - 觸發條件：累積 MAX_BATCH 筆，或第一筆進來後等了 FLUSH_MS 毫秒（佇列裡已經有的一定一起寫）
+# - 只有一個 writer、依佇列順序寫入；同一批內同一組 (cohort, rater, target) 由 upsert_many 保留最後一筆
+#   → 每組 (rater, target) 仍是最後送出的那筆生效
+# - 開啟時 /peer/batch、/teacher/batch 也排進同一個佇列（submit_many，整批一個項目），
+#   不會越過還在排隊的單筆送出先寫入、又被它蓋掉
+#
+# PA360_WRITE_BEHIND_ACK：
+#   commit（預設）：請求等到所在批次 commit 才回應（200），回應時資料已落地，寫入失敗照樣回 500
+#   queued：放進佇列就回 202，最快；但 commit 前程式當掉會遺失，緊接著的讀取也可能還看不到
+
+ENABLED = os.environ.get("PA360_WRITE_BEHIND", "0") == "1"
+ACK = os.environ.get("PA360_WRITE_BEHIND_ACK", "commit")
+# commit 模式預設不等：寫入中排進來的下一批自然會合併（group commit），閒時不多加延遲；
+# queued 模式沒有人在等，多等一下換更大的批次
+FLUSH_MS = float(os.environ.get("PA360_WRITE_BEHIND_FLUSH_MS", "0" if ACK == "commit" else "20"))
+MAX_BATCH = int(os.environ.get("PA360_WRITE_BEHIND_MAX_BATCH", "500"))
+# 佇列上限；滿了代表寫入跟不上，等 QUEUE_TIMEOUT 秒還放不進去就拒絕（503）
+MAX_QUEUE = int(os.environ.get("PA360_WRITE_BEHIND_MAX_QUEUE", "20000"))
+QUEUE_TIMEOUT = 2.0
+
+if ACK not in ("commit", "queued"):
+    raise ValueError(f"PA360_WRITE_BEHIND_ACK must be 'commit' or 'queued', not {ACK!r}")
+
+
+class QueueFull(Exception):
+    """佇列已滿（寫入跟不上送出的速度）"""
+
+
+class Pending:
+    """排隊中的分數（單筆送出一列、批次送出多列）；wait() 等到寫入完成，寫入失敗時丟出原本的例外"""
+
+    __slots__ = ("kind", "rows", "done", "error")
+
+    def __init__(self, kind: str, rows: list[tuple]):
+        self.kind = kind      # "self" / "peer" / "teacher"
+        self.rows = rows
+        self.done = threading.Event()
+        self.error: BaseException | None = None
+
+    def wait(self, timeout: float | None = None) -> None:
+        if not self.done.wait(timeout):
+            raise TimeoutError("write-behind flush did not finish in time")
+        if self.error is not None:
+            raise self.error
+
+
+class WriteBehindQueue:
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=MAX_QUEUE)
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+        self._closed = False
+        self.flushed = 0      # 已寫入的筆數（含失敗後逐筆重試成功的）
+        self.failed = 0
+
+    # ---- 送出（在請求的 thread 呼叫）----
+
+    def submit(self, kind: str, row: tuple) -> Pending:
+        """
+        kind = "self"：row = (cohort_id, user_id, scores, created_at)
+        kind = "peer" / "teacher"：row = score_store.UpsertRow
+        """
+        return self._submit(Pending(kind, [row]))
+
+    def submit_many(self, kind: str, rows: list[tuple]) -> Pending:
+        """批次送出：整批同一個項目、同一個交易寫入，依序排在之前送出的後面"""
+        return self._submit(Pending(kind, list(rows)))
+
+    def _submit(self, item: Pending) -> Pending:
+        with self._lock:
+            closed = self._closed
+            if not closed and (self._worker is None or not self._worker.is_alive()):
+                self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._worker.start()
+        if closed:
+            # 已經在關閉：直接在呼叫端寫入
+            self._write([item])
+            return item
+        try:
+            self._queue.put(item, timeout=QUEUE_TIMEOUT)
+        except queue.Full:
+            raise QueueFull() from None
+        return item
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, timeout: float = 30) -> None:
+        """停止收件並把佇列裡剩下的全部寫完（關機時呼叫）"""
+        with self._lock:
+            self._closed = True
+            worker, self._worker = self._worker, None
+        if worker is not None and worker.is_alive():
+            self._queue.put(None)
+            worker.join(timeout=timeout)
+            if worker.is_alive():
+                logger.error("write-behind: %d submissions still queued at shutdown", self.depth())
+                return
+        # 跟 close 同時送進來、排在結束記號之後的
+        self._drain()
+
+    # ---- 背景 thread ----
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + FLUSH_MS / 1000
+            while len(batch) < MAX_BATCH:
+                try:
+                    # 先拿已經排隊的；都拿完了才等到 deadline
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stop:
+                break
+        self._drain()
+
+    def _drain(self) -> None:
+        batch: list[Pending] = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= MAX_BATCH:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch: list[Pending]) -> None:
+        BATCH_SIZE.observe(len(batch))
+        try:
+            _flush(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                self._finish(batch, e)
+                return
+            # 整批失敗：逐筆各自一個交易重試，只有真正有問題的那筆回報錯誤
+            logger.warning("write-behind: batch of %d failed, retrying one by one", len(batch), exc_info=True)
+            for item in batch:
+                try:
+                    _flush([item])
+                except Exception as e:
+                    self._finish([item], e)
+                else:
+                    self._finish([item], None)
+            return
+        self._finish(batch, None)
+
+    def _finish(self, batch: list[Pending], error: BaseException | None) -> None:
+        n = sum(len(item.rows) for item in batch)
+        if error is None:
+            self.flushed += n
+        else:
+            self.failed += n
+            if ACK == "queued":
+                logger.error("write-behind: dropped %d submissions: %r", n, error)
+        for item in batch:
+            item.error = error
+            item.done.set()
+
+
+def _flush(batch: list[Pending]) -> None:
+    """一個交易寫完整批：self 逐筆 insert（依序）、peer/teacher 各一次 upsert_many（最後一筆為準）"""
+    upserts: dict[str, list[score_store.UpsertRow]] = {}
+    with score_store.write_session() as conn:
+        for item in batch:
+            if item.kind == "self":
+                for row in item.rows:
+                    score_store.insert_self(conn, *row)
+            else:
+                upserts.setdefault(item.kind, []).extend(item.rows)
+        for kind, rows in upserts.items():
+            score_store.upsert_many(conn, kind, rows)
+
+
+writer = WriteBehindQueue()
+
+BATCH_SIZE = metrics.Histogram(
+    "pa360_write_behind_batch_size", "Submissions written per write-behind transaction.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+metrics.Gauge(
+    "pa360_write_behind_queue_depth", "Score submissions waiting in the write-behind queue.",
+).add_source(lambda: {(): writer.depth()})
+metrics.Counter(
+    "pa360_write_behind_flushed_total", "Score submissions written by the write-behind queue, by result.",
+    ("result",),
+).add_source(lambda: {("ok",): writer.flushed, ("error",): writer.failed})
@@ -0,0 +1,273 @@
+# backend/benchmarks/bench_api.py
+"""
+API 熱門路徑效能測試（in-process，FastAPI TestClient + 合成資料）：
+
+  cd backend
+  python -m benchmarks.bench_api                                   # 10k 學生，和 baseline 比較
+  python -m benchmarks.bench_api --students 100000 --requests 100
+  python -m benchmarks.bench_api --update-baseline                 # 把這次結果存成 baseline
+
+合成資料由 app.datagen 產生在暫存目錄（透過 PA360_DATA_DIR / PA360_DB_PATH 指給 app）：
+N 位學生、--teachers 位老師、k-regular 同儕分派、每人 --self-repeats 筆自評、
+所有分派的同儕評分與一筆老師評分；同一個 --seed 每次資料都一樣
+
+量測每個 endpoint 的 throughput 與延遲百分位（p50/p90/p95/p99），結果寫成 JSON；
+baseline 存在時逐項比較 p50/p95，變慢超過 --tolerance 就以 exit code 1 結束。
+dashboard 彙總（summary / completion）每次請求前都先讓 single-flight 快取失效，量的是實際計算。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BENCH_DIR / "baseline_api.json"
+
+METRICS = ("hp", "atk", "def", "spa", "spd", "spe")
+PASSWORD = "pw"
+
+
+# ---- 量測 ----
+
+def percentile(sorted_ms: list[float], q: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    idx = min(len(sorted_ms) - 1, max(0, round(q / 100 * (len(sorted_ms) - 1))))
+    return sorted_ms[idx]
+
+
+def summarize(latencies_ms: list[float], wall_sec: float, errors: int) -> dict:
+    s = sorted(latencies_ms)
+    return {
+        "requests": len(s),
+        "errors": errors,
+        "throughput_rps": round(len(s) / wall_sec, 1) if wall_sec > 0 else None,
+        "mean_ms": round(statistics.fmean(s), 3) if s else None,
+        **{f"p{q}_ms": round(percentile(s, q), 3) for q in (50, 90, 95, 99)},
+        "max_ms": round(s[-1], 3) if s else None,
+    }
+
+
+def run_case(send: Callable[[int], object], requests: int, warmup: int,
+             before: Callable[[], None] | None = None) -> dict:
+    for i in range(warmup):
+        if before:
+            before()
+        send(i)
+
+    latencies: list[float] = []
+    errors = 0
+    wall = 0.0
+    for i in range(requests):
+        if before:
+            before()
+        t0 = time.perf_counter()
+        resp = send(warmup + i)
+        dt = time.perf_counter() - t0
+        wall += dt
+        latencies.append(dt * 1000)
+        if resp.status_code >= 400:
+            errors += 1
+    return summarize(latencies, wall, errors)
+
+
+def run_benchmarks(args) -> dict:
+    from fastapi.testclient import TestClient
+
+    from app.datagen import student_id, teacher_id
+    from app.main import app
+    from app.services.peer_assignments_csv import get_targets_for_rater
+    from app.services.single_flight import aggregations
+
+    rng = random.Random(args.seed + 1)
+    n, k = args.students, args.peers
+    scores = lambda: {m: rng.randint(1, 10) for m in METRICS}  # noqa: E731
+
+    results: dict[str, dict] = {}
+    with TestClient(app) as c:
+        def login(role: str, uid: str) -> dict:
+            r = c.post("/api/auth/login", json={"role": role, "user_id": uid, "password": PASSWORD})
+            r.raise_for_status()
+            return {"Authorization": "bearer " + r.json()["access_token"]}
+
+        # 先準備每位會用到的學生 token（不計時）
+        sample = [rng.randrange(n) for _ in range(min(n, 200))]
+        student_headers = {i: login("student", student_id(i)) for i in set(sample)}
+        peer_targets = {i: get_targets_for_rater(student_id(i)) for i in set(sample)}
+        teacher = login("teacher", teacher_id(0))
+        master = login("master", "admin")
+
+        def pick(i: int) -> int:
+            return sample[i % len(sample)]
+
+        cases: dict[str, tuple[Callable[[int], object], Callable[[], None] | None]] = {
+            "POST /api/auth/login": (
+                lambda i: c.post("/api/auth/login", json={
+                    "role": "student", "user_id": student_id(pick(i)), "password": PASSWORD}),
+                None,
+            ),
+            "POST /api/scores/self": (
+                lambda i: c.post("/api/scores/self", headers=student_headers[pick(i)],
+                                 json={"scores": scores()}),
+                None,
+            ),
+            "POST /api/scores/peer": (
+                lambda i: c.post("/api/scores/peer", headers=student_headers[pick(i)], json={
+                    "target_user_id": peer_targets[pick(i)][i % k], "scores": scores()}),
+                None,
+            ),
+            "POST /api/scores/teacher": (
+                lambda i: c.post("/api/scores/teacher", headers=teacher, json={
+                    "target_user_id": student_id(pick(i)), "scores": scores()}),
+                None,
+            ),
+            "GET /api/assignments/peers": (
+                lambda i: c.get("/api/assignments/peers", headers=student_headers[pick(i)]),
+                None,
+            ),
+            "GET /api/teacher/completion": (
+                lambda i: c.get("/api/teacher/completion", headers=teacher),
+                aggregations.invalidate,
+            ),
+            "GET /api/master/summary": (
+                lambda i: c.get("/api/master/summary", headers=master),
+                aggregations.invalidate,
+            ),
+            "GET /api/master/match": (
+                lambda i: c.get("/api/master/match", headers=master,
+                                params={"student_id": student_id(pick(i)), "top_k": 3}),
+                aggregations.invalidate,
+            ),
+        }
+
+        for name, (send, before) in cases.items():
+            if args.only and not any(o in name for o in args.only):
+                continue
+            # 每次都重新計算的彙總類只量 1/10，避免一輪跑太久
+            heavy = before is not None
+            requests = max(1, args.requests // 10) if heavy else args.requests
+            warmup = min(args.warmup, 2) if heavy else args.warmup
+            results[name] = run_case(send, requests, warmup, before)
+            r = results[name]
+            print(f"{name:<30} n={r['requests']:>5}  {r['throughput_rps'] or 0:>9,.1f} req/s  "
+                  f"p50 {r['p50_ms']:>9.3f}  p95 {r['p95_ms']:>9.3f}  p99 {r['p99_ms']:>9.3f} ms"
+                  + (f"  errors={r['errors']}" if r["errors"] else ""))
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """回傳變慢超過容忍值的項目說明"""
+    if baseline.get("scale") != results.get("scale"):
+        print("baseline 的資料規模不同，略過比較", file=sys.stderr)
+        return []
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        cur = results["results"].get(name)
+        if cur is None:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if base.get(key) and cur[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {base[key]} -> {cur[key]} ms "
+                                   f"(+{(cur[key] / base[key] - 1) * 100:.0f}%)")
+        if cur["errors"] > base.get("errors", 0):
+            regressions.append(f"{name} errors: {base.get('errors', 0)} -> {cur['errors']}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        prog="python -m benchmarks.bench_api",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    ap.add_argument("--students", type=int, default=10_000)
+    ap.add_argument("--teachers", type=int, default=20)
+    ap.add_argument("--peers", type=int, default=5, help="每位學生要評幾位（k-regular）")
+    ap.add_argument("--self-repeats", type=int, default=2, help="每位學生預先有幾筆自評")
+    ap.add_argument("--catalog-size", type=int, default=151, help="參考名單筆數（預設同 poke.csv）")
+    ap.add_argument("--requests", type=int, default=200, help="每個 endpoint 量測幾次（彙總類為 1/10）")
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--only", nargs="*", help="只跑名稱包含這些字串的 endpoint")
+    ap.add_argument("--out", type=Path, default=None, help="結果 JSON（預設印在最後）")
+    ap.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    ap.add_argument("--tolerance", type=float, default=0.25, help="p50/p95 允許變慢的比例")
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--keep-data", action="store_true", help="保留合成資料的暫存目錄")
+    args = ap.parse_args(argv)
+
+    if args.students <= args.peers:
+        ap.error("--students must be greater than --peers")
+
+    tmp = Path(tempfile.mkdtemp(prefix="pa360-bench-"))
+    # 必須在 import app 之前設定
+    os.environ["PA360_DATA_DIR"] = str(tmp / "data")
+    os.environ["PA360_DB_PATH"] = str(tmp / "app.db")
+    try:
+        from app.datagen import generate
+
+        t0 = time.perf_counter()
+        generate(tmp / "data", args.students, args.teachers, 1, args.peers, args.self_repeats,
+                 fill=1.0, catalog_size=args.catalog_size, catalogs=[], seed=args.seed,
+                 password=PASSWORD, log=lambda msg: None)
+        print(f"dataset: {args.students:,} students, k={args.peers}, "
+              f"{time.perf_counter() - t0:.1f}s ({tmp})")
+
+        results = {
+            "scale": {
+                "students": args.students,
+                "teachers": args.teachers,
+                "peers": args.peers,
+                "self_repeats": args.self_repeats,
+                "catalog_size": args.catalog_size,
+            },
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "requests": args.requests,
+            },
+            "results": run_benchmarks(args),
+        }
+    finally:
+        if not args.keep_data:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.update_baseline:
+        args.baseline.write_text(text + "\n", encoding="utf-8")
+        print(f"baseline updated: {args.baseline}")
+        return 0
+
+    if args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")),
+                              args.tolerance)
+        if regressions:
+            print("REGRESSIONS:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print(f"no regressions vs {args.baseline.name} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# backend/benchmarks/bench_match.py
+"""
+比較 /api/master/match 的兩種做法：
+- legacy：每次讀 poke.csv 成 dict 清單 → Python 迴圈算 dist() → 全部排序
+- engine：MatchEngine（矩陣只載入一次 → 向量化距離 → 部分排序）
+
+用法（在 backend/ 底下）：
+  python -m benchmarks.bench_match
+  python -m benchmarks.bench_match --sizes 150 10000 --repeat 20
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.services.matching import MatchEngine
+from app.services.scoring import METRICS
+from benchmarks.legacy_match import dist, load_pokemon
+
+
+def write_catalog(path: Path, n: int, seed: int) -> None:
+    rng = random.Random(seed)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["poke_num", "poke_name", *METRICS])
+        for i in range(1, n + 1):
+            w.writerow([i, f"poke{i}", *(rng.randint(1, 10) for _ in METRICS)])
+
+
+def legacy_match(path: Path, base: dict, top_k: int, method: str) -> list[dict]:
+    pokes = load_pokemon(path)
+    scored = []
+    for p in pokes:
+        d = dist(base, p["stats"], method)
+        scored.append({"poke_num": p["poke_num"], "distance": round(float(d), 4)})
+    scored.sort(key=lambda x: (x["distance"], x["poke_num"]))
+    return scored[:top_k]
+
+
+def timed(fn, repeat: int) -> list[float]:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def fmt(ms: list[float]) -> str:
+    return f"median {statistics.median(ms):9.2f} ms  min {min(ms):9.2f} ms"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[150, 10_000, 1_000_000])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--top-k", type=int, default=3)
+    ap.add_argument("--method", default="euclidean")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    base = {m: round(rng.uniform(1, 10), 2) for m in METRICS}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            path = Path(tmp) / f"catalog_{n}.csv"
+            write_catalog(path, n, args.seed)
+
+            engine = MatchEngine(path)
+
+            t0 = time.perf_counter()
+            engine.catalog()
+            load_ms = (time.perf_counter() - t0) * 1000
+
+            # 大型 catalog 的 legacy 迴圈很慢，只跑一次
+            legacy_repeat = args.repeat if n <= 100_000 else 1
+            legacy = timed(lambda: legacy_match(path, base, args.top_k, args.method), legacy_repeat)
+            fast = timed(lambda: engine.top_k(base, args.top_k, args.method), args.repeat)
+
+            same = (
+                [r["poke_num"] for r in legacy_match(path, base, args.top_k, args.method)]
+                == [r["poke_num"] for r in engine.top_k(base, args.top_k, args.method)]
+            ) if n <= 100_000 else None
+
+            print(f"n={n:>9,}  load(once) {load_ms:9.2f} ms")
+            print(f"  legacy  {fmt(legacy)}")
+            print(f"  engine  {fmt(fast)}  speedup x{statistics.median(legacy) / statistics.median(fast):,.1f}"
+                  + ("" if same is None else f"  same_top_k={same}"))
+
+
+if __name__ == "__main__":
+    main()
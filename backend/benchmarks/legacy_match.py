@@ -0,0 +1,61 @@
+# backend/benchmarks/legacy_match.py
+"""
+舊版 /api/master/match 用的 poke.csv 讀取與距離計算（比對已改用 MatchEngine），
+只留給 bench_match 當對照組
+"""
+from __future__ import annotations
+
+import csv
+import math
+import re
+from pathlib import Path
+
+from app.services.scoring import METRICS
+
+
+def load_pokemon(path: Path) -> list[dict]:
+    """逐列 dict 版本的 poke.csv 讀取"""
+    pokes: list[dict] = []
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        required = {"poke_num", "poke_name", *METRICS}
+        if not reader.fieldnames or not required.issubset(set(reader.fieldnames)):
+            raise ValueError(f"POKE_CSV_BAD_COLUMNS: {reader.fieldnames}")
+
+        for row in reader:
+            try:
+                poke_num = int(row["poke_num"])
+                poke_name = str(row["poke_name"])
+                stats = {m: float(row[m]) for m in METRICS}
+            except Exception:
+                continue
+
+            pokes.append({
+                "poke_num": poke_num,
+                "poke_name": poke_name,
+                "stats": stats,
+            })
+
+    return pokes
+
+
+def dist(a: dict, b: dict, method: str) -> float:
+    if method == "manhattan":
+        return sum(abs(a[m] - b[m]) for m in METRICS)
+    # default euclidean
+    return math.sqrt(sum((a[m] - b[m]) ** 2 for m in METRICS))
+
+
+def to_pokemon_com_slug(name: str) -> str:
+    """
+    把 poke_name 轉成 pokemon.com 的 pokedex slug（多數英文名可用）
+    例: "Pikachu" -> "pikachu"
+        "Mr. Mime" -> "mr-mime"（點號會被移除、空白變連字號）
+        "Farfetch'd" -> "farfetchd"（撇號移除）
+    """
+    s = (name or "").strip().lower()
+    s = s.replace("♀", "-f").replace("♂", "-m")  # 少見但安全處理
+    s = re.sub(r"\s+", "-", s)                   # 空白 -> -
+    s = re.sub(r"[^a-z0-9-]", "", s)             # 移除其他符號（' . 等）
+    s = re.sub(r"-{2,}", "-", s).strip("-")      # 多個 - 合併、去頭尾
+    return s
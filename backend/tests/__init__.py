@@ -0,0 +1,8 @@
+# backend/tests/__init__.py
+# 執行（在 backend/ 底下）：python -m unittest discover -s tests -t .
+# 測試一律用暫存資料庫：要在 import app 之前設定 PA360_DB_PATH
+import os
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="pa360-test-")
+os.environ["PA360_DB_PATH"] = os.path.join(_TMP_DIR, "app.db")
@@ -0,0 +1,41 @@
+# backend/tests/test_assign_peers.py
+from __future__ import annotations
+
+import contextlib
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.assign_peers import main, read_assignments
+
+
+class RegenerateCohortTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        self.users = self.dir / "users.csv"
+        lines = ["user_id,role,cohort_id"]
+        lines += [f"a{i},student,A" for i in range(6)]
+        lines += [f"b{i},student,B" for i in range(6)]
+        self.users.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        self.out = self.dir / "peer_assignments.csv"
+
+    def _run(self, *argv: str) -> int:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return main(["--users", str(self.users), "--out", str(self.out), *argv])
+
+    def test_cohort_run_keeps_other_cohorts(self):
+        self.assertEqual(self._run("-k", "2", "--seed", "1"), 0)
+        before = read_assignments(self.out)
+
+        self.assertEqual(self._run("-k", "3", "--seed", "2", "--cohort", "A", "--force"), 0)
+        after = read_assignments(self.out)
+
+        self.assertEqual(after["B"], before["B"])
+        self.assertEqual(len(after["A"]), 6 * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+# backend/tests/test_data_version.py
+from __future__ import annotations
+
+import sqlite3
+import unittest
+
+from app import db
+from app.services import data_version
+from app.services.single_flight import aggregations
+
+
+class ExternalWriteTest(unittest.TestCase):
+    def test_write_from_another_connection_changes_version(self):
+        db.init_db()
+        before = data_version.current()
+        cached = aggregations.do(("test_data_version",), lambda: object())
+
+        # 模擬另一個 worker / db_import：不經過這個行程的 publish
+        other = sqlite3.connect(db.DB_PATH)
+        try:
+            data_version.bump(other)
+            other.commit()
+        finally:
+            other.close()
+
+        self.assertEqual(data_version.current(), before + 1)
+        self.assertEqual(data_version.last_seen(), before + 1)
+        # 彙總快取也要失效，新 ETag 才不會配上舊內容
+        self.assertIsNot(aggregations.do(("test_data_version",), lambda: object()), cached)
+
+
+if __name__ == "__main__":
+    unittest.main()
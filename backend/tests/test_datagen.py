@@ -0,0 +1,42 @@
+# backend/tests/test_datagen.py
+from __future__ import annotations
+
+import contextlib
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from app import datagen, db
+
+
+class WriteScoresFailureTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.out = Path(tmp.name)
+        self.addCleanup(setattr, db, "DB_PATH", db.DB_PATH)
+        self.addCleanup(db.close_pools)
+
+    def _main(self) -> int:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return datagen.main([str(self.out), "--students", "50", "--batch-size", "20"])
+
+    def test_failure_partway_leaves_no_db(self):
+        def broken(*args, **kwargs):
+            yield [("default", "S0000000", "S0000001", "t", 5, 5, 5, 5, 5, 5)]
+            raise RuntimeError("disk full")
+
+        with mock.patch.object(datagen, "iter_peer_rows", broken):
+            with self.assertRaisesRegex(RuntimeError, "disk full"):
+                self._main()
+        self.assertFalse((self.out / "app.db").exists())
+
+    def test_success_writes_db(self):
+        self.assertEqual(self._main(), 0)
+        self.assertTrue((self.out / "app.db").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
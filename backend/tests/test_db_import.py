@@ -0,0 +1,60 @@
+# backend/tests/test_db_import.py
+from __future__ import annotations
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from app import db
+from app.db_import import import_file
+
+
+def _peer(rater: str, target: str) -> str:
+    return json.dumps({"rater_user_id": rater, "target_user_id": target,
+                       "hp": 5, "atk": 5, "def": 5, "spa": 5, "spd": 5, "spe": 5})
+
+
+class ImportFileTest(unittest.TestCase):
+    def _write(self, lines: list[str]) -> Path:
+        f = tempfile.NamedTemporaryFile("w", suffix=".ndjson", delete=False, encoding="utf-8")
+        with f:
+            f.write("\n".join(lines) + "\n")
+        self.addCleanup(Path(f.name).unlink)
+        return Path(f.name)
+
+    def _state(self) -> tuple:
+        db.init_db()
+        conn = db.get_conn(readonly=True)
+        try:
+            return (
+                conn.execute("SELECT COUNT(*) FROM scores_peer").fetchone()[0],
+                conn.execute("SELECT COUNT(*) FROM rater_stats").fetchone()[0],
+                conn.execute("SELECT version FROM data_version").fetchone()[0],
+                conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'ux_scores_peer_rater_target'")
+                .fetchone()[0],
+            )
+        finally:
+            conn.close()
+
+    def test_bad_row_partway_commits_nothing(self):
+        # 前兩批（batch_size=2）已經 executemany 過，第 5 行才是壞掉的 JSON
+        path = self._write([_peer("imp-a", "imp-b"), _peer("imp-a", "imp-c"),
+                            _peer("imp-b", "imp-a"), _peer("imp-b", "imp-c"),
+                            '{"rater_user_id": "imp-c", "target_user_id":'])
+        before = self._state()
+        with self.assertRaises(ValueError):
+            import_file(path, "peer", "ndjson", batch_size=2, log=lambda *_: None)
+        self.assertEqual(self._state(), before)
+
+    def test_successful_import_commits(self):
+        path = self._write([_peer("imp-x", "imp-y"), _peer("imp-y", "imp-x"), _peer("imp-x", "imp-y")])
+        peers, raters, version, index = self._state()
+        result = import_file(path, "peer", "ndjson", batch_size=2, log=lambda *_: None)
+        self.assertEqual(result["inserted"], 3)
+        # 同一對保留最後一筆
+        self.assertEqual(self._state(), (peers + 2, raters + 2, version + 1, index))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+# backend/tests/test_nn_index.py
+from __future__ import annotations
+
+import unittest
+
+from app.services.nn_index import parse_metric
+
+
+class ParseMetricTest(unittest.TestCase):
+    def test_non_numeric_weights_use_error_code(self):
+        for weights in (["1", "a", "1", "1", "1", "1"], ["1", None, "1", "1", "1", "1"], ["1"] * 5):
+            with self.assertRaisesRegex(ValueError, "^BAD_METRIC_WEIGHTS$"):
+                parse_metric("minkowski", 3, weights)
+
+    def test_non_numeric_p_uses_error_code(self):
+        with self.assertRaisesRegex(ValueError, "^BAD_MINKOWSKI_P$"):
+            parse_metric("minkowski", "x")
+
+    def test_valid_weights(self):
+        m = parse_metric("minkowski", 3, ["1", "2", "1", "1", "1", "0.5"])
+        self.assertEqual(m.weights, (1.0, 2.0, 1.0, 1.0, 1.0, 0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# backend/tests/test_rater_stats.py
+from __future__ import annotations
+
+import random
+import unittest
+
+from app import db
+from app.services import rater_stats, score_store
+from app.services.scoring import METRICS
+
+COHORT = "t-norm"
+
+
+class PeerNormSumsTest(unittest.TestCase):
+    def test_incremental_sums_match_rebuild(self):
+        db.init_db()
+        rng = random.Random(360)
+        students = [f"norm-{i}" for i in range(12)]
+
+        def scores() -> dict:
+            return {m: rng.randint(1, 10) for m in METRICS}
+
+        # 單筆與批次交錯寫入，含覆寫與 rater 從 1 筆跨過 MIN_RATER_COUNT 的情況
+        for step in range(60):
+            rater, target = rng.sample(students, 2)
+            with score_store.write_session() as conn:
+                if step % 3:
+                    score_store.upsert(conn, "peer", COHORT, rater, target, scores(), "t")
+                else:
+                    rows = [(COHORT, rater, t, scores(), "t") for t in rng.sample(students, 4) if t != rater]
+                    score_store.upsert_many(conn, "peer", rows)
+
+        conn = db.get_conn()
+        try:
+            self.assertEqual(rater_stats.check(conn), [])
+            incremental = rater_stats.compute_normalized(conn, COHORT)
+            rater_stats.rebuild(conn)
+            conn.commit()
+            rebuilt = rater_stats.compute_normalized(conn, COHORT)
+        finally:
+            conn.close()
+
+        self.assertEqual(incremental.keys(), rebuilt.keys())
+        for uid, avg in rebuilt.items():
+            for m in METRICS:
+                self.assertAlmostEqual(incremental[uid][m], avg[m], places=6)
+
+    def test_with_peer_avg_flags_fallback(self):
+        item = {"user_id": "x", "complete": False, "peer_avg": {m: 5.0 for m in METRICS}}
+        self.assertFalse(rater_stats.with_peer_avg(item, None)["peer_normalized"])
+        self.assertTrue(rater_stats.with_peer_avg(item, {m: 6.0 for m in METRICS})["peer_normalized"])
+
+
+if __name__ == "__main__":
+    unittest.main()
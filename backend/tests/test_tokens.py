@@ -0,0 +1,43 @@
+# backend/tests/test_tokens.py
+from __future__ import annotations
+
+import unittest
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import tokens
+from app.services.tokens import TokenError
+
+
+class VerifyTest(unittest.TestCase):
+    def test_non_ascii_token_is_invalid(self):
+        token, _ = tokens.issue("student", "s1")
+        for bad in (token + "é", "v1.é.x", token[:-2] + "中文"):
+            with self.assertRaises(TokenError) as cm:
+                tokens.verify(bad)
+            self.assertEqual(cm.exception.args[0], "INVALID_TOKEN")
+
+    def test_revoke_user_keeps_tokens_issued_afterwards(self):
+        old, _ = tokens.issue("student", "s-revoke")
+        tokens.verify(old)
+        tokens.revoke_user("student", "s-revoke")
+        # 撤銷後馬上重新登入（同一秒內）
+        new, _ = tokens.issue("student", "s-revoke")
+        self.assertEqual(tokens.verify(new)["sub"], "s-revoke")
+        with self.assertRaises(TokenError) as cm:
+            tokens.verify(old)
+        self.assertEqual(cm.exception.args[0], "TOKEN_REVOKED")
+
+
+class AuthHeaderTest(unittest.TestCase):
+    def test_non_ascii_bearer_is_401(self):
+        token, _ = tokens.issue("student", "s1")
+        with TestClient(app) as client:
+            r = client.get("/api/auth/me", headers={"Authorization": f"bearer {token}é".encode("utf-8")})
+        self.assertEqual(r.status_code, 401)
+        self.assertEqual(r.json()["detail"]["error"], "INVALID_TOKEN")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+# backend/tests/test_write_behind.py
+from __future__ import annotations
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.db import db_read_session
+from app.main import app
+from app.services import tokens, write_behind
+from app.services.peer_assignments_csv import load_peer_assignments
+from app.services.users_csv import DEFAULT_COHORT
+
+
+def _scores(v: int) -> dict:
+    return {m: v for m in ("hp", "atk", "def", "spa", "spd", "spe")}
+
+
+class QueuedThenBatchTest(unittest.TestCase):
+    def test_batch_after_queued_peer_wins(self):
+        rater, targets = next(iter(load_peer_assignments(DEFAULT_COHORT).items()))
+        target = targets[0]
+        token, _ = tokens.issue("student", rater)
+        headers = {"Authorization": f"bearer {token}"}
+
+        # 第一次寫入先卡住：單筆送出還在佇列裡時送出批次
+        gate = threading.Event()
+        real_flush = write_behind._flush
+
+        def slow_flush(batch):
+            gate.wait(5)
+            real_flush(batch)
+
+        # 新的佇列：其他測試的 TestClient 結束時會 close() 模組層的 writer
+        with mock.patch.object(write_behind, "ENABLED", True), \
+                mock.patch.object(write_behind, "ACK", "queued"), \
+                mock.patch.object(write_behind, "writer", write_behind.WriteBehindQueue()), \
+                mock.patch.object(write_behind, "_flush", slow_flush), \
+                TestClient(app) as client:
+            r = client.post("/api/scores/peer", headers=headers,
+                            json={"target_user_id": target, "scores": _scores(3)})
+            self.assertEqual(r.status_code, 202)
+
+            batch: dict = {}
+            t = threading.Thread(target=lambda: batch.update(r=client.post(
+                "/api/scores/peer/batch", headers=headers,
+                json={"items": [{"target_user_id": target, "scores": _scores(9)}]},
+            )))
+            t.start()
+            time.sleep(0.2)
+            gate.set()
+            t.join(10)
+            self.assertEqual(batch["r"].status_code, 200)
+            self.assertEqual(batch["r"].json()["accepted"], 1)
+
+        with db_read_session() as conn:
+            hp = conn.execute(
+                "SELECT hp FROM scores_peer WHERE cohort_id = ? AND rater_user_id = ? AND target_user_id = ?",
+                (DEFAULT_COHORT, rater, target),
+            ).fetchone()["hp"]
+        self.assertEqual(hp, 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
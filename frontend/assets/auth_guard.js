@@ -46,6 +46,16 @@ async function requireAuth(allowedRoles = []) {
 }
 
 function logout() {
+  // 通知後端撤銷這個 token（不等回應）
+  const tokenType = localStorage.getItem("token_type") || "bearer";
+  const token = localStorage.getItem("access_token");
+  if (token) {
+    fetch("/api/auth/logout", {
+      method: "POST",
+      headers: { "Authorization": `${tokenType} ${token}` },
+      keepalive: true,
+    }).catch(() => {});
+  }
   localStorage.clear();
   window.location.href = "/login.html";
 }